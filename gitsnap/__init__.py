@@ -0,0 +1 @@
+"""GitSnap: entry point a riga di comando (python -m gitsnap); i moduli applicativi sono in src/."""
@@ -0,0 +1,13 @@
+"""python -m gitsnap ...: CLI headless (vedi src/cli.py), senza avviare Streamlit."""
+
+import sys
+from pathlib import Path
+
+_SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(_SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(_SRC_DIR))
+
+from cli import main  # noqa: E402
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Benchmark end-to-end di GitSnap contro il server finto (scripts/mock_ado_server.py).
+Per ogni dimensione (numero di repo) avvia il server in un sottoprocesso, esegue il confronto completo
+come la dashboard (RefSnapshot + iter_compare_repos) e riporta tempo, richieste HTTP e picco di memoria.
+
+Eseguire dalla root:
+    python scripts/benchmark.py                      # 10, 100, 1000 repo, develop vs prod-*
+    python scripts/benchmark.py --sizes 100 --latency-ms 50 --quick --json bench.json
+    python scripts/benchmark.py --sizes 1000 --async --max-in-flight 128   # client asincrono (httpx)
+    python scripts/benchmark.py --sizes 100 --tls                           # HTTPS: handshake e riuso connessioni
+"""
+import argparse
+import asyncio
+import json
+import re
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+from typing import Optional, Union
+
+ROOT = Path(__file__).resolve().parent.parent
+MOCK_SERVER = ROOT / "scripts" / "mock_ado_server.py"
+sys.path.insert(0, str(ROOT / "src"))
+
+from api_versions import ApiVersionMap  # noqa: E402
+from async_client import AsyncAzureDevOpsClient  # noqa: E402
+from async_service import iter_compare_repos_async  # noqa: E402
+from azure_devops_client import AzureDevOpsClient  # noqa: E402
+from commit_cache import CommitCache  # noqa: E402
+from diff_service import (  # noqa: E402
+    DEFAULT_MAX_WORKERS,
+    STATUS_ALIGNED,
+    STATUS_DIVERGENT,
+    STRATEGY_BRANCH_STATS,
+    STRATEGY_DIFF,
+    iter_compare_repos,
+)
+from ref_resolver import REF_TYPE_BRANCH, REF_TYPE_COMMIT, REF_TYPE_TAG_PATTERN, RefSnapshot  # noqa: E402
+from request_scheduler import DEFAULT_ASYNC_MAX_IN_FLIGHT  # noqa: E402
+
+REF_TYPE_CHOICES = [REF_TYPE_BRANCH, REF_TYPE_TAG_PATTERN, REF_TYPE_COMMIT]
+
+
+def _start_mock(args: argparse.Namespace, repos: int) -> tuple[subprocess.Popen, str]:
+    cmd = [
+        sys.executable, str(MOCK_SERVER), "--port", "0",
+        "--repos", str(repos),
+        "--tags", str(args.tags),
+        "--divergence", str(args.divergence),
+        "--divergent-ratio", str(args.divergent_ratio),
+        "--files-per-commit", str(args.files_per_commit),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--throttle-rate", str(args.throttle_rate),
+    ]
+    if args.tls:
+        cmd.append("--tls")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    match = re.search(r"https?://[\d.]+:\d+", line)
+    if not match:
+        proc.kill()
+        raise RuntimeError(f"Avvio mock server fallito: {line!r}")
+    cert = re.search(r"certificato=(\S+)", line)
+    # Il certificato autofirmato del server finto è l'unica CA accettata dal client
+    args.verify = cert.group(1) if cert else True
+    return proc, match.group(0)
+
+
+def _mock_call(base_url: str, path: str, method: str = "GET", verify: Union[bool, str] = True) -> dict:
+    req = urllib.request.Request(f"{base_url}{path}", method=method, data=b"" if method == "POST" else None)
+    context = ssl.create_default_context(cafile=verify) if isinstance(verify, str) else None
+    with urllib.request.urlopen(req, timeout=10, context=context) as resp:
+        return json.loads(resp.read())
+
+
+def _compare_sync(args: argparse.Namespace, base_url: str, cache: Optional[CommitCache], on_result) -> dict:
+    client = AzureDevOpsClient(
+        organization="mock",
+        project="bench",
+        pat="benchmark",
+        base_url=base_url,
+        cache=cache,
+        api_versions=ApiVersionMap(),
+        max_in_flight=args.max_workers,
+        verify=args.verify,
+    )
+    repos = client.list_repositories()
+    for _, res in iter_compare_repos(
+        client,
+        repos,
+        args.source_type,
+        args.source,
+        args.target_type,
+        args.target,
+        snapshot=RefSnapshot(client),
+        max_workers=args.max_workers,
+        quick=args.quick,
+        strategy=STRATEGY_BRANCH_STATS if args.quick else STRATEGY_DIFF,
+    ):
+        on_result(res)
+    transport = client.transport.snapshot()
+    return {"repos": len(repos), "connections": transport["connections_opened"], "reuse": transport["reuse_ratio"]}
+
+
+async def _compare_async(args: argparse.Namespace, base_url: str, cache: Optional[CommitCache], on_result) -> dict:
+    async with AsyncAzureDevOpsClient(
+        organization="mock",
+        project="bench",
+        pat="benchmark",
+        base_url=base_url,
+        cache=cache,
+        api_versions=ApiVersionMap(),
+        max_in_flight=args.max_in_flight,
+        verify=args.verify,
+        http2=args.http2,
+    ) as client:
+        repos = await client.list_repositories()
+        async for _, res in iter_compare_repos_async(
+            client, repos, args.source_type, args.source, args.target_type, args.target, quick=args.quick,
+        ):
+            on_result(res)
+        return {"repos": len(repos), "http_versions": dict(client.http_versions)}
+
+
+def run_once(args: argparse.Namespace, base_url: str, cache: Optional[CommitCache]) -> dict:
+    """Un confronto completo: list_repositories + risoluzione ref + confronto di ogni repo."""
+    _mock_call(base_url, "/_mock/reset", "POST", verify=args.verify)
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    first_result = None
+    tally = {STATUS_ALIGNED: 0, STATUS_DIVERGENT: 0}
+    errors = 0
+
+    def _on_result(res: dict) -> None:
+        nonlocal first_result, errors
+        if first_result is None:
+            first_result = time.perf_counter() - start
+        if res.get("status") in tally:
+            tally[res["status"]] += 1
+        else:
+            errors += 1
+
+    if args.use_async:
+        transport = asyncio.run(_compare_async(args, base_url, cache, _on_result))
+    else:
+        transport = _compare_sync(args, base_url, cache, _on_result)
+    repo_count = transport.pop("repos")
+    wall = time.perf_counter() - start
+    peak = 0
+    if args.tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    server_stats = _mock_call(base_url, "/_mock/stats", verify=args.verify)
+    return {
+        "repos": repo_count,
+        "wall_sec": round(wall, 3),
+        "first_result_sec": round(first_result or 0.0, 3),
+        "requests": server_stats["requests"],
+        "requests_per_repo": round(server_stats["requests"] / repo_count, 2) if repo_count else 0,
+        "by_endpoint": server_stats["by_endpoint"],
+        "bytes_received": server_stats["bytes_sent"],
+        "throttled": server_stats["throttled"],
+        "peak_mem_mb": round(peak / (1024 * 1024), 2),
+        "aligned": tally[STATUS_ALIGNED],
+        "divergent": tally[STATUS_DIVERGENT],
+        "errors": errors,
+        **transport,
+    }
+
+
+def run_size(args: argparse.Namespace, repos: int) -> list[dict]:
+    proc, base_url = _start_mock(args, repos)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = CommitCache(Path(tmp) / "cache.sqlite") if args.cache else None
+            runs = []
+            for run in range(1, args.runs + 1):
+                result = run_once(args, base_url, cache)
+                result["run"] = run
+                runs.append(result)
+                _print_row(result)
+            if cache is not None:
+                cache.close()
+            return runs
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+_COLUMNS = [
+    ("repos", 6), ("run", 4), ("wall_sec", 9), ("first_result_sec", 9), ("requests", 9),
+    ("requests_per_repo", 8), ("connections", 6), ("reuse", 6), ("peak_mem_mb", 9), ("aligned", 8), ("divergent", 9), ("errors", 6),
+]
+
+
+def _print_header() -> None:
+    print(" ".join(name[:w].rjust(w) for name, w in _COLUMNS))
+
+
+def _print_row(result: dict) -> None:
+    print(" ".join(str(result.get(name, "")).rjust(w) for name, w in _COLUMNS), flush=True)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end di GitSnap su server Azure DevOps finto.")
+    parser.add_argument("--sizes", default="10,100,1000", help="numeri di repo separati da virgola")
+    parser.add_argument("--runs", type=int, default=1, help="esecuzioni per dimensione (la 2a misura le cache)")
+    parser.add_argument("--source-type", choices=REF_TYPE_CHOICES, default=REF_TYPE_BRANCH)
+    parser.add_argument("--source", default="develop")
+    parser.add_argument("--target-type", choices=REF_TYPE_CHOICES, default=REF_TYPE_TAG_PATTERN)
+    parser.add_argument("--target", default="prod-*")
+    parser.add_argument("--quick", action="store_true", help="modalità rapida (come il checkbox della dashboard)")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="client asincrono (AsyncAzureDevOpsClient, richiede httpx) invece dei thread")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_ASYNC_MAX_IN_FLIGHT,
+                        help="con --async: richieste contemporanee")
+    parser.add_argument("--http2", action="store_true",
+                        help="con --async: HTTP/2 se il server lo negozia (richiede h2; il server finto resta HTTP/1.1)")
+    parser.add_argument("--cache", action="store_true", help="usa una CommitCache temporanea (condivisa tra i run)")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="non misurare la memoria (tracemalloc rallenta l'esecuzione)")
+    parser.add_argument("--json", metavar="FILE", help="salva i risultati in un file JSON")
+    mock = parser.add_argument_group("server finto")
+    mock.add_argument("--tags", type=int, default=20)
+    mock.add_argument("--divergence", type=int, default=5)
+    mock.add_argument("--divergent-ratio", type=float, default=0.5)
+    mock.add_argument("--files-per-commit", type=int, default=3)
+    mock.add_argument("--latency-ms", type=float, default=20.0)
+    mock.add_argument("--jitter-ms", type=float, default=10.0)
+    mock.add_argument("--throttle-rate", type=float, default=0.0)
+    mock.add_argument("--tls", action="store_true", help="HTTPS con certificato autofirmato (richiede openssl)")
+    return parser
+
+
+def main(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    print(
+        f"SOURCE {args.source_type}:{args.source}  TARGET {args.target_type}:{args.target}  "
+        f"quick={args.quick} "
+        + (f"async in-flight={args.max_in_flight}" if args.use_async else f"workers={args.max_workers}")
+        + f" latency={args.latency_ms}+{args.jitter_ms}ms"
+    )
+    _print_header()
+    results = []
+    for repos in sizes:
+        results.extend(run_size(args, repos))
+    if args.json:
+        report = {"settings": {k: v for k, v in vars(args).items() if k != "json"}, "results": results}
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Risultati salvati in {args.json}")
+
+
+if __name__ == "__main__":
+    main()
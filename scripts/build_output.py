@@ -12,6 +12,7 @@ OUTPUT_APP = OUTPUT_ROOT / APP_NAME
 
 INCLUDE = [
     "src",
+    "gitsnap",
     "data",
     "requirements.txt",
     "README.md",
@@ -0,0 +1,528 @@
+"""
+Server Azure DevOps finto (solo stdlib) per benchmark e prove in locale, senza PAT né rete.
+Implementa gli endpoint usati da GitSnap: git/repositories, refs, commits, commitsbatch,
+diffs/commits, annotatedtags, stats/branches, pushes. Dati sintetici e deterministici:
+- ogni repo ha una storia lineare; main punta all'ultimo tag, develop è avanti di --divergence commit
+  (solo nei repo divergenti, frazione --divergent-ratio), ogni commit modifica --files-per-commit file;
+- --tags tag prod-NNN su main (uno ogni TAG_SPACING commit; i pari sono annotati);
+- latenza per richiesta configurabile (--latency-ms, --jitter-ms) e 429 casuali (--throttle-rate).
+
+Eseguire dalla root: python scripts/mock_ado_server.py --repos 100 --latency-ms 30
+Poi in GitSnap: base_url http://127.0.0.1:8090, organization "mock", project "bench", PAT qualsiasi.
+Contatori richieste: GET /_mock/stats, azzeramento: POST /_mock/reset.
+Push simulato (develop avanza di un commit): POST /_mock/push?repo=<indice|id|nome>&count=1.
+TLS (per misurare handshake e riuso delle connessioni): --tls genera un certificato autofirmato per l'host
+(serve il comando openssl), oppure --certfile/--keyfile; il client lo accetta con verify=<certificato>.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_PORT = 8090
+PROJECT_ID = "6ce954b1-ce1f-45d1-b94d-e6bf2464ba2c"
+TAG_SPACING = 2
+BASE_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+_API_PATH = re.compile(r"^/[^/]+/[^/]+/_apis/git/repositories(?:/(?P<repo>[^/]+)(?:/(?P<rest>.*))?)?$")
+
+
+def _sha(*parts) -> str:
+    return hashlib.sha1(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def _repo_id(index: int) -> str:
+    return f"{index:08x}-0000-4000-8000-{index:012x}"
+
+
+class MockData:
+    """Modello sintetico dei repository; ogni repo viene costruito alla prima richiesta."""
+
+    def __init__(self, repos: int, tags: int, divergence: int, divergent_ratio: float, files_per_commit: int):
+        self.repos = repos
+        self.tags = tags
+        self.divergence = divergence
+        self.divergent_ratio = divergent_ratio
+        self.files_per_commit = files_per_commit
+        self.repo_index = {_repo_id(i): i for i in range(repos)}
+        self._lock = threading.Lock()
+        self._models: dict[int, dict] = {}
+        # Push simulati per repo: data di ogni push dopo quello iniziale
+        self._pushes: dict[int, list[datetime]] = {}
+
+    def repo_model(self, index: int) -> dict:
+        with self._lock:
+            model = self._models.get(index)
+            if model is None:
+                model = self._models[index] = self._build_repo(index)
+            return model
+
+    def simulate_push(self, index: int, count: int = 1) -> None:
+        """count push su develop (un commit ciascuno); il modello del repo viene ricostruito."""
+        with self._lock:
+            now = datetime.now(timezone.utc)
+            self._pushes.setdefault(index, []).extend([now] * max(1, count))
+            self._models.pop(index, None)
+
+    def pushes(self, index: int) -> list[dict]:
+        """Push del repo dal più recente: quello iniziale (storia sintetica) più quelli simulati."""
+        model = self.repo_model(index)
+        with self._lock:
+            dates = [BASE_DATE + timedelta(hours=model["heads"]["develop"])] + self._pushes.get(index, [])
+        return [
+            {
+                "pushId": n + 1,
+                "date": date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "pushedBy": {"displayName": f"Dev {n % 7}"},
+            }
+            for n, date in reversed(list(enumerate(dates)))
+        ]
+
+    def repositories(self) -> list[dict]:
+        return [
+            {
+                "id": _repo_id(i),
+                "name": f"repo-{i:04d}",
+                "defaultBranch": "refs/heads/main",
+                "project": {"id": PROJECT_ID, "name": "bench"},
+            }
+            for i in range(self.repos)
+        ]
+
+    def find_repo(self, key: str) -> Optional[int]:
+        """Indice del repo da id, nome (repo-NNNN) o indice numerico."""
+        if key in self.repo_index:
+            return self.repo_index[key]
+        if key.isdigit() and int(key) < self.repos:
+            return int(key)
+        return next((i for i in range(self.repos) if f"repo-{i:04d}" == key), None)
+
+    def is_divergent(self, index: int) -> bool:
+        # Distribuzione uniforme e deterministica dei repo divergenti
+        return int((index + 1) * self.divergent_ratio) > int(index * self.divergent_ratio)
+
+    def _build_repo(self, index: int) -> dict:
+        main = max(1, self.tags) * TAG_SPACING
+        develop = main + (self.divergence if self.is_divergent(index) else 0) + len(self._pushes.get(index, []))
+        shas = [_sha(index, n) for n in range(develop + 1)]
+        tags = []
+        for k in range(self.tags):
+            commit = shas[(k + 1) * TAG_SPACING]
+            annotated = k % 2 == 0
+            tags.append({
+                "name": f"prod-{k:03d}",
+                "commit_index": (k + 1) * TAG_SPACING,
+                "objectId": _sha(index, "tag", k) if annotated else commit,
+                "annotated": annotated,
+            })
+        return {
+            "shas": shas,
+            "by_sha": {s: n for n, s in enumerate(shas)},
+            "heads": {"main": main, "develop": develop},
+            "tags": tags,
+            "tags_by_name": {t["name"]: t for t in tags},
+            "tags_by_object": {t["objectId"]: t for t in tags if t["annotated"]},
+        }
+
+    def commit(self, index: int, n: int) -> dict:
+        model = self.repo_model(index)
+        date = (BASE_DATE + timedelta(hours=n)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        person = {"name": f"Dev {n % 7}", "email": f"dev{n % 7}@example.com", "date": date}
+        return {
+            "commitId": model["shas"][n],
+            "comment": f"Change {n} in repo-{index:04d}",
+            "author": person,
+            "committer": person,
+            "changeCounts": {"Edit": self.files_per_commit if n else 0},
+        }
+
+    def resolve(self, index: int, version: str, version_type: str) -> int:
+        """Indice del commit puntato da (version, versionType); KeyError se non esiste."""
+        model = self.repo_model(index)
+        version_type = (version_type or "branch").lower()
+        if version_type == "commit":
+            return model["by_sha"][version.lower()]
+        if version_type == "tag":
+            return model["tags_by_name"][version]["commit_index"]
+        return model["heads"][version[len("refs/heads/"):] if version.startswith("refs/heads/") else version]
+
+    def file_path(self, n: int, k: int) -> str:
+        return f"/src/mod{n % 20}/file_{n}_{k}.txt"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Header e body sono scritti separatamente: senza TCP_NODELAY ogni risposta keep-alive paga ~40 ms di delayed ACK
+    disable_nagle_algorithm = True
+    server: "MockServer"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            sys.stderr.write("%s - %s\n" % (self.address_string(), fmt % args))
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _send(self, status: int, payload, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count_bytes(len(body))
+
+    def _not_found(self, message: str) -> None:
+        self._send(404, {"message": message, "typeKey": "GitItemNotFoundException"})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _dispatch(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        if path == "/_mock/stats":
+            return self._send(200, self.server.stats())
+        if path == "/_mock/reset" and method == "POST":
+            self.server.reset_stats()
+            return self._send(200, {"ok": True})
+        if path == "/_mock/push" and method == "POST":
+            index = self.server.data.find_repo(query.get("repo", ""))
+            if index is None:
+                return self._not_found(f"Repository {query.get('repo')} non trovato")
+            self.server.data.simulate_push(index, int(query.get("count", 1)))
+            return self._send(200, {"ok": True, "repo": index})
+
+        match = _API_PATH.match(path)
+        body = self._read_json() if method == "POST" else None
+        endpoint = "other"
+        if match:
+            rest = match.group("rest") or ""
+            endpoint = "repositories" if not match.group("repo") else (rest.split("/")[0] or "repository")
+        self.server.count_request(endpoint)
+        self.server.simulate_latency()
+        if self.server.should_throttle():
+            return self._send(429, {"message": "Too many requests"}, {"Retry-After": "1"})
+        api_version = query.get("api-version", "")
+        if self.server.api_versions is not None and api_version.split("-")[0] not in self.server.api_versions:
+            return self._send(400, {
+                "message": f"The requested REST API version of {api_version} is out of range for this server.",
+                "typeKey": "VssVersionOutOfRangeException",
+            })
+        if not match:
+            return self._not_found(f"Endpoint non simulato: {path}")
+
+        data = self.server.data
+        repo_key = match.group("repo")
+        if not repo_key:
+            repos = data.repositories()
+            if "$top" in query:
+                repos = repos[: int(query["$top"])]
+            return self._send(200, {"value": repos, "count": len(repos)})
+        index = data.find_repo(repo_key)
+        if index is None:
+            return self._not_found(f"Repository {repo_key} non trovato")
+
+        rest = match.group("rest") or ""
+        try:
+            if rest == "refs" and method == "GET":
+                return self._send(200, self._refs(index, query))
+            if rest == "commits" and method == "GET":
+                return self._send(200, self._commits(index, query))
+            if rest == "commitsbatch" and method == "POST":
+                return self._send(200, self._commits_batch(index, body or {}))
+            if rest == "diffs/commits" and method == "GET":
+                return self._send(200, self._diffs(index, query))
+            if rest.startswith("annotatedtags/") and method == "GET":
+                return self._annotated_tag(index, rest[len("annotatedtags/"):])
+            if rest == "stats/branches" and method == "GET":
+                return self._send(200, self._branch_stats(index, query))
+            if rest == "pushes" and method == "GET":
+                return self._send(200, self._pushes(index, query))
+        except KeyError as e:
+            return self._not_found(f"Versione non trovata: {e.args[0] if e.args else ''}")
+        return self._not_found(f"Endpoint non simulato: {rest}")
+
+    def _refs(self, index: int, query: dict) -> dict:
+        data = self.server.data
+        model = data.repo_model(index)
+        flt = query.get("filter", "")
+        peel = query.get("peelTags", "").lower() == "true"
+        refs = []
+        if not flt or flt.startswith("heads/"):
+            for name, n in model["heads"].items():
+                refs.append({"name": f"refs/heads/{name}", "objectId": model["shas"][n]})
+        if not flt or flt.startswith("tags/"):
+            for t in model["tags"]:
+                ref = {"name": f"refs/tags/{t['name']}", "objectId": t["objectId"]}
+                if peel and t["annotated"]:
+                    ref["peeledObjectId"] = model["shas"][t["commit_index"]]
+                refs.append(ref)
+        prefix = f"refs/{flt}" if flt else ""
+        refs = [r for r in refs if r["name"].startswith(prefix)][: int(query.get("$top", 1000))]
+        return {"value": refs, "count": len(refs)}
+
+    def _commits(self, index: int, query: dict) -> dict:
+        data = self.server.data
+        model = data.repo_model(index)
+        top = int(query.get("searchCriteria.$top") or query.get("$top") or 100)
+        skip = int(query.get("searchCriteria.$skip") or query.get("$skip") or 0)
+        ids = query.get("searchCriteria.ids")
+        if ids:
+            found = [model["by_sha"][c.lower()] for c in ids.split(",") if c.lower() in model["by_sha"]]
+            value = [data.commit(index, n) for n in found][:top]
+            return {"value": value, "count": len(value)}
+        item = data.resolve(
+            index,
+            query.get("searchCriteria.itemVersion.version", "main"),
+            query.get("searchCriteria.itemVersion.versionType", "branch"),
+        )
+        lower = -1
+        if "searchCriteria.compareVersion.version" in query:
+            lower = data.resolve(
+                index,
+                query["searchCriteria.compareVersion.version"],
+                query.get("searchCriteria.compareVersion.versionType", "branch"),
+            )
+        # Storia lineare: i commit in item non in compare sono (compare, item], dal più recente
+        indices = list(range(item, lower, -1))[skip:skip + top]
+        value = [data.commit(index, n) for n in indices]
+        return {"value": value, "count": len(value)}
+
+    def _commits_batch(self, index: int, body: dict) -> dict:
+        data = self.server.data
+        model = data.repo_model(index)
+        ids = [c.lower() for c in body.get("ids") or [] if isinstance(c, str)]
+        value = [data.commit(index, model["by_sha"][c]) for c in ids if c in model["by_sha"]]
+        return {"value": value[: int(body.get("$top") or len(value))], "count": len(value)}
+
+    def _diffs(self, index: int, query: dict) -> dict:
+        data = self.server.data
+        model = data.repo_model(index)
+        base = data.resolve(index, query["baseVersion"], query.get("baseVersionType", "branch"))
+        target = data.resolve(index, query["targetVersion"], query.get("targetVersionType", "branch"))
+        top = int(query.get("$top", 100))
+        skip = int(query.get("$skip", 0))
+        lo, hi = min(base, target), max(base, target)
+        fpc = data.files_per_commit
+        total = (hi - lo) * fpc
+        changes = []
+        for j in range(skip, min(total, skip + top)):
+            n, k = lo + 1 + j // fpc, j % fpc
+            changes.append({"item": {"path": data.file_path(n, k), "gitObjectType": "blob"}, "changeType": "edit"})
+        return {
+            "commonCommit": model["shas"][lo],
+            "baseCommit": model["shas"][base],
+            "targetCommit": model["shas"][target],
+            "aheadCount": max(0, target - base),
+            "behindCount": max(0, base - target),
+            "allChangesIncluded": skip + len(changes) >= total,
+            "changeCounts": {"Edit": len(changes)} if changes else {},
+            "changes": changes,
+        }
+
+    def _annotated_tag(self, index: int, object_id: str) -> None:
+        data = self.server.data
+        model = data.repo_model(index)
+        tag = model["tags_by_object"].get(object_id.lower())
+        if not tag:
+            return self._not_found(f"Tag annotato {object_id} non trovato")
+        commit = data.commit(index, tag["commit_index"])
+        return self._send(200, {
+            "name": tag["name"],
+            "objectId": tag["objectId"],
+            "taggedObject": {"objectId": commit["commitId"], "objectType": "commit"},
+            "taggedBy": commit["committer"],
+            "message": f"Release {tag['name']}",
+        })
+
+    def _pushes(self, index: int, query: dict) -> dict:
+        pushes = self.server.data.pushes(index)
+        from_date = query.get("searchCriteria.fromDate")
+        if from_date:
+            since = datetime.fromisoformat(from_date.replace("Z", "+00:00"))
+            pushes = [p for p in pushes if datetime.fromisoformat(p["date"].replace("Z", "+00:00")) >= since]
+        pushes = pushes[int(query.get("$skip", 0)):][: int(query.get("$top", 100))]
+        return {"value": pushes, "count": len(pushes)}
+
+    def _branch_stats(self, index: int, query: dict) -> dict:
+        data = self.server.data
+        model = data.repo_model(index)
+        base = data.resolve(
+            index,
+            query["baseVersionDescriptor.version"],
+            query.get("baseVersionDescriptor.versionType", "branch"),
+        )
+        entries = [
+            {
+                "name": name,
+                "aheadCount": max(0, n - base),
+                "behindCount": max(0, base - n),
+                "isBaseVersion": n == base,
+                "commit": {"commitId": model["shas"][n]},
+            }
+            for name, n in model["heads"].items()
+        ]
+        name = query.get("name")
+        if name:
+            entry = next((e for e in entries if e["name"] == name), None)
+            if entry is None:
+                raise KeyError(name)
+            return entry
+        return {"value": entries, "count": len(entries)}
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data: MockData, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 throttle_rate: float = 0.0, verbose: bool = False, api_versions: Optional[set] = None):
+        super().__init__(address, MockHandler)
+        self.data = data
+        # api-version accettate (None = tutte): le altre ricevono 400 VssVersionOutOfRangeException come su TFS
+        self.api_versions = api_versions
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._requests: dict[str, int] = {}
+        self._bytes = 0
+        self._throttled = 0
+
+    def simulate_latency(self) -> None:
+        delay = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def should_throttle(self) -> bool:
+        if self.throttle_rate <= 0 or random.random() >= self.throttle_rate:
+            return False
+        with self._lock:
+            self._throttled += 1
+        return True
+
+    def count_request(self, endpoint: str) -> None:
+        with self._lock:
+            self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+
+    def count_bytes(self, size: int) -> None:
+        with self._lock:
+            self._bytes += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": sum(self._requests.values()),
+                "by_endpoint": dict(sorted(self._requests.items())),
+                "bytes_sent": self._bytes,
+                "throttled": self._throttled,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._bytes = 0
+            self._throttled = 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Server Azure DevOps finto per benchmark di GitSnap.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 = porta libera scelta dal sistema")
+    parser.add_argument("--repos", type=int, default=100, help="numero di repository")
+    parser.add_argument("--tags", type=int, default=20, help="tag prod-NNN per repo")
+    parser.add_argument("--divergence", type=int, default=5, help="commit di develop avanti rispetto a main")
+    parser.add_argument("--divergent-ratio", type=float, default=0.5, help="frazione di repo divergenti (0-1)")
+    parser.add_argument("--files-per-commit", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latenza fissa per richiesta")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="latenza casuale aggiuntiva (0-jitter)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="frazione di richieste con 429")
+    parser.add_argument("--api-versions", help="api-version accettate separate da virgola (es. 5.0); default tutte")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log di ogni richiesta su stderr")
+    parser.add_argument("--tls", action="store_true", help="HTTPS con certificato autofirmato generato all'avvio")
+    parser.add_argument("--certfile", help="HTTPS con questo certificato (PEM)")
+    parser.add_argument("--keyfile", help="chiave privata del certificato (PEM)")
+    return parser
+
+
+def _self_signed_cert(host: str) -> tuple[str, str]:
+    """Certificato autofirmato (openssl) valido per host, in una cartella temporanea: (certfile, keyfile)."""
+    folder = Path(tempfile.mkdtemp(prefix="gitsnap-mock-tls-"))
+    certfile, keyfile = folder / "cert.pem", folder / "key.pem"
+    san = f"IP:{host}" if re.fullmatch(r"[\d.]+", host) or ":" in host else f"DNS:{host}"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", f"/CN={host}", "-addext", f"subjectAltName={san}",
+            "-keyout", str(keyfile), "-out", str(certfile),
+        ],
+        check=True, capture_output=True,
+    )
+    return str(certfile), str(keyfile)
+
+
+def _enable_tls(server: "MockServer", certfile: str, keyfile: Optional[str]) -> None:
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(["http/1.1"])
+    # Handshake nel thread della richiesta, non nel ciclo di accept
+    server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+
+
+def main(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    data = MockData(args.repos, args.tags, args.divergence, args.divergent_ratio, args.files_per_commit)
+    server = MockServer(
+        (args.host, args.port), data,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        throttle_rate=args.throttle_rate, verbose=args.verbose,
+        api_versions=set(args.api_versions.split(",")) if args.api_versions else None,
+    )
+    host, port = server.server_address[:2]
+    scheme, cert_note = "http", ""
+    certfile, keyfile = args.certfile, args.keyfile
+    if args.tls and not certfile:
+        certfile, keyfile = _self_signed_cert(host)
+    if certfile:
+        _enable_tls(server, certfile, keyfile)
+        scheme, cert_note = "https", f" certificato={certfile}"
+    # Prima riga su stdout: usata da scripts/benchmark.py per leggere porta e certificato
+    print(
+        f"Mock Azure DevOps in ascolto su {scheme}://{host}:{port} (organization/project qualsiasi){cert_note}",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
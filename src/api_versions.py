@@ -0,0 +1,67 @@
+"""
+Mappa delle api-version accettate da ogni server, per famiglia di endpoint (repositories, refs, commits, ...).
+Appresa una volta per base_url e salvata su file JSON (data/api_versions.json) per le sessioni successive.
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ApiVersionMap:
+    """
+    server_key -> { famiglia endpoint -> api-version funzionante }, thread-safe.
+    Con path=None la mappa resta solo in memoria.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._versions: dict[str, dict[str, str]] = {}
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._versions = {
+                        str(server): {str(k): str(v) for k, v in families.items()}
+                        for server, families in data.items()
+                        if isinstance(families, dict)
+                    }
+            except Exception as e:
+                logger.warning("Load api versions failed: %s", e)
+
+    def get(self, server_key: str, family: str) -> Optional[str]:
+        with self._lock:
+            return self._versions.get(server_key, {}).get(family)
+
+    def set(self, server_key: str, family: str, api_version: str) -> None:
+        with self._lock:
+            families = self._versions.setdefault(server_key, {})
+            if families.get(family) == api_version:
+                return
+            families[family] = api_version
+            self._save_locked()
+
+    def forget(self, server_key: str, family: str) -> None:
+        with self._lock:
+            if self._versions.get(server_key, {}).pop(family, None) is not None:
+                self._save_locked()
+
+    def as_dict(self) -> dict[str, dict[str, str]]:
+        with self._lock:
+            return {server: dict(families) for server, families in self._versions.items()}
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._versions, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.warning("Save api versions failed: %s", e)
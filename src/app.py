@@ -3,27 +3,49 @@ Streamlit UI: configurazione Azure DevOps, selezione repo, definizione ambienti
 confronto differenze e dashboard risultati. Nessun clone, solo REST API.
 """
 
+import html
 import json
 import logging
-import sys
 import time
 import uuid
-from pathlib import Path
 
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 
+from api_versions import ApiVersionMap
 from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+from commit_cache import DEFAULT_MAX_BYTES, CommitCache
 from ref_resolver import (
     REF_TYPE_BRANCH,
     REF_TYPE_COMMIT,
     REF_TYPE_TAG_PATTERN,
-    resolve_refs_for_repos,
+    RefSnapshot,
+)
+from ref_prefetch import WARM_INTERVAL_SEC, RefPrefetcher
+from repo_list_cache import RepoListRefresh, RepoListStore, repo_list_key
+from repo_picker import RepoGroupStore, apply_row_edits, filter_repos, repo_key
+from tracing import Tracer
+from matrix_service import iter_compare_matrix, matrix_summary
+from settings import (
+    API_VERSIONS_FILE,
+    COMMIT_CACHE_FILE,
+    REPO_GROUPS_FILE,
+    REPO_LISTS_FILE,
+    load_config,
+    load_projects,
+    save_config,
+    save_projects,
 )
 from diff_service import (
+    DEFAULT_MAX_WORKERS,
+    MAX_COMMITS_DISPLAY,
     STATUS_ALIGNED,
     STATUS_DIVERGENT,
     STATUS_ERROR,
-    get_diffs_for_repos,
+    STRATEGY_BRANCH_STATS,
+    STRATEGY_DIFF,
+    iter_compare_repos,
+    load_diff_details,
 )
 
 logging.basicConfig(
@@ -32,22 +54,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def _data_base_dir() -> Path:
-    """Cartella base per dati: scrivibile (AppData/GitSnap) quando frozen, altrimenti repo/data."""
-    if getattr(sys, "frozen", False):
-        import os
-        if sys.platform == "win32":
-            appdata = os.environ.get("APPDATA") or str(Path(sys.executable).resolve().parent)
-            base = Path(appdata) / "GitSnap"
-        else:
-            base = Path.home() / ".config" / "GitSnap"
-        return base
-    return Path(__file__).resolve().parent.parent
-
-_BASE_DIR = Path(__file__).resolve().parent.parent
-_DATA_DIR = _data_base_dir() / "data"
-CONFIG_FILE = _DATA_DIR / "config.json"
-PROJECTS_FILE = _DATA_DIR / "projects.json"
 CREDITS_AUTHOR = "Massimo Contursi"
 SESSION_PAT = "pat"
 SESSION_CLIENT = "client"
@@ -56,7 +62,18 @@ SESSION_SELECTED_REPOS = "selected_repos"
 SESSION_SOURCE = "source"
 SESSION_TARGET = "target"
 SESSION_DIFF_RESULTS = "diff_results"
+SESSION_RUN_INFO = "run_info"
+SESSION_ENVIRONMENTS = "environments"
+SESSION_MATRIX_RESULTS = "matrix_results"
 SESSION_CURRENT_PROJECT_ID = "current_project_id"
+SESSION_PREFETCH = "ref_prefetch"
+SESSION_REPO_LIST_KEY = "repo_list_key"
+SESSION_REPO_REFRESH = "repo_list_refresh"
+SESSION_REPO_CHANGES = "repo_list_changes"
+SESSION_REPO_PICKER = "repo_picker"
+SESSION_REPO_VERIFIED = "repo_list_verified"
+SESSION_DASHBOARD_SELECTION = "dashboard_selection"
+DASHBOARD_GRID_KEY = "dashboard_grid"
 
 REF_TYPES = [
     ("Branch", REF_TYPE_BRANCH),
@@ -65,47 +82,30 @@ REF_TYPES = [
 ]
 
 
-def load_config() -> dict:
-    if not CONFIG_FILE.exists():
-        return {}
-    try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.warning("Load config failed: %s", e)
-        return {}
+@st.cache_resource
+def get_commit_cache() -> CommitCache:
+    """Cache commit/diff su disco, condivisa da tutte le sessioni del processo."""
+    max_mb = load_config().get("cache_max_mb")
+    max_bytes = int(max_mb) * 1024 * 1024 if max_mb else DEFAULT_MAX_BYTES
+    return CommitCache(COMMIT_CACHE_FILE, max_bytes=max_bytes)
 
 
-def save_config(config: dict) -> None:
-    # Never persist PAT
-    out = {k: v for k, v in config.items() if k not in ("pat", "PAT")}
-    try:
-        CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(out, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.warning("Save config failed: %s", e)
+@st.cache_resource
+def get_api_versions() -> ApiVersionMap:
+    """api-version apprese per server e famiglia di endpoint, salvate accanto a config.json."""
+    return ApiVersionMap(API_VERSIONS_FILE)
 
 
-def load_projects() -> list[dict]:
-    if not PROJECTS_FILE.exists():
-        return []
-    try:
-        with open(PROJECTS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("projects", data) if isinstance(data, dict) else (data if isinstance(data, list) else [])
-    except Exception as e:
-        logger.warning("Load projects failed: %s", e)
-        return []
+@st.cache_resource
+def get_repo_lists() -> RepoListStore:
+    """Ultimo elenco repo per progetto, salvato accanto a config.json."""
+    return RepoListStore(REPO_LISTS_FILE)
 
 
-def save_projects(projects: list[dict]) -> None:
-    try:
-        PROJECTS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(PROJECTS_FILE, "w", encoding="utf-8") as f:
-            json.dump({"projects": projects}, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.warning("Save projects failed: %s", e)
+@st.cache_resource
+def get_repo_groups() -> RepoGroupStore:
+    """Gruppi di repo salvati per progetto, accanto a config.json."""
+    return RepoGroupStore(REPO_GROUPS_FILE)
 
 
 def get_client(
@@ -121,7 +121,660 @@ def get_client(
         pat=pat,
         username=username or None,
         base_url=base_url.strip() or None,
+        cache=get_commit_cache(),
+        api_versions=get_api_versions(),
+    )
+
+
+def start_ref_prefetch(client: AzureDevOpsClient, repos: list[dict], config: dict) -> None:
+    """Avvia (al posto di quello precedente) il prefetch dei refs, prima i repo selezionati l'ultima volta."""
+    previous = st.session_state.get(SESSION_PREFETCH)
+    if previous is not None:
+        previous.cancel()
+    selected = st.session_state.get(SESSION_SELECTED_REPOS) or config.get("selected_repo_ids") or []
+    # I tag servono solo se un ambiente (SOURCE, TARGET o matrice) usa un tag pattern
+    envs = [
+        st.session_state.get(SESSION_SOURCE) or config.get("source") or {},
+        st.session_state.get(SESSION_TARGET) or config.get("target") or {},
+        *(st.session_state.get(SESSION_ENVIRONMENTS) or config.get("environments") or []),
+    ]
+    include_tags = any(REF_TYPES[e.get("ref_type_index", 0)][1] == REF_TYPE_TAG_PATTERN for e in envs)
+    st.session_state[SESSION_PREFETCH] = RefPrefetcher(
+        client, repos, priority_ids=selected, include_tags=include_tags
+    ).start()
+
+
+def show_saved_repo_list(client: AzureDevOpsClient, pat: str, config: dict) -> None:
+    """
+    Mostra subito l'ultimo elenco repo salvato per il progetto (una volta per progetto e sessione)
+    e avvia la verifica sul server in background; senza elenco salvato non fa nulla.
+    Il client (PAT non ancora verificato) entra in SESSION_CLIENT solo a verifica riuscita.
+    """
+    key = repo_list_key(client.server_key, client.project)
+    if st.session_state.get(SESSION_REPO_LIST_KEY) == key:
+        return
+    st.session_state[SESSION_REPO_LIST_KEY] = key
+    saved = get_repo_lists().get(key)
+    if not saved or not saved["repos"]:
+        return
+    repos = saved["repos"]
+    client.use_repositories(repos)
+    st.session_state[SESSION_REPOS] = repos
+    st.session_state[SESSION_CLIENT] = None
+    st.session_state[SESSION_PAT] = pat
+    st.session_state[SESSION_REPO_REFRESH] = RepoListRefresh(client, get_repo_lists(), key, repos).start()
+    st.session_state["repo_list_saved_at"] = saved.get("saved_at")
+    start_ref_prefetch(client, repos, config)
+
+
+def age_label(epoch) -> str:
+    """Età di un istante (epoch) in forma breve, es. «5 min fa»."""
+    if not epoch:
+        return ""
+    minutes = int(max(0, time.time() - epoch) // 60)
+    if minutes < 1:
+        return "meno di un minuto fa"
+    if minutes < 60:
+        return f"{minutes} min fa"
+    if minutes < 48 * 60:
+        return f"{minutes // 60} h fa"
+    return f"{minutes // (24 * 60)} giorni fa"
+
+
+def repo_changes_label(changes: dict[str, list[str]]) -> str:
+    parts = []
+    for label, names in (("aggiunti", changes["added"]), ("rimossi", changes["removed"]), ("rinominati", changes["renamed"])):
+        if names:
+            shown = ", ".join(names[:5]) + (f" e altri {len(names) - 5}" if len(names) > 5 else "")
+            parts.append(f"{label}: {shown}")
+    return " · ".join(parts)
+
+
+def render_repo_picker(repos: list[dict], config: dict) -> set:
+    """
+    Selezione repo: filtri per nome e regex, tabella virtualizzata (st.data_editor) delle sole righe filtrate,
+    gruppi salvati. La selezione è l'insieme di id in session_state: ogni modifica della tabella tocca solo
+    le righe cambiate, quindi il costo di un rerun non cresce con il numero di repo selezionabili.
+    """
+    if SESSION_SELECTED_REPOS not in st.session_state:
+        st.session_state[SESSION_SELECTED_REPOS] = set(config.get("selected_repo_ids") or [])
+    selected_ids: set = st.session_state[SESSION_SELECTED_REPOS]
+
+    name_col, regex_col, only_col, sort_col = st.columns([2, 2, 1, 1])
+    with name_col:
+        name_filter = st.text_input("Filtra per nome", key="repo_filter_name", placeholder="es. api")
+    with regex_col:
+        regex_filter = st.text_input("Regex sul nome", key="repo_filter_regex", placeholder="es. ^(svc|api)-")
+    with only_col:
+        only_selected = st.toggle("Solo selezionati", key="repo_filter_selected")
+    with sort_col:
+        sort_order = st.selectbox("Ordina", options=["Nome (A→Z)", "Nome (Z→A)"], key="repo_sort")
+
+    # Tabella ricreata (nuova key) quando cambiano le righe mostrate o la selezione dai pulsanti:
+    # edited_rows è relativo ai dati con cui la tabella è nata, salvati in picker["base"].
+    # Righe filtrate, ordinate e pronte per la tabella restano in picker finché non cambiano elenco o filtri:
+    # un rerun senza modifiche non ripercorre i repo
+    picker = st.session_state.setdefault(
+        SESSION_REPO_PICKER,
+        {"version": 0, "sig": None, "base": set(), "ids": [], "rows": [], "regex_error": None,
+         "repos": None, "content": None, "all_ids": [], "all_set": set(), "forced": 0},
+    )
+    if picker["repos"] is not repos:
+        # Nuovo oggetto elenco (es. riletto dal server): si ricalcola solo se il contenuto è diverso
+        content = tuple((repo_key(r), r.get("name"), r.get("defaultBranch")) for r in repos)
+        if content != picker["content"]:
+            all_ids = [repo_key(r) for r in repos]
+            picker.update(content=content, all_ids=all_ids, all_set=set(all_ids), sig=None)
+        picker["repos"] = repos
+    sig = (name_filter, regex_filter, only_selected, sort_order, picker["forced"])
+    if picker["sig"] != sig:
+        shown, regex_error = filter_repos(repos, name_filter, regex_filter)
+        if only_selected:
+            shown = [r for r in shown if repo_key(r) in selected_ids]
+        shown = sorted(shown, key=lambda r: (r.get("name") or repo_key(r)).lower(), reverse=(sort_order == "Nome (Z→A)"))
+        base = set(selected_ids)
+        picker.update(
+            version=picker["version"] + 1,
+            sig=sig,
+            base=base,
+            ids=[repo_key(r) for r in shown],
+            regex_error=regex_error,
+            rows=[
+                {
+                    "Sel.": repo_key(r) in base,
+                    "Repository": r.get("name") or repo_key(r),
+                    "Branch default": (r.get("defaultBranch") or "").removeprefix("refs/heads/"),
+                }
+                for r in shown
+            ],
+        )
+    if picker["regex_error"]:
+        st.warning(picker["regex_error"])
+    shown_ids = picker["ids"]
+    all_ids = picker["all_ids"]
+    editor_key = f"repo_picker_{picker['version']}"
+
+    def _reset_table() -> None:
+        picker["forced"] += 1
+
+    def _on_edit() -> None:
+        edits = st.session_state.get(editor_key) or {}
+        apply_row_edits(selected_ids, picker["ids"], edits.get("edited_rows"), "Sel.")
+        if only_selected:
+            # Le righe deselezionate escono dal filtro: la tabella va ricreata
+            _reset_table()
+
+    def _select(ids, on: bool) -> None:
+        if on:
+            selected_ids.update(ids)
+        else:
+            selected_ids.difference_update(ids)
+        _reset_table()
+
+    b1, b2, b3, b4, info_col = st.columns([1, 1, 1, 1, 2])
+    with b1:
+        st.button(f"Seleziona mostrati ({len(shown_ids)})", on_click=_select, args=(shown_ids, True), disabled=not shown_ids)
+    with b2:
+        st.button("Deseleziona mostrati", on_click=_select, args=(shown_ids, False), disabled=not shown_ids)
+    with b3:
+        st.button("Seleziona tutti", on_click=_select, args=(all_ids, True))
+    with b4:
+        st.button("Deseleziona tutti", on_click=_select, args=(all_ids, False))
+    with info_col:
+        selected_count = len(selected_ids & picker["all_set"])
+        st.caption(f"Selezionati **{selected_count}** di {len(repos)} · mostrati {len(shown_ids)}")
+
+    if not shown_ids:
+        st.caption("Nessun repository corrisponde ai filtri.")
+    else:
+        st.data_editor(
+            picker["rows"],
+            key=editor_key,
+            on_change=_on_edit,
+            hide_index=True,
+            use_container_width=True,
+            height=min(420, 38 + 35 * max(1, len(shown_ids))),
+            column_config={"Sel.": st.column_config.CheckboxColumn("Sel.", width="small")},
+            disabled=["Repository", "Branch default"],
+        )
+
+    client = st.session_state.get(SESSION_CLIENT)
+    if client is not None:
+        render_repo_groups(repo_list_key(client.server_key, client.project), all_ids, selected_ids, _reset_table)
+    return selected_ids
+
+
+def render_repo_groups(project_key: str, all_ids: list[str], selected_ids: set, on_change) -> None:
+    """Gruppi di repo salvati per il progetto: applica (sostituisce o aggiunge), salva la selezione, elimina."""
+    store = get_repo_groups()
+    groups = store.groups(project_key)
+    known = set(all_ids)
+
+    def _apply(name: str, replace: bool) -> None:
+        if replace:
+            selected_ids.clear()
+        selected_ids.update(rid for rid in groups.get(name, []) if rid in known)
+        on_change()
+
+    with st.expander(f"Gruppi di repository ({len(groups)})", expanded=False):
+        if groups:
+            g_col, use_col, add_col, del_col = st.columns([2, 1, 1, 1])
+            with g_col:
+                group = st.selectbox(
+                    "Gruppo",
+                    options=list(groups),
+                    format_func=lambda n: f"{n} ({len(groups[n])} repo)",
+                    key="repo_group",
+                )
+            with use_col:
+                st.button("Usa gruppo", on_click=_apply, args=(group, True), help="Sostituisce la selezione con il gruppo")
+            with add_col:
+                st.button("Aggiungi gruppo", on_click=_apply, args=(group, False), help="Aggiunge il gruppo alla selezione")
+            with del_col:
+                if st.button("Elimina gruppo"):
+                    store.delete(project_key, group)
+                    st.rerun()
+            missing = sum(1 for rid in groups[group] if rid not in known)
+            if missing:
+                st.caption(f"{missing} repo del gruppo non sono più nel progetto.")
+        name_col, save_col = st.columns([3, 1])
+        with name_col:
+            new_name = st.text_input("Nome gruppo", key="repo_group_name", placeholder="es. backend")
+        with save_col:
+            if st.button("Salva selezione come gruppo", disabled=not new_name.strip() or not selected_ids):
+                store.save(project_key, new_name.strip(), (rid for rid in selected_ids if rid in known))
+                st.success(f"Gruppo «{new_name.strip()}» salvato.")
+
+
+def status_icon(s: str):
+    if s == STATUS_ALIGNED:
+        return "✅ ALLINEATO"
+    if s == STATUS_DIVERGENT:
+        return "⚠️ DIVERGENTE"
+    return "❌ ERRORE"
+
+
+def result_origin(r: dict) -> str:
+    """Da dove viene il risultato: confronto precedente della sessione, cache di processo o calcolo nuovo."""
+    if r.get("reused"):
+        return "♻️ riusato"
+    if r.get("cached"):
+        return "🗄️ cache"
+    return ""
+
+
+def summary_row(r: dict) -> dict:
+    """Riga della tabella Riepilogo per un risultato di confronto."""
+    return {"Repo": r.get("repo_name"), "Stato": status_icon(r.get("status", "")), "#Commit diff": r.get("commit_count", 0), "#File diff": r.get("file_count", 0), "SourceRef": r.get("source_ref", ""), "TargetRef": r.get("target_ref", ""), "Origine": result_origin(r), "Note": r.get("note", "")}
+
+
+def diagnostics_row(e: dict) -> dict:
+    """Riga della tabella Diagnostica per una voce (famiglia, api-version) del report metriche."""
+    lat = e.get("latency_ms") or {}
+    return {
+        "Famiglia": e.get("family"),
+        "api-version": e.get("api_version"),
+        "Richieste": e.get("requests", 0),
+        "OK": e.get("ok", 0),
+        "4xx": e.get("errors_4xx", 0),
+        "5xx": e.get("errors_5xx", 0),
+        "Rete": e.get("network_errors", 0),
+        "Throttling": e.get("throttled", 0),
+        "Retry": e.get("retries", 0),
+        "Fallback sprecati": e.get("wasted_fallbacks", 0),
+        "KB": round(e.get("bytes", 0) / 1024, 1),
+        "Media ms": lat.get("mean"),
+        "p95 ms": lat.get("p95"),
+        "Max ms": lat.get("max"),
+    }
+
+
+def phase_row(p: dict) -> dict:
+    """Riga della tabella Fasi (riepilogo span del tracer)."""
+    return {
+        "Fase": p["name"],
+        "Chiamate": p["calls"],
+        "Totale ms": p["total_ms"],
+        "Esclusivo ms": p["self_ms"],
+        "Max ms": p["max_ms"],
+    }
+
+
+DEFAULT_ENVIRONMENTS = [
+    {"name": "Sviluppo", "ref_type_index": 0, "value": "develop"},
+    {"name": "Collaudo", "ref_type_index": 0, "value": "master"},
+    {"name": "Produzione", "ref_type_index": 1, "value": "prod*"},
+]
+
+
+def matrix_cell_label(cell: dict) -> str:
+    """Testo di una cella della matrice di un repo (SOURCE riga vs TARGET colonna)."""
+    if cell is None:
+        return "—"
+    if cell["status"] == STATUS_ALIGNED:
+        return "✅"
+    if cell["status"] == STATUS_DIVERGENT:
+        return f"⚠️ +{cell['ahead']} / -{cell['behind']}"
+    return "❌"
+
+
+def matrix_env_label(env: dict) -> str:
+    """Ref risolto di un ambiente per un repo (con SHA corto) o errore di risoluzione."""
+    if env.get("error"):
+        return f"❌ {env['error']}"
+    return env["ref"] + (f" ({env['commit_id'][:7]})" if env.get("commit_id") else "")
+
+
+def matrix_heatmap_html(names: list[str], summary: list[list], total: int) -> str:
+    """Tabella HTML colorata: per ogni SOURCE (riga) vs TARGET (colonna) la quota di repo allineati."""
+    head = "".join(f"<th style='padding:4px 8px'>{html.escape(n)}</th>" for n in names)
+    rows = []
+    for i, name in enumerate(names):
+        tds = []
+        for j in range(len(names)):
+            counts = summary[i][j]
+            if counts is None:
+                tds.append("<td style='padding:4px 8px; text-align:center; background:#eee'>—</td>")
+                continue
+            aligned, divergent, errors = counts[STATUS_ALIGNED], counts[STATUS_DIVERGENT], counts[STATUS_ERROR]
+            checked = aligned + divergent
+            if not checked:
+                color = "#ddd"
+            else:
+                # Da rosso (nessun repo allineato) a verde (tutti allineati)
+                ratio = aligned / checked
+                color = f"rgb({int(248 - 36 * ratio)}, {int(215 + 22 * ratio)}, 218)"
+            text = f"✅ {aligned}/{total}" + (f" · ⚠️ {divergent}" if divergent else "") + (f" · ❌ {errors}" if errors else "")
+            tds.append(f"<td style='padding:4px 8px; text-align:center; background:{color}; color:#222'>{text}</td>")
+        rows.append(f"<tr><th style='padding:4px 8px; text-align:right'>{html.escape(name)}</th>{''.join(tds)}</tr>")
+    return (
+        "<table style='border-collapse:collapse'>"
+        f"<tr><th style='padding:4px 8px'>SOURCE ↓ / TARGET →</th>{head}</tr>{''.join(rows)}</table>"
+    )
+
+
+def render_matrix_section(client, selected_repos: list[dict], config: dict, max_workers: int) -> None:
+    """Confronto multi-ambiente: N ambienti risolti una volta per repo, matrice ambiente×ambiente e heatmap."""
+    with st.expander("Matrice multi-ambiente (N ambienti in un solo passaggio)", expanded=False):
+        st.caption(
+            "Ogni ambiente viene risolto una sola volta per repo; per ogni coppia di commit distinti basta un diff. "
+            "Cella riga→colonna: ✅ SOURCE contenuto in TARGET, ⚠️ +commit in SOURCE non in TARGET / -commit in TARGET non in SOURCE."
+        )
+        envs_config = st.session_state.get(SESSION_ENVIRONMENTS) or config.get("environments") or DEFAULT_ENVIRONMENTS
+        type_labels = [label for label, _ in REF_TYPES]
+        edited = st.data_editor(
+            [
+                {"Nome": e.get("name", ""), "Tipo": type_labels[e.get("ref_type_index", 0)], "Valore": e.get("value", "")}
+                for e in envs_config
+            ],
+            column_config={
+                "Nome": st.column_config.TextColumn("Nome", required=True),
+                "Tipo": st.column_config.SelectboxColumn("Tipo", options=type_labels, required=True),
+                "Valore": st.column_config.TextColumn("Valore", help="branch, tag pattern (prod*), o SHA", required=True),
+            },
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="environments_editor",
+        )
+        environments_state = [
+            {
+                "name": (row.get("Nome") or "").strip() or (row.get("Valore") or "").strip(),
+                "ref_type_index": type_labels.index(row["Tipo"]) if row.get("Tipo") in type_labels else 0,
+                "value": (row.get("Valore") or "").strip(),
+            }
+            for row in edited
+            if (row.get("Valore") or "").strip()
+        ]
+        st.session_state[SESSION_ENVIRONMENTS] = environments_state
+
+        if st.button("Esegui matrice", key="run_matrix"):
+            if not client:
+                st.error("Esegui prima «Carica repository del progetto».")
+                st.stop()
+            if len(environments_state) < 2:
+                st.warning("Definisci almeno due ambienti.")
+                st.stop()
+            environments = [
+                {"name": e["name"], "ref_type": REF_TYPES[e["ref_type_index"]][1], "value": e["value"]}
+                for e in environments_state
+            ]
+            prefetcher = st.session_state.get(SESSION_PREFETCH)
+            if prefetcher is not None:
+                prefetcher.cancel()
+            client.set_max_in_flight(int(max_workers))
+            client.metrics.reset()
+            client.transport.reset()
+            client.tracer = Tracer()
+            total = len(selected_repos)
+            progress = st.progress(0.0, text=f"Matrice 0/{total} repository...")
+            matrices: list = [None] * total
+            for done, (idx, m) in enumerate(
+                iter_compare_matrix(
+                    client, selected_repos, environments, snapshot=RefSnapshot(client), max_workers=int(max_workers)
+                ),
+                start=1,
+            ):
+                matrices[idx] = m
+                progress.progress(done / total, text=f"Matrice {done}/{total} repository...")
+            progress.empty()
+            st.session_state[SESSION_MATRIX_RESULTS] = {
+                "names": [e["name"] for e in environments],
+                "matrices": matrices,
+            }
+
+        matrix_results = st.session_state.get(SESSION_MATRIX_RESULTS)
+        if not matrix_results:
+            return
+        names = matrix_results["names"]
+        matrices = [m for m in matrix_results["matrices"] if m is not None]
+        st.markdown(f"**Allineamento per coppia di ambienti** ({len(matrices)} repository)")
+        st.markdown(
+            matrix_heatmap_html(names, matrix_summary(matrices, len(names)), len(matrices)),
+            unsafe_allow_html=True,
+        )
+        st.caption(f"Diff calcolati: {sum(m.get('pair_diffs', 0) for m in matrices)} (coppie di commit distinte per repo).")
+        st.dataframe(
+            [{"Repo": m["repo_name"], **{e["name"]: matrix_env_label(e) for e in m["environments"]}} for m in matrices],
+            use_container_width=True,
+            hide_index=True,
+        )
+        repo_names = [m["repo_name"] for m in matrices]
+        chosen = st.selectbox("Matrice del repository", options=repo_names, key="matrix_repo_sel")
+        m = next((m for m in matrices if m["repo_name"] == chosen), None)
+        if m:
+            st.dataframe(
+                [
+                    {"SOURCE ↓ / TARGET →": names[i], **{names[j]: matrix_cell_label(cell) for j, cell in enumerate(row)}}
+                    for i, row in enumerate(m["cells"])
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+
+
+# Ordinamenti della dashboard su tutti i risultati (la griglia ordina poi anche per colonna, nella pagina)
+_STATUS_ORDER = {STATUS_DIVERGENT: 0, STATUS_ERROR: 1, STATUS_ALIGNED: 2}
+DASHBOARD_SORTS = {
+    "Stato (divergenti prima)": lambda r: (_STATUS_ORDER.get(r.get("status"), 1), (r.get("repo_name") or "").lower()),
+    "Nome (A→Z)": lambda r: (r.get("repo_name") or "").lower(),
+    "#Commit diff (decrescente)": lambda r: -(r.get("commit_count") or 0),
+    "#File diff (decrescente)": lambda r: -(r.get("file_count") or 0),
+}
+DASHBOARD_PAGE_SIZES = [25, 50, 100, 200]
+
+
+def dashboard_rows(results: list[dict], statuses: list[str], name_filter: str, sort_label: str) -> list[dict]:
+    """Risultati filtrati per stato e nome (sottostringa, senza maiuscole/minuscole) e ordinati."""
+    name_filter = (name_filter or "").strip().lower()
+    rows = [
+        r for r in results
+        if r.get("status") in statuses and (not name_filter or name_filter in (r.get("repo_name") or "").lower())
+    ]
+    return sorted(rows, key=DASHBOARD_SORTS[sort_label])
+
+
+def rerun_fragment() -> None:
+    """
+    Riesegue solo il frammento in corso. Streamlit lo consente solo durante una riesecuzione del frammento:
+    se il click arriva in un'esecuzione completa (insieme a un'altra interazione, o in AppTest) si riesegue la pagina.
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+@st.fragment
+def render_results_dashboard(diff_results: list[dict], base_url: str, org: str, project: str) -> None:
+    """
+    Dashboard master/detail: griglia paginata dei risultati (filtri, ordinamento) e dettaglio del solo repo selezionato.
+    È un frammento: filtri, pagine, selezione e «Carica dettagli» rieseguono solo la dashboard.
+    """
+    st.subheader("Dashboard risultati")
+    counts = {s: sum(1 for r in diff_results if r.get("status") == s) for s in (STATUS_DIVERGENT, STATUS_ERROR, STATUS_ALIGNED)}
+    status_col, name_col, sort_col, size_col = st.columns([2, 2, 2, 1])
+    with status_col:
+        statuses = st.multiselect(
+            "Stato",
+            options=list(counts),
+            default=list(counts),
+            format_func=lambda s: f"{status_icon(s)} ({counts[s]})",
+            key="dashboard_status",
+        )
+    with name_col:
+        name_filter = st.text_input("Filtra per repo", key="dashboard_name", placeholder="es. api")
+    with sort_col:
+        sort_label = st.selectbox("Ordina", options=list(DASHBOARD_SORTS), key="dashboard_sort")
+    with size_col:
+        page_size = st.selectbox("Righe", options=DASHBOARD_PAGE_SIZES, key="dashboard_page_size")
+
+    rows = dashboard_rows(diff_results, statuses, name_filter, sort_label)
+    pages = max(1, -(-len(rows) // page_size))
+    if st.session_state.get("dashboard_page", 1) > pages:
+        # Meno pagine dopo un filtro: si torna all'ultima disponibile
+        st.session_state["dashboard_page"] = pages
+    page_col, info_col = st.columns([1, 5])
+    with page_col:
+        page = st.number_input("Pagina", min_value=1, max_value=pages, step=1, key="dashboard_page")
+    page = min(int(page), pages)
+    page_rows = rows[(page - 1) * page_size : page * page_size]
+    with info_col:
+        st.caption(f"{len(rows)} di {len(diff_results)} repo · pagina {page} di {pages}")
+    # La selezione della griglia è un indice di riga: se cambiano le righe mostrate (filtri, pagina, nuovo
+    # confronto) si riporta sulla riga del repo selezionato, se è ancora in pagina
+    selection = st.session_state.setdefault(SESSION_DASHBOARD_SELECTION, {"view": None, "repo_id": None})
+    view = tuple(r.get("repo_id") for r in page_rows)
+    if not page_rows:
+        # Senza griglia Streamlit ne scarta lo stato: al ritorno delle righe la selezione va riapplicata
+        selection["view"] = None
+        st.info("Nessun risultato con i filtri scelti.")
+        return
+    if selection["view"] != view:
+        rows_sel = [view.index(selection["repo_id"])] if selection["repo_id"] in view else []
+        st.session_state[DASHBOARD_GRID_KEY] = {"selection": {"rows": rows_sel, "columns": [], "cells": []}}
+    event = st.dataframe(
+        [summary_row(r) for r in page_rows],
+        key=DASHBOARD_GRID_KEY,
+        on_select="rerun",
+        selection_mode="single-row",
+        use_container_width=True,
+        hide_index=True,
     )
+    selected_rows = [i for i in event.selection.rows if i < len(page_rows)]
+    if selection["view"] == view or selected_rows:
+        # Il repo selezionato resta memorizzato anche mentre è fuori dalla pagina
+        selection["repo_id"] = page_rows[selected_rows[0]].get("repo_id") if selected_rows else None
+    selection["view"] = view
+    if not selected_rows:
+        st.caption("Seleziona una riga per vedere commit, file e dettaglio SOURCE/TARGET del repo.")
+        return
+    r = page_rows[selected_rows[0]]
+    st.markdown(f"#### {status_icon(r.get('status', ''))} — {r.get('repo_name', '')}")
+    render_result_detail(r, base_url, org, project)
+
+
+def render_result_detail(r: dict, base_url: str, org: str, project: str) -> None:
+    """Dettaglio di un risultato: SOURCE/TARGET, commit, file modificati e link alla compare."""
+    st.markdown(f"**Stato:** {status_icon(r.get('status', ''))}")
+    file_count = r.get("file_count", 0)
+    st.markdown(f"**#Commit diff:** {r.get('commit_count', 0)} | **#File diff:** {'n/d' if file_count is None else file_count}")
+    if r.get("details_loaded") is False:
+        # Confronto rapido: commit, file e dettaglio SOURCE/TARGET solo su richiesta (poi restano nel risultato)
+        if st.button("Carica dettagli", key=f"details_{r.get('repo_id')}"):
+            details_client = st.session_state.get(SESSION_CLIENT)
+            if details_client:
+                with st.spinner("Carico commit, file e dettaglio SOURCE/TARGET..."):
+                    load_diff_details(details_client, r)
+                # Conteggi e griglia sono già stati disegnati con i valori di prima: si ridisegna solo la dashboard
+                rerun_fragment()
+        if r.get("details_error"):
+            st.warning(f"Dettagli non disponibili: {r['details_error']}")
+    src_commit = r.get("source_commit") or ""
+    tgt_commit = r.get("target_commit") or ""
+    source_ref = r.get("source_ref", "")
+    target_ref = r.get("target_ref", "")
+
+    def _clean(s: str) -> str:
+        if not s:
+            return ""
+        s = s.strip().rstrip(" -=|")
+        return s
+
+    def _fmt_date(iso_date: str) -> str:
+        if not iso_date:
+            return ""
+        try:
+            from datetime import datetime
+            dt = datetime.fromisoformat(iso_date.replace("Z", "+00:00"))
+            return dt.strftime("%d/%m/%Y %H:%M")
+        except Exception:
+            return iso_date[:19] if len(iso_date) >= 19 else iso_date
+
+    src_msg = _clean(r.get("source_commit_message") or "")
+    src_auth = _clean(r.get("source_commit_author") or "")
+    src_date = _fmt_date(r.get("source_commit_date") or "")
+    tgt_msg = _clean(r.get("target_commit_message") or "")
+    tgt_auth = _clean(r.get("target_commit_author") or "")
+    tgt_date = _fmt_date(r.get("target_commit_date") or "")
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("**SOURCE**")
+        if source_ref:
+            st.caption(f"Ref: `{source_ref}`")
+        if src_commit:
+            st.caption(f"Commit: `{src_commit}`" + (f" — *{src_auth}*" if src_auth else ""))
+        if src_date:
+            st.caption(f"📅 {src_date}")
+        st.text(src_msg or "(nessun messaggio)")
+    with c2:
+        st.markdown("**TARGET**")
+        if target_ref:
+            st.caption(f"Ref: `{target_ref}`")
+        if tgt_commit:
+            st.caption(f"Commit: `{tgt_commit}`" + (f" — *{tgt_auth}*" if tgt_auth else ""))
+        if tgt_date:
+            st.caption(f"📅 {tgt_date}")
+        st.text(tgt_msg or "(nessun messaggio)")
+    st.divider()
+    if r.get("note"):
+        st.caption(r["note"])
+
+    commits = r.get("commits") or []
+    if commits:
+        with st.expander(f"📋 Commit (SOURCE non in TARGET) ({len(commits)})", expanded=False):
+            shown = commits[:MAX_COMMITS_DISPLAY]
+            for i, c in enumerate(shown):
+                raw_msg = c.get("comment") or ""
+                msg = _clean(raw_msg) or "(nessun messaggio)"
+                commit_id = (c.get("commitId") or "")[:7]
+                auth = c.get("author")
+                author = auth.get("name", "") if isinstance(auth, dict) else (auth or "")
+                author = _clean(author)
+                raw_date = c.get("date") or ""
+                date_str = _fmt_date(raw_date) if raw_date else ""
+                with st.container():
+                    line = f"`{commit_id}`"
+                    if author:
+                        line += f" — *{author}*"
+                    if date_str:
+                        line += f" · 📅 {date_str}"
+                    st.caption(line)
+                    st.text(msg)
+                    if i < len(shown) - 1:
+                        st.divider()
+            if len(commits) > len(shown):
+                st.caption(f"… altri {len(commits) - len(shown)} commit")
+
+    files = r.get("files") or []
+    if files:
+        with st.expander(f"📁 File modificati ({len(files)})", expanded=False):
+            st.text("\n".join(files))
+
+    repo_id = r.get("repo_id")
+    repo_name = r.get("repo_name", "")
+    if repo_id and org and project:
+        # Link alla compare (cloud o on‑prem)
+        t_ref, s_ref = r.get("target_ref", ""), r.get("source_ref", "")
+        web_base = (base_url.strip().rstrip("/") or "https://dev.azure.com")
+        compare_url = f"{web_base}/{org}/{project}/_git/{repo_name}/branchCompare?baseVersion={t_ref}&targetVersion={s_ref}&_a=commits"
+        st.markdown(f"[Apri Compare in Azure DevOps]({compare_url})")
+
+
+def current_config(base_url: str, org: str, project: str, username: str, max_workers: int, quick_mode: bool) -> dict:
+    """Configurazione della pagina da salvare in config.json (senza PAT)."""
+    return {
+        "base_url": base_url,
+        "organization": org,
+        "project": project,
+        "username": username,
+        "selected_repo_ids": list(st.session_state.get(SESSION_SELECTED_REPOS) or set()),
+        "source": st.session_state.get(SESSION_SOURCE),
+        "target": st.session_state.get(SESSION_TARGET),
+        "max_workers": int(max_workers),
+        "quick_mode": bool(quick_mode),
+        "environments": st.session_state.get(SESSION_ENVIRONMENTS),
+    }
 
 
 def main():
@@ -171,6 +824,8 @@ def main():
                     st.session_state[SESSION_CURRENT_PROJECT_ID] = proj.get("id")
                     st.session_state[SESSION_REPOS] = []
                     st.session_state[SESSION_CLIENT] = None
+                    st.session_state[SESSION_REPO_LIST_KEY] = None
+                    st.session_state[SESSION_REPO_REFRESH] = None
                     st.rerun()
                 st.session_state[SESSION_CURRENT_PROJECT_ID] = proj.get("id") if sel != "— Seleziona progetto —" else None
 
@@ -292,68 +947,96 @@ def main():
                         st.session_state[SESSION_REPOS] = repos
                         st.session_state[SESSION_CLIENT] = client
                         st.session_state[SESSION_PAT] = pat
+                        # Elenco fresco: si salva per il prossimo avvio e non serve la verifica in background
+                        key = repo_list_key(client.server_key, client.project)
+                        if repos:
+                            get_repo_lists().put(key, repos)
+                        st.session_state[SESSION_REPO_LIST_KEY] = key
+                        st.session_state[SESSION_REPO_REFRESH] = None
+                        start_ref_prefetch(client, repos, config)
                         st.success(f"**{len(repos)}** repo")
                     except AzureDevOpsClientError as e:
                         st.error(f"Errore: {e.message}")
     st.markdown("---")
 
+    if st.session_state.get(SESSION_PAT) and pat != st.session_state[SESSION_PAT]:
+        # PAT cambiato: il client in sessione (o in verifica) non vale più, si riparte dall'elenco salvato
+        prefetcher = st.session_state.get(SESSION_PREFETCH)
+        if prefetcher is not None:
+            prefetcher.cancel()
+        st.session_state[SESSION_CLIENT] = None
+        st.session_state[SESSION_PAT] = None
+        st.session_state[SESSION_REPOS] = []
+        st.session_state[SESSION_REPO_LIST_KEY] = None
+        st.session_state[SESSION_REPO_REFRESH] = None
+
+    if not st.session_state.get(SESSION_REPOS) and org and project and pat:
+        # Avvio istantaneo: ultimo elenco salvato del progetto, verificato in background
+        show_saved_repo_list(get_client(org, project, pat, username, base_url), pat, config)
+
     repos = st.session_state.get(SESSION_REPOS) or []
     if not repos:
         st.info("Usa «Carica repository del progetto» per elencare i repository.")
         return
 
     st.subheader("Repository")
-    # Inizializza selected da config se prima volta; poi la fonte di verità sono i key dei checkbox
-    initial_selected = set(config.get("selected_repo_ids") or [])
-    if SESSION_SELECTED_REPOS not in st.session_state:
-        st.session_state[SESSION_SELECTED_REPOS] = initial_selected.copy()
-    # Costruisci selected_ids dai checkbox in session_state (così "Seleziona tutti" si riflette)
-    def _get_selected_ids():
-        s = set()
-        for r in repos:
-            rid = r.get("id") or r.get("name")
-            default = rid in (st.session_state.get(SESSION_SELECTED_REPOS) or set()) or rid in initial_selected
-            if st.session_state.get(f"repo_{rid}", default):
-                s.add(rid)
-        return s
+    changes = st.session_state.pop(SESSION_REPO_CHANGES, None)
+    if changes:
+        st.info(f"Elenco repository aggiornato dal server — {repo_changes_label(changes)}")
+    verified = st.session_state.pop(SESSION_REPO_VERIFIED, None)
+    if verified:
+        st.caption(verified)
 
-    def toggle_all(on: bool):
-        for r in repos:
-            rid = r.get("id") or r.get("name")
-            st.session_state[f"repo_{rid}"] = on
-        st.session_state[SESSION_SELECTED_REPOS] = {r.get("id") or r.get("name") for r in repos} if on else set()
+    refresh = st.session_state.get(SESSION_REPO_REFRESH)
 
-    selected_ids = _get_selected_ids()
-    st.session_state[SESSION_SELECTED_REPOS] = selected_ids
+    @st.fragment(run_every=1 if refresh is not None and not refresh.done else None)
+    def _repo_list_refresh():
+        # Solo questo frammento si riesegue durante la verifica; l'app intera solo se l'elenco è cambiato
+        if refresh is None:
+            return
+        saved_age = age_label(st.session_state.get("repo_list_saved_at"))
+        if not refresh.done:
+            st.caption(f"Elenco salvato ({saved_age}) · verifica sul server in corso…")
+            return
+        # Verifica conclusa: un solo rerun dell'app, che ridefinisce il frammento senza run_every
+        st.session_state[SESSION_REPO_REFRESH] = None
+        if refresh.error:
+            prefetcher = st.session_state.get(SESSION_PREFETCH)
+            if prefetcher is not None:
+                prefetcher.cancel()
+            st.session_state[SESSION_REPO_VERIFIED] = (
+                f"Elenco salvato ({saved_age}) · verifica non riuscita: {refresh.error}. "
+                "Controlla il PAT e usa «Carica repository»."
+            )
+        else:
+            st.session_state[SESSION_CLIENT] = refresh.client
+            st.session_state[SESSION_REPOS] = refresh.repos
+            if refresh.changed:
+                st.session_state[SESSION_REPO_CHANGES] = refresh.changes
+                start_ref_prefetch(refresh.client, refresh.repos, config)
+            else:
+                st.session_state[SESSION_REPO_VERIFIED] = "Elenco repository verificato sul server: nessuna modifica."
+        st.rerun()
 
-    sort_options = ["Nome (A→Z)", "Nome (Z→A)"]
-    all_col, none_col, spacer, ordina_col = st.columns([1, 1, 3, 1])
-    with all_col:
-        if st.button("Seleziona tutti"):
-            toggle_all(True)
-            st.rerun()
-    with none_col:
-        if st.button("Deseleziona tutti"):
-            toggle_all(False)
-            st.rerun()
-    with ordina_col:
-        sort_order = st.selectbox("Ordina", options=sort_options, key="repo_sort")
-    repos_sorted = sorted(repos, key=lambda r: (r.get("name") or r.get("id") or "").lower(), reverse=(sort_order == "Nome (Z→A)"))
-
-    # Lista repo in 4 colonne
-    N_COLS = 4
-    cols = st.columns(N_COLS)
-    for i, repo in enumerate(repos_sorted):
-        rid = repo.get("id") or repo.get("name")
-        name = repo.get("name", rid)
-        default_checked = rid in selected_ids
-        with cols[i % N_COLS]:
-            st.checkbox(name, value=default_checked, key=f"repo_{rid}")
-    # Aggiorna selected dopo il render (stato checkbox può essere cambiato dall'utente)
-    selected_ids = _get_selected_ids()
-    st.session_state[SESSION_SELECTED_REPOS] = selected_ids
-
-    selected_repos = [r for r in repos if (r.get("id") or r.get("name")) in selected_ids]
+    _repo_list_refresh()
+    selected_ids = render_repo_picker(repos, config)
+
+    prefetcher = st.session_state.get(SESSION_PREFETCH)
+    if prefetcher is not None and prefetcher.running:
+        # I repo appena selezionati passano in testa alla coda del prefetch
+        prefetcher.prioritize(rid for rid in (repo_key(r) for r in repos) if rid in selected_ids)
+        pf_info, pf_stop = st.columns([5, 1])
+        with pf_info:
+            if prefetcher.done < prefetcher.total:
+                st.caption(f"Prefetch ref in background: **{prefetcher.done}/{prefetcher.total}** repo")
+            else:
+                st.caption(f"Ref dei repo selezionati aggiornati in background ogni {WARM_INTERVAL_SEC} s")
+        with pf_stop:
+            if st.button("Ferma prefetch", key="stop_prefetch"):
+                prefetcher.cancel()
+                st.rerun()
+
+    selected_repos = [r for r in repos if repo_key(r) in selected_ids]
     if not selected_repos:
         st.warning("Seleziona almeno un repository.")
         st.stop()
@@ -401,175 +1084,242 @@ def main():
         )
     st.session_state[SESSION_TARGET] = {"ref_type_index": tgt_type_index, "value": tgt_value}
 
+    opt_workers, opt_quick = st.columns([1, 3])
+    with opt_workers:
+        max_workers = st.number_input(
+            "Repo in parallelo",
+            min_value=1,
+            max_value=64,
+            value=int(config.get("max_workers") or DEFAULT_MAX_WORKERS),
+            step=1,
+            key="max_workers",
+            help="Numero massimo di repository confrontati contemporaneamente.",
+        )
+    with opt_quick:
+        quick_mode = st.checkbox(
+            "Confronto rapido (dettagli su richiesta)",
+            value=bool(config.get("quick_mode", True)),
+            key="quick_mode",
+            help="Calcola solo stato e conteggi; commit, file e dettaglio SOURCE/TARGET si caricano aprendo il repo.",
+        )
+        reuse_unchanged = st.checkbox(
+            "Riusa i repo invariati",
+            value=True,
+            key="reuse_unchanged",
+            help="Al nuovo confronto si risolvono di nuovo i ref; i repo con gli stessi commit SOURCE/TARGET "
+            "del confronto precedente riusano il risultato senza ricalcolare il diff.",
+        )
+        detect_pushes = st.checkbox(
+            "Ricalcola solo i repo con nuovi push",
+            value=False,
+            key="detect_pushes",
+            disabled=not reuse_unchanged,
+            help="Prima di risolvere i ref si chiede a ogni repo se ha ricevuto push (branch o tag) dal confronto "
+            "precedente: una richiesta minima per repo; solo i repo con push vengono risolti e confrontati di nuovo.",
+        )
+
     if st.button("Esegui confronto"):
         client = st.session_state.get(SESSION_CLIENT)
         if not client:
             st.error("Esegui prima «Carica repository del progetto».")
             st.stop()
 
+        # Il prefetch lascia il posto al confronto, che si aggancia alle richieste refs ancora in volo
+        prefetcher = st.session_state.get(SESSION_PREFETCH)
+        if prefetcher is not None:
+            prefetcher.cancel()
+        # Richieste in volo allineate ai worker; lo scheduler le riduce da solo in caso di throttling
+        client.set_max_in_flight(int(max_workers))
+        # Metriche per run: il pannello Diagnostica mostra le richieste di questo confronto (e dei dettagli caricati dopo)
+        client.metrics.reset()
+        client.transport.reset()
+        # Span per fase (risoluzione, diff, commit, HTTP) di questo run, esportabili come Chrome trace
+        client.tracer = Tracer()
+        run_started = time.monotonic()
         source_ref_type = REF_TYPES[src_type_index][1]
         target_ref_type = REF_TYPES[tgt_type_index][1]
 
-        with st.spinner("Risolvo ref SOURCE e TARGET per ogni repo..."):
-            source_resolved = resolve_refs_for_repos(client, selected_repos, source_ref_type, src_value)
-            target_resolved = resolve_refs_for_repos(client, selected_repos, target_ref_type, tgt_value)
-
-        with st.spinner("Calcolo differenze (diffs/commits)..."):
-            diff_results = get_diffs_for_repos(
+        # Risultati progressivi: ogni repo (risoluzione SOURCE/TARGET + diff) appare appena finisce
+        total = len(selected_repos)
+        progress = st.progress(0.0, text=f"Confronto 0/{total} repository...")
+        tally_box = st.empty()
+        table_box = st.empty()
+        diff_results: list = [None] * total
+        tally = {STATUS_ALIGNED: 0, STATUS_DIVERGENT: 0, STATUS_ERROR: 0}
+        reused = 0
+        cached = 0
+        last_render = 0.0
+        # Refresh incrementale: i repo con la stessa coppia di SHA riusano il risultato del run precedente
+        previous_results = {
+            r["repo_id"]: r
+            for r in (st.session_state.get(SESSION_DIFF_RESULTS) or [])
+            if r and r.get("repo_id")
+        } if reuse_unchanged else {}
+        # Un solo snapshot per run: heads/tags di ogni repo scaricati una volta per SOURCE e TARGET.
+        # Il primo confronto usa i refs del prefetch/di altre sessioni (TTL); una riesecuzione li riscarica,
+        # così un push fatto pochi secondi prima non resta nascosto dalla cache
+        snapshot = RefSnapshot(client, force_refresh=bool(st.session_state.get(SESSION_DIFF_RESULTS)))
+        for done, (idx, res) in enumerate(
+            iter_compare_repos(
                 client,
                 selected_repos,
-                source_resolved,
-                target_resolved,
                 source_ref_type,
+                src_value,
                 target_ref_type,
+                tgt_value,
+                snapshot=snapshot,
+                max_workers=int(max_workers),
+                quick=quick_mode,
+                # Branch vs Branch in modalità rapida: stato da stats/branches, senza diffs/commits
+                strategy=STRATEGY_BRANCH_STATS if quick_mode else STRATEGY_DIFF,
+                previous=previous_results,
+                detect_pushes=reuse_unchanged and detect_pushes,
+            ),
+            start=1,
+        ):
+            diff_results[idx] = res
+            status = res.get("status")
+            tally[status if status in tally else STATUS_ERROR] += 1
+            reused += 1 if res.get("reused") else 0
+            cached += 1 if res.get("cached") else 0
+            progress.progress(done / total, text=f"Confronto {done}/{total} repository...")
+            tally_box.markdown(
+                f"✅ Allineati: **{tally[STATUS_ALIGNED]}** · ⚠️ Divergenti: **{tally[STATUS_DIVERGENT]}** · "
+                f"❌ Errori: **{tally[STATUS_ERROR]}**"
+                + (f" · ♻️ Invariati (riusati): **{reused}**" if reused else "")
+                + (f" · 🗄️ Dalla cache di processo: **{cached}**" if cached else "")
             )
+            # Tabella ridisegnata al massimo due volte al secondo (e alla fine), non a ogni repo
+            now = time.monotonic()
+            if now - last_render >= 0.5 or done == total:
+                last_render = now
+                table_box.dataframe(
+                    [summary_row(r) for r in diff_results if r is not None],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+        progress.empty()
+        table_box.empty()
         st.session_state[SESSION_DIFF_RESULTS] = diff_results
-        st.success("Confronto completato.")
+        st.session_state[SESSION_RUN_INFO] = {
+            "repos": total,
+            "source": {"ref_type": source_ref_type, "value": src_value},
+            "target": {"ref_type": target_ref_type, "value": tgt_value},
+            "max_workers": int(max_workers),
+            "quick_mode": bool(quick_mode),
+            "wall_sec": round(time.monotonic() - run_started, 3),
+            "aligned": tally[STATUS_ALIGNED],
+            "divergent": tally[STATUS_DIVERGENT],
+            "errors": tally[STATUS_ERROR],
+            "reused": reused,
+            "cached": cached,
+        }
+        st.success("Confronto completato." + (f" {reused} repo invariati riusati dal confronto precedente." if reused else ""))
+
+    render_matrix_section(st.session_state.get(SESSION_CLIENT), selected_repos, config, int(max_workers))
 
     # ----- Dashboard risultati -----
     diff_results = st.session_state.get(SESSION_DIFF_RESULTS)
     if not diff_results:
         st.info("Esegui un confronto per vedere i risultati.")
         if st.button("Salva configurazione (senza PAT)"):
-            save_config({
-                "base_url": base_url,
-                "organization": org,
-                "project": project,
-                "username": username,
-                "selected_repo_ids": list(selected_ids),
-                "source": st.session_state.get(SESSION_SOURCE),
-                "target": st.session_state.get(SESSION_TARGET),
-            })
+            save_config(current_config(base_url, org, project, username, max_workers, quick_mode))
             st.success("Configurazione salvata in config.json.")
         return
 
-    dash_title, dash_filter = st.columns([3, 1])
-    with dash_title:
-        st.subheader("Dashboard risultati")
-    with dash_filter:
-        show_only_divergent = st.checkbox("Mostra solo divergenti", value=False, key="filter_div")
-
-    rows = diff_results
-    if show_only_divergent:
-        rows = [r for r in rows if r.get("status") == STATUS_DIVERGENT]
-
-    def status_icon(s: str):
-        if s == STATUS_ALIGNED:
-            return "✅ ALLINEATO"
-        if s == STATUS_DIVERGENT:
-            return "⚠️ DIVERGENTE"
-        return "❌ ERRORE"
-
-    for r in rows:
-        with st.expander(f"{status_icon(r.get('status', ''))} — {r.get('repo_name', '')}"):
-            st.markdown(f"**Stato:** {status_icon(r.get('status', ''))}")
-            st.markdown(f"**#Commit diff:** {r.get('commit_count', 0)} | **#File diff:** {r.get('file_count', 0)}")
-            src_commit = r.get("source_commit") or ""
-            tgt_commit = r.get("target_commit") or ""
-            source_ref = r.get("source_ref", "")
-            target_ref = r.get("target_ref", "")
-
-            def _clean(s: str) -> str:
-                if not s:
-                    return ""
-                s = s.strip().rstrip(" -=|")
-                return s
-
-            def _fmt_date(iso_date: str) -> str:
-                if not iso_date:
-                    return ""
-                try:
-                    from datetime import datetime
-                    dt = datetime.fromisoformat(iso_date.replace("Z", "+00:00"))
-                    return dt.strftime("%d/%m/%Y %H:%M")
-                except Exception:
-                    return iso_date[:19] if len(iso_date) >= 19 else iso_date
-
-            src_msg = _clean(r.get("source_commit_message") or "")
-            src_auth = _clean(r.get("source_commit_author") or "")
-            src_date = _fmt_date(r.get("source_commit_date") or "")
-            tgt_msg = _clean(r.get("target_commit_message") or "")
-            tgt_auth = _clean(r.get("target_commit_author") or "")
-            tgt_date = _fmt_date(r.get("target_commit_date") or "")
-            c1, c2 = st.columns(2)
-            with c1:
-                st.markdown("**SOURCE**")
-                if source_ref:
-                    st.caption(f"Ref: `{source_ref}`")
-                if src_commit:
-                    st.caption(f"Commit: `{src_commit}`" + (f" — *{src_auth}*" if src_auth else ""))
-                if src_date:
-                    st.caption(f"📅 {src_date}")
-                st.text(src_msg or "(nessun messaggio)")
-            with c2:
-                st.markdown("**TARGET**")
-                if target_ref:
-                    st.caption(f"Ref: `{target_ref}`")
-                if tgt_commit:
-                    st.caption(f"Commit: `{tgt_commit}`" + (f" — *{tgt_auth}*" if tgt_auth else ""))
-                if tgt_date:
-                    st.caption(f"📅 {tgt_date}")
-                st.text(tgt_msg or "(nessun messaggio)")
-            st.divider()
-            if r.get("note"):
-                st.caption(r["note"])
-
-            commits = r.get("commits") or []
-            if commits:
-                with st.expander(f"📋 Commit (SOURCE non in TARGET) ({len(commits)})", expanded=False):
-                    for i, c in enumerate(commits):
-                        raw_msg = c.get("comment") or ""
-                        msg = _clean(raw_msg) or "(nessun messaggio)"
-                        commit_id = (c.get("commitId") or "")[:7]
-                        auth = c.get("author")
-                        author = auth.get("name", "") if isinstance(auth, dict) else (auth or "")
-                        author = _clean(author)
-                        raw_date = c.get("date") or ""
-                        date_str = _fmt_date(raw_date) if raw_date else ""
-                        with st.container():
-                            line = f"`{commit_id}`"
-                            if author:
-                                line += f" — *{author}*"
-                            if date_str:
-                                line += f" · 📅 {date_str}"
-                            st.caption(line)
-                            st.text(msg)
-                            if i < len(commits) - 1:
-                                st.divider()
-
-            files = r.get("files") or []
-            if files:
-                with st.expander(f"📁 File modificati ({len(files)})", expanded=False):
-                    st.text("\n".join(files[:100]))
-
-            repo_id = r.get("repo_id")
-            repo_name = r.get("repo_name", "")
-            if repo_id and org and project:
-                # Link alla compare (cloud o on‑prem)
-                t_ref, s_ref = r.get("target_ref", ""), r.get("source_ref", "")
-                web_base = (base_url.strip().rstrip("/") or "https://dev.azure.com")
-                compare_url = f"{web_base}/{org}/{project}/_git/{repo_name}/branchCompare?baseVersion={t_ref}&targetVersion={s_ref}&_a=commits"
-                st.markdown(f"[Apri Compare in Azure DevOps]({compare_url})")
-
-    # Summary table
-    st.markdown("---")
-    st.markdown("**Riepilogo**")
-    summary = [
-        {"Repo": r.get("repo_name"), "Stato": status_icon(r.get("status", "")), "#Commit diff": r.get("commit_count", 0), "#File diff": r.get("file_count", 0), "SourceRef": r.get("source_ref", ""), "TargetRef": r.get("target_ref", ""), "Note": r.get("note", "")}
-        for r in diff_results
-    ]
-    st.dataframe(summary, use_container_width=True, hide_index=True)
+    render_results_dashboard(diff_results, base_url, org, project)
+
+    with st.expander("Cache commit/diff", expanded=False):
+        stats = get_commit_cache().stats()
+        st.caption(
+            f"Hit: **{stats['hits']}** · Miss: **{stats['misses']}** · "
+            f"Hit rate: **{stats['hit_rate']:.0%}** · Voci: **{stats['entries']}** · "
+            f"Dimensione: **{stats['size_bytes'] / (1024 * 1024):.1f}** / {stats['max_bytes'] / (1024 * 1024):.0f} MB"
+        )
+        if stats["by_kind"]:
+            st.dataframe(
+                [{"Tipo": k, "Hit": v["hits"], "Miss": v["misses"]} for k, v in stats["by_kind"].items()],
+                use_container_width=True,
+                hide_index=True,
+            )
+        if st.button("Svuota cache", key="clear_commit_cache"):
+            get_commit_cache().clear()
+            st.rerun()
+
+    diag_client = st.session_state.get(SESSION_CLIENT)
+    if diag_client:
+        with st.expander("Diagnostica", expanded=False):
+            report = {
+                "run": st.session_state.get(SESSION_RUN_INFO),
+                "requests": diag_client.metrics.report(),
+                "scheduler": diag_client.scheduler.stats(),
+                "transport": diag_client.transport.snapshot(),
+                "cache": get_commit_cache().stats(),
+                "shared_cache": diag_client.shared.stats() if diag_client.shared is not None else None,
+            }
+            total_req = report["requests"]["total"]
+            run_info = report["run"] or {}
+            shared = report["shared_cache"]
+            st.caption(
+                f"Durata confronto: **{run_info.get('wall_sec', 0):.1f} s** · Richieste: **{total_req['requests']}** · "
+                f"Retry: **{total_req['retries']}** · Throttling: **{total_req['throttled']}** · "
+                f"Fallback api-version sprecati: **{total_req['wasted_fallbacks']}** · "
+                f"Ricevuti: **{total_req['bytes'] / (1024 * 1024):.2f} MB** · "
+                f"Latenza media: **{total_req['latency_ms']['mean'] or 0:.0f} ms**"
+            )
+            transport = report["transport"]
+            if transport["requests"]:
+                st.caption(
+                    f"Connessioni: **{transport['connections_opened']}** aperte (handshake) · "
+                    f"richieste su connessioni riusate **{transport['reuse_ratio']:.0%}** · "
+                    f"scartate a pool pieno **{transport['discarded']}**"
+                )
+            if shared:
+                # Cumulativi dall'avvio del server, per tutte le sessioni
+                st.caption(
+                    f"Cache condivisa tra sessioni: **{shared['entries']}** voci · hit **{shared['hits']}** · "
+                    f"richieste in volo condivise **{shared['coalesced']}**"
+                )
+            if report["requests"]["by_endpoint"]:
+                st.dataframe(
+                    [diagnostics_row(e) for e in report["requests"]["by_endpoint"]],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            st.download_button(
+                "Scarica report JSON",
+                data=json.dumps(report, indent=2, ensure_ascii=False),
+                file_name="gitsnap_diagnostica.json",
+                mime="application/json",
+                key="download_diagnostics",
+            )
+            tracer = diag_client.tracer
+            if tracer is not None and len(tracer):
+                st.markdown("**Fasi** (tempo esclusivo = senza le sotto-fasi)")
+                st.dataframe(
+                    [phase_row(p) for p in tracer.summary()],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+                slow = tracer.slowest("repo", limit=10)
+                if slow:
+                    st.markdown("**Repo più lenti**")
+                    st.dataframe(
+                        [{"Repo": s.get("repo"), "Durata ms": s["duration_ms"], "Stato": s.get("status")} for s in slow],
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+                st.download_button(
+                    "Scarica trace (Chrome)",
+                    data=json.dumps(tracer.to_chrome_trace()),
+                    file_name="gitsnap_trace.json",
+                    mime="application/json",
+                    key="download_trace",
+                    help="Da aprire con chrome://tracing, https://ui.perfetto.dev o speedscope.",
+                )
 
     if st.button("Salva configurazione (senza PAT)"):
-        save_config({
-            "base_url": base_url,
-            "organization": org,
-            "project": project,
-            "username": username,
-            "selected_repo_ids": list(st.session_state.get(SESSION_SELECTED_REPOS) or set()),
-            "source": st.session_state.get(SESSION_SOURCE),
-            "target": st.session_state.get(SESSION_TARGET),
-        })
+        save_config(current_config(base_url, org, project, username, max_workers, quick_mode))
         st.success("Configurazione salvata in config.json.")
 
     st.divider()
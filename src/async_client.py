@@ -0,0 +1,534 @@
+"""
+Client Azure DevOps asincrono (asyncio + httpx) per carichi con migliaia di piccole richieste refs/commits:
+stessa superficie di AzureDevOpsClient per gli endpoint del confronto, stessi errori (AzureDevOpsClientError
+con status_code), stessa mappa api-version per server, stesse metriche e stessa cache commit/diff.
+- connessioni keep-alive httpx e un AsyncRequestScheduler (AIMD, come lo scheduler del client sincrono)
+  limitano le richieste in volo: centinaia con un solo thread, meno se il server rallenta;
+- 429/503: il limite si dimezza, Retry-After / X-RateLimit-* sospendono tutte le richieste del client,
+  altrimenti backoff con jitter;
+- la negoziazione dell'api-version di una famiglia avviene una sola volta anche con molte richieste in parallelo;
+- http2=True: richieste multiplexate su una sola connessione per i server che lo supportano (ALPN su TLS;
+  richiede il pacchetto h2), altrimenti si resta su HTTP/1.1.
+httpx è una dipendenza opzionale, richiesta solo da questo modulo (pip install httpx).
+"""
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Optional, Union
+
+try:
+    import httpx
+    # httpx importa httpcore (e i backend async) alla creazione del primo client: così il costo è all'import
+    import httpcore  # noqa: F401
+except ImportError:  # dipendenza opzionale: solo per il client asincrono
+    httpx = None
+
+from api_versions import ApiVersionMap
+from http_transport import CONNECT_TIMEOUT_SEC, READ_TIMEOUT_SEC
+from azure_devops_client import (
+    COMMITS_BATCH_SIZE,
+    COMMITS_PAGE_SIZE,
+    DEFAULT_API_VERSIONS,
+    DEFAULT_BASE,
+    DIFF_PAGE_SIZE,
+    FAMILY_API_VERSIONS,
+    MAX_RETRIES,
+    MAX_THROTTLE_RETRIES,
+    RETRY_BACKOFF_SEC,
+    THROTTLE_STATUS_CODES,
+    AzureDevOpsClientError,
+    build_api_url,
+    commits_compare_params,
+    commits_params,
+    diffs_params,
+    error_for_status,
+    is_full_sha,
+    is_version_error,
+    project_id_from_repos,
+    refs_from_response,
+    refs_params,
+)
+from request_metrics import RequestMetrics
+from request_scheduler import (
+    DEFAULT_ASYNC_MAX_IN_FLIGHT,
+    AsyncRequestScheduler,
+    jittered_backoff,
+    retry_delay_from_headers,
+)
+
+if TYPE_CHECKING:
+    from commit_cache import CommitCache
+
+logger = logging.getLogger(__name__)
+
+# Connessioni per pool httpx: la gestione del pool costa O(connessioni²) per richiesta, quindi con molte
+# richieste in volo si usano più pool piccoli (assegnati a rotazione) invece di uno grande; i pool
+# condividono un solo contesto SSL (crearne uno per pool costa decine di ms ciascuno all'avvio)
+CONNECTIONS_PER_POOL = 8
+
+
+def httpx_available() -> bool:
+    return httpx is not None
+
+
+class AsyncAzureDevOpsClient:
+    """
+    Versione asincrona di AzureDevOpsClient. Da usare in un solo event loop, come context manager:
+
+        async with AsyncAzureDevOpsClient(org, project, pat) as client:
+            repos = await client.list_repositories()
+    """
+
+    def __init__(
+        self,
+        organization: str,
+        project: str,
+        pat: str,
+        username: Optional[str] = None,
+        base_url: Optional[str] = None,
+        cache: Optional["CommitCache"] = None,
+        api_versions: Optional[ApiVersionMap] = None,
+        max_in_flight: int = DEFAULT_ASYNC_MAX_IN_FLIGHT,
+        connect_timeout: float = CONNECT_TIMEOUT_SEC,
+        read_timeout: float = READ_TIMEOUT_SEC,
+        verify: Union[bool, str] = True,
+        http2: bool = False,
+    ):
+        if httpx is None:
+            raise ImportError("Il client asincrono richiede httpx: pip install httpx")
+        self.organization = organization.strip()
+        self.project = project.strip()
+        self.pat = pat
+        self.username = username or ""
+        self.base_url = (base_url or DEFAULT_BASE).rstrip("/")
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.http2 = http2
+        # HTTP/2: un solo pool, le richieste diventano stream della stessa connessione
+        pools = 1 if http2 else -(-self.max_in_flight // CONNECTIONS_PER_POOL)
+        per_pool = -(-self.max_in_flight // pools)
+        ssl_context = httpx.create_ssl_context(verify=verify)
+        self._pools = [
+            httpx.AsyncClient(
+                auth=(self.username, self.pat),
+                headers={"Accept": "application/json", "Content-Type": "application/json"},
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=per_pool, max_keepalive_connections=per_pool),
+                verify=ssl_context,
+                http2=http2,
+            )
+            for _ in range(pools)
+        ]
+        self._next_pool = 0
+        self.scheduler = AsyncRequestScheduler(self.max_in_flight)
+        self._project_id: Optional[str] = None
+        self.cache = cache
+        self._api_versions = api_versions if api_versions is not None else ApiVersionMap()
+        self._failed_versions: set[tuple[str, str]] = set()
+        self._negotiation_locks: dict[str, asyncio.Lock] = {}
+        self.metrics = RequestMetrics()
+        # Risposte per versione del protocollo (es. HTTP/1.1, HTTP/2): verifica di http2=True
+        self.http_versions: dict[str, int] = {}
+        # Il tracing per span è per thread: con il client asincrono resta spento
+        self.tracer = None
+
+    @property
+    def server_key(self) -> str:
+        """Identifica il server/organization nelle chiavi di cache (come AzureDevOpsClient)."""
+        return f"{self.base_url}/{self.organization}"
+
+    async def __aenter__(self) -> "AsyncAzureDevOpsClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(pool.aclose() for pool in self._pools))
+
+    async def _cache_get(self, repository_id: str, kind: str, key: str) -> Optional[Any]:
+        """CommitCache (SQLite, bloccante) in un thread: l'event loop continua a servire le altre richieste."""
+        if self.cache is None:
+            return None
+        return await asyncio.to_thread(self.cache.get, self.server_key, repository_id, kind, key)
+
+    async def _cache_put(self, repository_id: str, kind: str, key: str, value: Any) -> None:
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, self.server_key, repository_id, kind, key, value)
+
+    async def _cache_get_many(self, repository_id: str, kind: str, keys: list[str]) -> list[Optional[Any]]:
+        """Più letture in un solo passaggio nel thread (es. i commit di un batch)."""
+        if self.cache is None or not keys:
+            return [None] * len(keys)
+        cache, server = self.cache, self.server_key
+        return await asyncio.to_thread(lambda: [cache.get(server, repository_id, kind, k) for k in keys])
+
+    async def _cache_put_many(self, repository_id: str, kind: str, items: list[tuple[str, Any]]) -> None:
+        if self.cache is None or not items:
+            return
+        cache, server = self.cache, self.server_key
+
+        def _put_all() -> None:
+            for key, value in items:
+                cache.put(server, repository_id, kind, key, value)
+
+        await asyncio.to_thread(_put_all)
+
+    def _url(self, path: str, query: Optional[dict] = None) -> str:
+        return build_api_url(self.base_url, self.organization, self._project_id or self.project, path, query)
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Optional[dict] = None,
+        family: str = "other",
+    ) -> Any:
+        """Come AzureDevOpsClient._request: retry su rete e throttling, metriche per tentativo."""
+        url = self._url(path, params)
+        api_version = (params or {}).get("api-version")
+        last_error: Optional[Exception] = None
+        network_failures = 0
+        throttle_retries = 0
+        while True:
+            resp = None
+            await self.scheduler.acquire()
+            pool = self._pools[self._next_pool]
+            self._next_pool = (self._next_pool + 1) % len(self._pools)
+            started = time.perf_counter()
+            try:
+                resp = await pool.request(method, url, json=json)
+            except httpx.HTTPError as e:
+                last_error = e
+            finally:
+                throttled = resp is not None and resp.status_code in THROTTLE_STATUS_CODES
+                self.scheduler.release(throttled=throttled, headers=resp.headers if resp is not None else None)
+            self.metrics.record(
+                family,
+                api_version,
+                resp.status_code if resp is not None else None,
+                time.perf_counter() - started,
+                len(resp.content or b"") if resp is not None else 0,
+            )
+
+            if resp is None:
+                network_failures += 1
+                if network_failures >= MAX_RETRIES:
+                    break
+                self.metrics.retry(family, api_version)
+                sleep_time = jittered_backoff(network_failures - 1, RETRY_BACKOFF_SEC)
+                logger.warning("Request failed, retry in %.1f s: %s", sleep_time, last_error)
+                await asyncio.sleep(sleep_time)
+                continue
+
+            if throttled:
+                throttle_retries += 1
+                if throttle_retries > MAX_THROTTLE_RETRIES:
+                    raise AzureDevOpsClientError(
+                        f"API error: {resp.status_code} (throttling, retry esauriti)",
+                        status_code=resp.status_code,
+                        response_text=resp.text,
+                    )
+                self.metrics.retry(family, api_version)
+                server_delay = retry_delay_from_headers(resp.headers)
+                if server_delay is None:
+                    sleep_time = jittered_backoff(throttle_retries - 1, RETRY_BACKOFF_SEC)
+                    logger.warning("HTTP %s, retry in %.1f s", resp.status_code, sleep_time)
+                    await asyncio.sleep(sleep_time)
+                else:
+                    # La pausa è già applicata dallo scheduler: acquire() attende per tutte le richieste
+                    logger.warning("HTTP %s, Retry-After %.1f s", resp.status_code, server_delay)
+                continue
+
+            self.http_versions[resp.http_version] = self.http_versions.get(resp.http_version, 0) + 1
+            error = error_for_status(resp.status_code, resp.text) if resp.status_code >= 400 else None
+            if error is not None:
+                raise error
+            return resp.json() if resp.content else None
+        raise AzureDevOpsClientError(
+            f"Request failed after {MAX_RETRIES} retries: {last_error}"
+        )
+
+    async def _request_versioned(
+        self,
+        family: str,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Optional[dict] = None,
+        accept: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Come AzureDevOpsClient._request_versioned; la negoziazione di una famiglia è serializzata."""
+        params = dict(params or {})
+        known = self._api_versions.get(self.server_key, family)
+        if known:
+            try:
+                return await self._request(
+                    method, path, params={**params, "api-version": known}, json=json, family=family
+                )
+            except AzureDevOpsClientError as e:
+                if not is_version_error(e):
+                    raise
+                self.metrics.wasted_fallback(family, known)
+                logger.info("api-version %s non più accettata per %s: nuova negoziazione", known, family)
+                self._api_versions.forget(self.server_key, family)
+                self._failed_versions.add((family, known))
+
+        lock = self._negotiation_locks.setdefault(family, asyncio.Lock())
+        async with lock:
+            known = self._api_versions.get(self.server_key, family)
+            if not known:
+                return await self._negotiate(family, method, path, params, json, accept)
+        # Un'altra richiesta ha appena negoziato la versione: si usa quella, fuori dal lock
+        return await self._request(method, path, params={**params, "api-version": known}, json=json, family=family)
+
+    async def _negotiate(
+        self,
+        family: str,
+        method: str,
+        path: str,
+        params: dict,
+        json: Optional[dict],
+        accept: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        """Prova le api-version candidate in ordine e memorizza la prima che risponde (con il lock della famiglia)."""
+        last_error: Optional[AzureDevOpsClientError] = None
+        rejected: list[tuple[str, Any]] = []
+        for api_ver in FAMILY_API_VERSIONS.get(family, DEFAULT_API_VERSIONS):
+            if (family, api_ver) in self._failed_versions:
+                continue
+            try:
+                data = await self._request(
+                    method, path, params={**params, "api-version": api_ver}, json=json, family=family
+                )
+            except AzureDevOpsClientError as e:
+                if not is_version_error(e):
+                    raise
+                last_error = e
+                self._failed_versions.add((family, api_ver))
+                self.metrics.wasted_fallback(family, api_ver)
+                continue
+            if accept is not None and not accept(data):
+                rejected.append((api_ver, data))
+                continue
+            for wasted_ver, _ in rejected:
+                self.metrics.wasted_fallback(family, wasted_ver)
+            logger.info("api-version %s per %s su %s", api_ver, family, self.base_url)
+            self._api_versions.set(self.server_key, family, api_ver)
+            return data
+        if rejected:
+            return rejected[0][1]
+        if last_error is not None:
+            raise last_error
+        raise AzureDevOpsClientError(f"Nessuna api-version utilizzabile per {family}.")
+
+    async def list_repositories(self) -> list[dict]:
+        """List all Git repositories in the project. API: Git Repositories List."""
+        try:
+            data = await self._request_versioned("repositories", "GET", "/git/repositories")
+        except AzureDevOpsClientError:
+            data = None
+        if not data or "value" not in data:
+            return []
+        repos = data["value"]
+        if not self._project_id:
+            self._project_id = project_id_from_repos(repos)
+        return repos
+
+    async def get_refs(
+        self,
+        repository_id: str,
+        filter_prefix: Optional[str] = None,
+        top: int = 1000,
+        peel_tags: bool = False,
+    ) -> list[dict]:
+        """List refs (branches/tags), come AzureDevOpsClient.get_refs."""
+        path = f"/git/repositories/{repository_id}/refs"
+        try:
+            data = await self._request_versioned(
+                "refs", "GET", path,
+                params=refs_params(filter_prefix, top, peel_tags),
+                accept=lambda d: refs_from_response(d) is not None,
+            )
+        except AzureDevOpsClientError:
+            return []
+        return refs_from_response(data) or []
+
+    async def get_commits(
+        self,
+        repository_id: str,
+        search_criteria: Optional[dict] = None,
+        top: int = 1,
+    ) -> list[dict]:
+        path = f"/git/repositories/{repository_id}/commits"
+        data = await self._request_versioned("commits", "GET", path, params=commits_params(search_criteria, top))
+        if not data or "value" not in data:
+            return []
+        return data["value"]
+
+    async def get_commit_by_id(self, repository_id: str, commit_id: str) -> Optional[dict]:
+        """Restituisce un singolo commit per ID (message, author, ecc.) o None."""
+        if not commit_id:
+            return None
+        cacheable = is_full_sha(commit_id)
+        if cacheable:
+            cached = await self._cache_get(repository_id, "commit", commit_id.lower())
+            if cached is not None:
+                return cached
+        path = f"/git/repositories/{repository_id}/commits"
+        try:
+            data = await self._request_versioned(
+                "commits", "GET", path,
+                params={"$top": 1, "searchCriteria.ids": commit_id},
+                accept=lambda d: bool(d and d.get("value")),
+            )
+        except AzureDevOpsClientError:
+            return None
+        if not data or not data.get("value"):
+            return None
+        commit = data["value"][0]
+        if cacheable:
+            await self._cache_put(repository_id, "commit", commit_id.lower(), commit)
+        return commit
+
+    async def get_commits_batch(self, repository_id: str, commit_ids: list[str]) -> list[dict]:
+        """Commit per lista di ID (POST commitsbatch), a blocchi di COMMITS_BATCH_SIZE, con cache."""
+        path = f"/git/repositories/{repository_id}/commitsbatch"
+        commits: list[dict] = []
+        ids = []
+        wanted = [c for c in dict.fromkeys(commit_ids) if c]
+        full = [c for c in wanted if is_full_sha(c)]
+        found = dict(zip(full, await self._cache_get_many(repository_id, "commit", [c.lower() for c in full])))
+        for c in wanted:
+            cached = found.get(c)
+            if cached is not None:
+                commits.append(cached)
+            else:
+                ids.append(c)
+        for start in range(0, len(ids), COMMITS_BATCH_SIZE):
+            chunk = ids[start:start + COMMITS_BATCH_SIZE]
+            data = await self._request_versioned(
+                "commitsbatch", "POST", path, json={"ids": chunk, "$top": len(chunk)}
+            )
+            if data and isinstance(data.get("value"), list):
+                await self._cache_put_many(
+                    repository_id,
+                    "commit",
+                    [(c["commitId"].lower(), c) for c in data["value"] if is_full_sha(c.get("commitId"))],
+                )
+                commits.extend(data["value"])
+        return commits
+
+    async def get_commits_compare(
+        self,
+        repository_id: str,
+        source_version: str,
+        target_version: str,
+        source_version_type: str = "commit",
+        target_version_type: str = "commit",
+        top: int = 20,
+        skip: int = 0,
+    ) -> list[dict]:
+        """Commit in source non in target (itemVersion=source, compareVersion=target)."""
+        params, cache_key = commits_compare_params(
+            source_version, target_version, source_version_type, target_version_type, top, skip
+        )
+        if cache_key:
+            cached = await self._cache_get(repository_id, "commits_compare", cache_key)
+            if cached is not None:
+                return cached
+        path = f"/git/repositories/{repository_id}/commits"
+        data = await self._request_versioned("commits", "GET", path, params=params)
+        if not data or "value" not in data:
+            return []
+        if cache_key:
+            await self._cache_put(repository_id, "commits_compare", cache_key, data["value"])
+        return data["value"]
+
+    async def iter_commits_compare(
+        self,
+        repository_id: str,
+        source_version: str,
+        target_version: str,
+        source_version_type: str = "commit",
+        target_version_type: str = "commit",
+        page_size: int = COMMITS_PAGE_SIZE,
+    ) -> AsyncIterator[dict]:
+        """Tutti i commit in source non in target, una pagina alla volta."""
+        skip = 0
+        while True:
+            page = await self.get_commits_compare(
+                repository_id,
+                source_version=source_version,
+                target_version=target_version,
+                source_version_type=source_version_type,
+                target_version_type=target_version_type,
+                top=page_size,
+                skip=skip,
+            )
+            for c in page:
+                yield c
+            if len(page) < page_size:
+                return
+            skip += len(page)
+
+    async def get_annotated_tag(self, repository_id: str, object_id: str) -> Optional[dict]:
+        """Get annotated tag by object ID (for tag date)."""
+        path = f"/git/repositories/{repository_id}/annotatedtags/{object_id}"
+        try:
+            return await self._request_versioned("annotatedtags", "GET", path)
+        except AzureDevOpsClientError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    async def get_diffs_commits(
+        self,
+        repository_id: str,
+        base_version: str,
+        target_version: str,
+        base_version_type: Optional[str] = None,
+        target_version_type: Optional[str] = None,
+        top: int = 100,
+        skip: int = 0,
+    ) -> dict:
+        """Diff base..target (merge base e change); in cache tra SHA completi."""
+        params, cache_key = diffs_params(base_version, target_version, base_version_type, target_version_type, top, skip)
+        if cache_key:
+            cached = await self._cache_get(repository_id, "diff", cache_key)
+            if cached is not None:
+                return cached
+        path = f"/git/repositories/{repository_id}/diffs/commits"
+        data = await self._request_versioned("diffs", "GET", path, params=params) or {}
+        if cache_key and data:
+            await self._cache_put(repository_id, "diff", cache_key, data)
+        return data
+
+    async def iter_diff_changes(
+        self,
+        repository_id: str,
+        base_version: str,
+        target_version: str,
+        base_version_type: Optional[str] = None,
+        target_version_type: Optional[str] = None,
+        page_size: int = DIFF_PAGE_SIZE,
+        skip: int = 0,
+    ) -> AsyncIterator[dict]:
+        """Tutte le change del diff base..target, una pagina alla volta a partire da skip."""
+        while True:
+            page = await self.get_diffs_commits(
+                repository_id,
+                base_version=base_version,
+                target_version=target_version,
+                base_version_type=base_version_type,
+                target_version_type=target_version_type,
+                top=page_size,
+                skip=skip,
+            )
+            changes = page.get("changes") or []
+            for ch in changes:
+                yield ch
+            if len(changes) < page_size or page.get("allChangesIncluded"):
+                return
+            skip += len(changes)
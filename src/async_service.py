@@ -0,0 +1,363 @@
+"""
+Risoluzione dei ref e confronto SOURCE vs TARGET sul client asincrono (AsyncAzureDevOpsClient), per
+progetti con centinaia di repo: tutte le richieste del confronto sono coroutine in un solo thread,
+limitate dallo scheduler AIMD del client invece che da un pool di thread.
+La logica è quella sincrona di ref_resolver e diff_service (stesse funzioni pure, stessi risultati);
+qui cambiano solo le chiamate al server. Non coperti dal percorso asincrono: tracing per span, cache di
+processo condivisa tra sessioni, riuso del confronto precedente e strategia branch_stats.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Iterable, Optional
+
+from async_client import AsyncAzureDevOpsClient
+from azure_devops_client import DIFF_PAGE_SIZE, AzureDevOpsClientError
+from diff_service import (
+    STATUS_ALIGNED,
+    STATUS_ERROR,
+    apply_commit_metadata,
+    change_path,
+    classify_diff,
+    compact_commit,
+    error_result,
+    new_result,
+)
+from ref_resolver import (
+    REF_TYPE_BRANCH,
+    apply_tag_batch,
+    check_ref_value,
+    latest_tag,
+    legacy_tag_commit,
+    legacy_tag_criteria,
+    matching_tags,
+    plan_tag_commits,
+    select_branch,
+    tag_cache_key,
+    tag_cache_put,
+    tag_results,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRefSnapshot:
+    """
+    Come RefSnapshot: heads/tags di ogni repo scaricati una sola volta per run (le richieste contemporanee
+    sulla stessa lista attendono lo stesso task) e commit già ricevuti, per il dettaglio SOURCE/TARGET.
+    """
+
+    def __init__(self, client: AsyncAzureDevOpsClient):
+        self._client = client
+        self._refs: dict[tuple[str, str], asyncio.Task] = {}
+        self._commits: dict[tuple[str, str], dict] = {}
+
+    async def _get(self, repository_id: str, filter_prefix: str) -> list[dict]:
+        key = (repository_id, filter_prefix)
+        task = self._refs.get(key)
+        if task is None:
+            task = self._refs[key] = asyncio.ensure_future(
+                self._client.get_refs(
+                    repository_id,
+                    filter_prefix=filter_prefix,
+                    top=1000,
+                    peel_tags=(filter_prefix == "refs/tags/"),
+                )
+            )
+        return await task
+
+    async def heads(self, repository_id: str) -> list[dict]:
+        return await self._get(repository_id, "refs/heads/")
+
+    async def tags(self, repository_id: str) -> list[dict]:
+        return await self._get(repository_id, "refs/tags/")
+
+    def remember(self, repository_id: str, commits: Iterable[dict]) -> None:
+        for c in commits:
+            commit_id = (c or {}).get("commitId")
+            if commit_id and len(commit_id) == 40:
+                self._commits[(repository_id, commit_id.lower())] = c
+
+    async def get_commits(self, repository_id: str, commit_ids: Iterable[Optional[str]]) -> dict[str, dict]:
+        """Come CommitMetadata.get_many: memoria, poi un commitsbatch, poi un commit alla volta."""
+        wanted = list(dict.fromkeys(c.lower() for c in commit_ids if c))
+        found = {c: self._commits[(repository_id, c)] for c in wanted if (repository_id, c) in self._commits}
+        missing = [c for c in wanted if c not in found]
+        if not missing:
+            return found
+        try:
+            batch = await self._client.get_commits_batch(repository_id, missing)
+        except AzureDevOpsClientError as e:
+            logger.debug("commitsbatch non disponibile per repo %s: %s", repository_id, e)
+            batch = []
+        self.remember(repository_id, batch)
+        for c in batch:
+            commit_id = (c.get("commitId") or "").lower()
+            if commit_id in missing:
+                found[commit_id] = c
+        for commit_id in missing:
+            if commit_id in found:
+                continue
+            commit = await self._client.get_commit_by_id(repository_id, commit_id)
+            if commit:
+                found[commit_id] = commit
+                self.remember(repository_id, [commit])
+        return found
+
+
+async def _resolve_tag_commits_async(
+    client: AsyncAzureDevOpsClient,
+    repository_id: str,
+    matching: list[tuple[str, Optional[str], Optional[str]]],
+    snapshot: AsyncRefSnapshot,
+) -> list[tuple[str, str, str]]:
+    """Come ref_resolver._resolve_tag_commits; i tag rimasti per la via legacy si chiedono in parallelo."""
+    resolved, pending = plan_tag_commits(client, repository_id, matching)
+    if pending:
+        try:
+            batch = await client.get_commits_batch(repository_id, list(pending))
+        except AzureDevOpsClientError as e:
+            logger.debug("commitsbatch non disponibile per repo %s: %s", repository_id, e)
+            batch = []
+        snapshot.remember(repository_id, batch)
+        apply_tag_batch(client, repository_id, batch, resolved, pending)
+
+        async def _legacy(tag_name: str, obj_id: str) -> Optional[tuple[str, str]]:
+            try:
+                commits = await client.get_commits(
+                    repository_id, search_criteria=legacy_tag_criteria(tag_name), top=1
+                )
+            except AzureDevOpsClientError:
+                return obj_id, ""
+            return legacy_tag_commit(commits, obj_id)
+
+        leftovers = [tag for tags in pending.values() for tag in tags]
+        found_all = await asyncio.gather(*(_legacy(name, obj_id) for name, obj_id in leftovers))
+        for (tag_name, obj_id), found in zip(leftovers, found_all):
+            if not found:
+                continue
+            resolved[tag_name] = found
+            if found[1]:
+                tag_cache_put(tag_cache_key(client, repository_id, obj_id), *found)
+    return tag_results(matching, resolved)
+
+
+async def resolve_ref_entry_async(
+    client: AsyncAzureDevOpsClient,
+    repository_id: str,
+    ref_type: str,
+    ref_value: str,
+    snapshot: AsyncRefSnapshot,
+) -> dict:
+    """Come ref_resolver.resolve_ref_entry: { "commit_id", "display_ref", "error" }."""
+    ref_value = (ref_value or "").strip()
+    outcome = check_ref_value(ref_type, ref_value)
+    if outcome is None:
+        if ref_type == REF_TYPE_BRANCH:
+            outcome = select_branch(await snapshot.heads(repository_id), ref_value, repository_id)
+        else:
+            matching = matching_tags(await snapshot.tags(repository_id), ref_value)
+            if not matching:
+                outcome = None, None, f"No tags matching pattern: {ref_value}"
+            else:
+                tag_commits = await _resolve_tag_commits_async(client, repository_id, matching, snapshot)
+                outcome = latest_tag(tag_commits, ref_value)
+    commit_id, display_ref, error = outcome
+    return {"commit_id": commit_id, "display_ref": display_ref or ref_value, "error": error}
+
+
+async def _collect_diff_files_async(
+    client: AsyncAzureDevOpsClient,
+    repository_id: str,
+    source_commit: str,
+    target_commit: str,
+    first_page: dict,
+) -> tuple[list[str], bool]:
+    """Come diff_service._collect_diff_files, proseguendo dalla prima pagina già scaricata."""
+    paths = [p for p in (change_path(ch) for ch in first_page.get("changes") or []) if p]
+    first_count = len(first_page.get("changes") or [])
+    if first_count < DIFF_PAGE_SIZE or first_page.get("allChangesIncluded"):
+        return paths, True
+    try:
+        async for ch in client.iter_diff_changes(
+            repository_id,
+            base_version=target_commit,
+            target_version=source_commit,
+            base_version_type="commit",
+            target_version_type="commit",
+            page_size=DIFF_PAGE_SIZE,
+            skip=first_count,
+        ):
+            path = change_path(ch)
+            if path:
+                paths.append(path)
+    except AzureDevOpsClientError as e:
+        logger.warning("Lista file incompleta per repo %s: %s", repository_id, e)
+        return paths, False
+    return paths, True
+
+
+async def _fetch_ahead_commits_async(
+    client: AsyncAzureDevOpsClient,
+    repository_id: str,
+    source_commit: str,
+    target_commit: str,
+    snapshot: AsyncRefSnapshot,
+) -> list[dict]:
+    commits = []
+    try:
+        async for c in client.iter_commits_compare(
+            repository_id,
+            source_version=source_commit,
+            target_version=target_commit,
+            source_version_type="commit",
+            target_version_type="commit",
+        ):
+            if not commits:
+                snapshot.remember(repository_id, [c])
+            commits.append(compact_commit(c))
+    except AzureDevOpsClientError as e:
+        logger.warning("Lista commit incompleta per repo %s: %s", repository_id, e)
+    return commits
+
+
+async def get_diff_for_repo_async(
+    client: AsyncAzureDevOpsClient,
+    repository_id: str,
+    repo_name: str,
+    source_commit: str,
+    target_commit: str,
+    source_display: str,
+    target_display: str,
+    snapshot: AsyncRefSnapshot,
+    quick: bool = False,
+) -> dict[str, Any]:
+    """Come diff_service.get_diff_for_repo (fetch_commits sempre attivo)."""
+    result = new_result(
+        repository_id, repo_name, source_commit, target_commit, source_display, target_display, quick=quick
+    )
+    if source_commit == target_commit:
+        result["status"] = STATUS_ALIGNED
+        result["note"] = "Stesso commit"
+        return result
+
+    try:
+        diff = await client.get_diffs_commits(
+            repository_id,
+            base_version=target_commit,
+            target_version=source_commit,
+            base_version_type="commit",
+            target_version_type="commit",
+            top=1 if quick else DIFF_PAGE_SIZE,
+        )
+    except AzureDevOpsClientError as e:
+        result["note"] = e.message or str(e)
+        if e.status_code == 404:
+            result["note"] = "Ref non trovato o repository inaccessibile."
+        result["details_loaded"] = True
+        return result
+
+    if quick:
+        classify_diff(result, diff, quick)
+        return result
+
+    files, commits = await asyncio.gather(
+        _collect_diff_files_async(client, repository_id, source_commit, target_commit, diff),
+        _fetch_ahead_commits_async(client, repository_id, source_commit, target_commit, snapshot)
+        if (diff.get("aheadCount") or 0) > 0 else asyncio.sleep(0, result=[]),
+    )
+    classify_diff(result, diff, quick, files)
+    result["commits"] = commits
+    found = await snapshot.get_commits(repository_id, [source_commit, target_commit])
+    apply_commit_metadata(result, found, source_commit, target_commit)
+    return result
+
+
+async def compare_repo_async(
+    client: AsyncAzureDevOpsClient,
+    repo: dict,
+    source_ref_type: str,
+    source_value: str,
+    target_ref_type: str,
+    target_value: str,
+    snapshot: AsyncRefSnapshot,
+    quick: bool = False,
+) -> dict[str, Any]:
+    """Come diff_service._compare_repo: gli errori restano confinati nel risultato del repo."""
+    repo_id = repo.get("id") or repo.get("name")
+    repo_name = repo.get("name", str(repo_id))
+    if not repo_id:
+        return error_result(repo_id, repo_name, "Repo senza id")
+    try:
+        src, tgt = await asyncio.gather(
+            resolve_ref_entry_async(client, repo_id, source_ref_type, source_value, snapshot),
+            resolve_ref_entry_async(client, repo_id, target_ref_type, target_value, snapshot),
+        )
+    except AzureDevOpsClientError as e:
+        return error_result(repo_id, repo_name, e.message or str(e))
+
+    source_ref = src.get("display_ref") or ""
+    target_ref = tgt.get("display_ref") or ""
+    for label, entry in (("SOURCE", src), ("TARGET", tgt)):
+        if entry.get("error"):
+            return error_result(
+                repo_id, repo_name, f"{label}: {entry['error']}",
+                source_ref, target_ref, src.get("commit_id"), tgt.get("commit_id"),
+            )
+    source_commit = src.get("commit_id")
+    target_commit = tgt.get("commit_id")
+    if not source_commit or not target_commit:
+        return error_result(repo_id, repo_name, "Ref non risolto", source_ref, target_ref, source_commit, target_commit)
+
+    try:
+        result = await get_diff_for_repo_async(
+            client, repo_id, repo_name, source_commit, target_commit,
+            source_ref or source_commit[:7], target_ref or target_commit[:7], snapshot, quick=quick,
+        )
+    except AzureDevOpsClientError as e:
+        logger.warning("Confronto fallito per repo %s: %s", repo_name, e)
+        return error_result(
+            repo_id, repo_name, e.message or str(e), source_ref, target_ref, source_commit, target_commit,
+        )
+    if result.get("status") != STATUS_ERROR:
+        result["ref_spec"] = [source_ref_type, source_value, target_ref_type, target_value]
+    return result
+
+
+async def iter_compare_repos_async(
+    client: AsyncAzureDevOpsClient,
+    repositories: list[dict],
+    source_ref_type: str,
+    source_value: str,
+    target_ref_type: str,
+    target_value: str,
+    snapshot: Optional[AsyncRefSnapshot] = None,
+    quick: bool = False,
+    max_repos: Optional[int] = None,
+) -> AsyncIterator[tuple[int, dict[str, Any]]]:
+    """
+    Come diff_service.iter_compare_repos: (indice in repositories, risultato) nell'ordine di completamento.
+    Al più max_repos repo in corso (default 2 * client.max_in_flight: abbastanza da tenere pieni gli slot
+    dello scheduler), avviati nell'ordine dato: con tutti i repo avviati insieme il primo risultato
+    arriverebbe solo dopo la prima richiesta di ogni repo.
+    Le richieste in volo restano limitate dallo scheduler del client.
+    Se il consumatore si ferma, i repo non ancora finiti vengono annullati.
+    """
+    if snapshot is None:
+        snapshot = AsyncRefSnapshot(client)
+    window = asyncio.Semaphore(max_repos or 2 * client.max_in_flight)
+
+    async def _run(index: int, repo: dict) -> tuple[int, dict[str, Any]]:
+        async with window:
+            return index, await compare_repo_async(
+                client, repo, source_ref_type, source_value, target_ref_type, target_value, snapshot, quick
+            )
+
+    tasks = [asyncio.ensure_future(_run(i, repo)) for i, repo in enumerate(repositories)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
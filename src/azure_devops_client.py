@@ -4,10 +4,33 @@ No repository cloning; all operations via REST only.
 """
 
 import logging
+import re
 import time
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional, Union
 import requests
-from requests.auth import HTTPBasicAuth
+
+from api_versions import ApiVersionMap
+from http_transport import (
+    CONNECT_TIMEOUT_SEC,
+    READ_TIMEOUT_SEC,
+    TransportStats,
+    build_session,
+    mount_adapter,
+    pool_size_for,
+    verify_argument,
+)
+from request_metrics import RequestMetrics
+from shared_cache import SharedCache, credentials_scope, process_cache
+from tracing import Tracer, span
+from request_scheduler import (
+    DEFAULT_MAX_IN_FLIGHT,
+    RequestScheduler,
+    jittered_backoff,
+    retry_delay_from_headers,
+)
+
+if TYPE_CHECKING:
+    from commit_cache import CommitCache
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +40,195 @@ API_VERSION_ONPREM = "5.0"
 DEFAULT_BASE = "https://dev.azure.com"
 MAX_RETRIES = 3
 RETRY_BACKOFF_SEC = 2
+# Throttling (429) e servizio temporaneamente non disponibile (503): si ritenta rispettando Retry-After
+THROTTLE_STATUS_CODES = (429, 503)
+MAX_THROTTLE_RETRIES = 6
+# Numero massimo di commit ID per singola chiamata commitsbatch
+COMMITS_BATCH_SIZE = 100
+# Dimensione pagina per gli iteratori paginati (diffs/commits e commits compare)
+DIFF_PAGE_SIZE = 100
+COMMITS_PAGE_SIZE = 100
+
+# Ordine di prova delle api-version finché la mappa del server non è nota
+DEFAULT_API_VERSIONS = (API_VERSION, "6.0", API_VERSION_ONPREM)
+FAMILY_API_VERSIONS = {
+    # discovery storica: dalla più conservativa
+    "repositories": (API_VERSION_ONPREM, "6.0", API_VERSION),
+}
+
+_FULL_SHA_RE = re.compile(r"^[0-9a-fA-F]{40}$")
+
+
+def is_full_sha(value: Optional[str]) -> bool:
+    """Solo SHA completi sono chiavi di cache sicure (immutabili, non ambigui)."""
+    return bool(value) and bool(_FULL_SHA_RE.match(value))
+
+
+def refs_from_response(data: Any) -> Optional[list]:
+    """Lista refs da 'value' (o 'refs' su alcuni TFS), None se la risposta non la contiene."""
+    if not data or not isinstance(data, dict):
+        return None
+    refs = data.get("value")
+    if refs is None:
+        refs = data.get("refs")
+    return refs if isinstance(refs, list) else None
+
+
+# Eccezioni con cui Azure DevOps / TFS rifiuta l'api-version richiesta (typeKey nel body dell'errore)
+_VERSION_EXCEPTIONS = ("vssversionoutofrangeexception", "vssinvalidpreviewversionexception")
+
+
+def is_version_error(e: "AzureDevOpsClientError") -> bool:
+    """
+    api-version rifiutata dal server: 400 con VssVersionOutOfRangeException / VssInvalidPreviewVersionException
+    o con «api-version» nel testo. Un 404 non lo è mai, anche se il messaggio parla di versione
+    (es. TF401175 «version descriptor … could not be resolved» per un commit o un branch inesistente).
+    """
+    if e.status_code != 400:
+        return False
+    text = (e.response_text or "").lower()
+    return "api-version" in text or any(name in text for name in _VERSION_EXCEPTIONS)
+
+
+def _response_size(resp: Optional[requests.Response], stream: bool) -> int:
+    """Byte della risposta; in streaming il body non è ancora letto: si usa Content-Length."""
+    if resp is None:
+        return 0
+    if stream:
+        try:
+            return int(resp.headers.get("Content-Length") or 0)
+        except ValueError:
+            return 0
+    return len(resp.content or b"")
+
+
+def build_api_url(
+    base_url: str,
+    organization: str,
+    project_segment: Optional[str],
+    path: str,
+    query: Optional[dict] = None,
+) -> str:
+    """{base}/{org}/{project}/_apis{path}?query (condivisa con il client asincrono)."""
+    base = f"{base_url}/{organization}"
+    if project_segment:
+        base = f"{base}/{project_segment}"
+    url = f"{base}/_apis{path}"
+    if query:
+        from urllib.parse import urlencode
+        url = f"{url}?{urlencode(query)}"
+    return url
+
+
+def project_id_from_repos(repos: list) -> Optional[str]:
+    """Project GUID dal primo repo (alcuni TFS lo richiedono nel path di refs/commits/diffs)."""
+    proj = repos[0].get("project") if repos and isinstance(repos[0], dict) else None
+    if isinstance(proj, dict) and proj.get("id"):
+        return proj["id"]
+    return None
+
+
+def refs_params(filter_prefix: Optional[str], top: int, peel_tags: bool) -> dict:
+    """Parametri di refs: TFS/ADO Server accetta filter=heads/ o filter=tags/, non refs/heads/."""
+    filter_norm = None
+    if filter_prefix:
+        filter_norm = filter_prefix.strip()
+        if filter_norm.startswith("refs/"):
+            filter_norm = filter_norm[len("refs/"):]
+    params: dict[str, Any] = {"$top": top}
+    if filter_norm:
+        params["filter"] = filter_norm
+    if peel_tags:
+        params["peelTags"] = "true"
+    return params
+
+
+def commits_params(search_criteria: Optional[dict], top: int) -> dict:
+    params: dict[str, Any] = {"$top": top}
+    if search_criteria:
+        for k, v in search_criteria.items():
+            if v is not None:
+                key = k if k.startswith("searchCriteria.") else f"searchCriteria.{k}"
+                params[key] = v
+    return params
+
+
+def commits_compare_params(
+    source_version: str,
+    target_version: str,
+    source_version_type: str,
+    target_version_type: str,
+    top: int,
+    skip: int,
+) -> tuple[dict, Optional[str]]:
+    """(parametri, chiave di cache o None) per Get Commits con itemVersion=source, compareVersion=target."""
+    cache_key = None
+    if (
+        source_version_type == "commit" and target_version_type == "commit"
+        and is_full_sha(source_version) and is_full_sha(target_version)
+    ):
+        cache_key = f"{source_version.lower()}..{target_version.lower()}:{top}:{skip}"
+    params = {
+        "searchCriteria.itemVersion.version": source_version,
+        "searchCriteria.itemVersion.versionType": source_version_type,
+        "searchCriteria.compareVersion.version": target_version,
+        "searchCriteria.compareVersion.versionType": target_version_type,
+        "searchCriteria.$top": top,
+    }
+    if skip:
+        params["searchCriteria.$skip"] = skip
+    return params, cache_key
+
+
+def diffs_params(
+    base_version: str,
+    target_version: str,
+    base_version_type: Optional[str],
+    target_version_type: Optional[str],
+    top: int,
+    skip: int,
+) -> tuple[dict, Optional[str]]:
+    """(parametri, chiave di cache o None) per diffs/commits; in cache solo tra SHA completi."""
+    cache_key = None
+    if (
+        base_version_type == "commit" and target_version_type == "commit"
+        and is_full_sha(base_version) and is_full_sha(target_version)
+    ):
+        cache_key = f"{base_version.lower()}..{target_version.lower()}:{top}:{skip}"
+    params = {
+        "baseVersion": base_version,
+        "targetVersion": target_version,
+        "$top": top,
+        "$skip": skip,
+    }
+    if base_version_type:
+        params["baseVersionType"] = base_version_type
+    if target_version_type:
+        params["targetVersionType"] = target_version_type
+    return params, cache_key
+
+
+def error_for_status(resp_status: int, resp_text: str) -> Optional["AzureDevOpsClientError"]:
+    """Errore per una risposta HTTP definitiva (non throttling), None se è un successo."""
+    if resp_status == 401:
+        return AzureDevOpsClientError(
+            "Authentication failed (invalid PAT or permissions).",
+            status_code=401,
+            response_text=resp_text,
+        )
+    if resp_status == 404:
+        return AzureDevOpsClientError(
+            "Resource not found.",
+            status_code=404,
+            response_text=resp_text,
+        )
+    if resp_status >= 400:
+        return AzureDevOpsClientError(
+            f"API error: {resp_status}",
+            status_code=resp_status,
+            response_text=resp_text,
+        )
+    return None
 
 
 class AzureDevOpsClientError(Exception):
@@ -38,31 +250,74 @@ class AzureDevOpsClient:
         pat: str,
         username: Optional[str] = None,
         base_url: Optional[str] = None,
+        cache: Optional["CommitCache"] = None,
+        api_versions: Optional[ApiVersionMap] = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        shared: Optional[SharedCache] = None,
+        connect_timeout: float = CONNECT_TIMEOUT_SEC,
+        read_timeout: float = READ_TIMEOUT_SEC,
+        verify: Union[bool, str] = True,
     ):
         self.organization = organization.strip()
         self.project = project.strip()
         self.pat = pat
         self.username = username or ""
         self.base_url = (base_url or DEFAULT_BASE).rstrip("/")
-        self._session = requests.Session()
-        self._session.auth = HTTPBasicAuth(self.username, self.pat)
-        self._session.headers["Accept"] = "application/json"
-        self._session.headers["Content-Type"] = "application/json"
+        # Pool di connessioni dimensionato sulle richieste in volo (cresce con set_max_in_flight),
+        # con conteggi di riuso; verify: False o percorso di un bundle CA (es. TFS con CA interna)
+        self.transport = TransportStats()
+        self._pool_size = pool_size_for(max_in_flight)
+        self._session = build_session(self.username, self.pat, max_in_flight, self.transport)
+        self._verify = verify_argument(verify)
+        self.timeout = (connect_timeout, read_timeout)
         self._detected_git_api_version: Optional[str] = None
         # Su alcuni TFS on-prem refs/commits/diffs richiedono il project GUID nel path (da repo.project.id)
         self._project_id: Optional[str] = None
+        # Cache persistente opzionale per commit e diff tra SHA (dati immutabili)
+        self.cache = cache
+        # api-version funzionante per famiglia di endpoint, appresa una volta per server (persistibile)
+        self._api_versions = api_versions if api_versions is not None else ApiVersionMap()
+        self._failed_versions: set[tuple[str, str]] = set()
+        # Richieste in volo condivise da tutti i worker che usano questo client (AIMD + Retry-After)
+        self.scheduler = RequestScheduler(max_in_flight)
+        # Conteggi, latenze, byte, retry ed errori per famiglia di endpoint e api-version
+        self.metrics = RequestMetrics()
+        # Span di timing per fase (None = tracing spento); impostato dal chiamante per la durata di un run
+        self.tracer: Optional[Tracer] = None
+        # Cache di processo (tutte le sessioni): GET identiche in volo coalescono, refs e risultati con TTL.
+        # None = niente condivisione
+        self.shared: Optional[SharedCache] = shared if shared is not None else process_cache()
+
+    @property
+    def server_key(self) -> str:
+        """Identifica il server/organization nelle chiavi di cache."""
+        return f"{self.base_url}/{self.organization}"
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        """Nuovo tetto di richieste in volo per lo scheduler; il pool di connessioni si allarga se serve."""
+        self.scheduler.set_max_in_flight(max_in_flight)
+        pool_size = pool_size_for(max_in_flight)
+        if pool_size > self._pool_size:
+            self._pool_size = pool_size
+            mount_adapter(self._session, pool_size, self.transport)
+
+    @property
+    def scope_key(self) -> str:
+        """Server, progetto e credenziali (hash): ambito delle chiavi nella cache di processo."""
+        return credentials_scope(self.server_key, self.project, self.username, self.pat)
+
+    def _cache_get(self, repository_id: str, kind: str, key: str) -> Optional[Any]:
+        if self.cache is None:
+            return None
+        return self.cache.get(self.server_key, repository_id, kind, key)
+
+    def _cache_put(self, repository_id: str, kind: str, key: str, value: Any) -> None:
+        if self.cache is not None:
+            self.cache.put(self.server_key, repository_id, kind, key, value)
 
     def _url(self, path: str, query: Optional[dict] = None) -> str:
-        base = f"{self.base_url}/{self.organization}"
         # Usa project GUID se impostato (da list_repositories), altrimenti nome progetto
-        project_segment = self._project_id or self.project
-        if project_segment:
-            base = f"{base}/{project_segment}"
-        url = f"{base}/_apis{path}"
-        if query:
-            from urllib.parse import urlencode
-            url = f"{url}?{urlencode(query)}"
-        return url
+        return build_api_url(self.base_url, self.organization, self._project_id or self.project, path, query)
 
     def _request(
         self,
@@ -71,134 +326,240 @@ class AzureDevOpsClient:
         params: Optional[dict] = None,
         json: Optional[dict] = None,
         stream: bool = False,
+        family: str = "other",
     ) -> Any:
-        """Execute request with retry and exponential backoff."""
+        """
+        Execute request with retry. Lo scheduler limita le richieste in volo; su 429/503 si rispettano
+        Retry-After / X-RateLimit-* (pausa per tutti i worker), altrimenti backoff esponenziale con jitter.
+        Ogni tentativo viene registrato in self.metrics sotto (family, api-version).
+        GET identiche contemporanee (stesse credenziali, anche da altre sessioni) fanno una sola richiesta.
+        """
         url = self._url(path, params)
+        api_version = (params or {}).get("api-version")
+        if method == "GET" and not stream and self.shared is not None:
+            return self.shared.get_or_compute(
+                ("GET", self.scope_key, url),
+                lambda: self._send(method, url, api_version, json, stream, family),
+            )
+        return self._send(method, url, api_version, json, stream, family)
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        api_version: Optional[str],
+        json: Optional[dict],
+        stream: bool,
+        family: str,
+    ) -> Any:
+        """Invio con retry, throttling e metriche (vedi _request)."""
         last_error = None
-        for attempt in range(MAX_RETRIES):
-            try:
-                resp = self._session.request(
-                    method, url, json=json, timeout=60, stream=stream
-                )
-                if resp.status_code == 401:
-                    raise AzureDevOpsClientError(
-                        "Authentication failed (invalid PAT or permissions).",
-                        status_code=401,
-                        response_text=resp.text,
+        network_failures = 0
+        throttle_retries = 0
+        while True:
+            with span(self.tracer, f"http {family}", "http", api_version=api_version) as sp:
+                waited = time.perf_counter()
+                self.scheduler.acquire()
+                resp = None
+                started = time.perf_counter()
+                sp["wait_ms"] = round((started - waited) * 1000, 1)
+                try:
+                    resp = self._session.request(
+                        method, url, json=json, timeout=self.timeout, stream=stream, verify=self._verify
                     )
-                if resp.status_code == 404:
-                    raise AzureDevOpsClientError(
-                        "Resource not found.",
-                        status_code=404,
-                        response_text=resp.text,
+                except requests.RequestException as e:
+                    last_error = e
+                finally:
+                    throttled = resp is not None and resp.status_code in THROTTLE_STATUS_CODES
+                    self.scheduler.release(
+                        throttled=throttled,
+                        headers=resp.headers if resp is not None else None,
                     )
-                if resp.status_code >= 400:
+                sp["status"] = resp.status_code if resp is not None else None
+            self.metrics.record(
+                family,
+                api_version,
+                resp.status_code if resp is not None else None,
+                time.perf_counter() - started,
+                _response_size(resp, stream),
+            )
+
+            if resp is None:
+                network_failures += 1
+                if network_failures >= MAX_RETRIES:
+                    break
+                self.metrics.retry(family, api_version)
+                sleep_time = jittered_backoff(network_failures - 1, RETRY_BACKOFF_SEC)
+                logger.warning("Request failed, retry in %.1f s: %s", sleep_time, last_error)
+                time.sleep(sleep_time)
+                continue
+
+            if throttled:
+                throttle_retries += 1
+                if throttle_retries > MAX_THROTTLE_RETRIES:
                     raise AzureDevOpsClientError(
-                        f"API error: {resp.status_code}",
+                        f"API error: {resp.status_code} (throttling, retry esauriti)",
                         status_code=resp.status_code,
                         response_text=resp.text,
                     )
-                if stream:
-                    return resp
-                return resp.json() if resp.content else None
-            except AzureDevOpsClientError:
-                raise
-            except requests.RequestException as e:
-                last_error = e
-                if attempt < MAX_RETRIES - 1:
-                    sleep_time = RETRY_BACKOFF_SEC * (2 ** attempt)
-                    logger.warning("Request failed, retry in %s s: %s", sleep_time, e)
+                self.metrics.retry(family, api_version)
+                server_delay = retry_delay_from_headers(resp.headers)
+                if server_delay is None:
+                    # Nessuna indicazione dal server: backoff con jitter solo per questo worker
+                    sleep_time = jittered_backoff(throttle_retries - 1, RETRY_BACKOFF_SEC)
+                    logger.warning("HTTP %s, retry in %.1f s", resp.status_code, sleep_time)
                     time.sleep(sleep_time)
+                else:
+                    # La pausa è già applicata dallo scheduler: acquire() attende per tutti i worker
+                    logger.warning("HTTP %s, Retry-After %.1f s", resp.status_code, server_delay)
+                continue
+
+            error = error_for_status(resp.status_code, resp.text) if resp.status_code >= 400 else None
+            if error is not None:
+                raise error
+            if stream:
+                return resp
+            return resp.json() if resp.content else None
         raise AzureDevOpsClientError(
             f"Request failed after {MAX_RETRIES} retries: {last_error}"
         )
 
+    def _request_versioned(
+        self,
+        family: str,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Optional[dict] = None,
+        accept: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        _request con api-version presa dalla mappa (server, famiglia endpoint).
+        Se la versione non è nota prova i candidati in ordine e memorizza la prima che risponde
+        (accept, se passato, valida la risposta); le versioni rifiutate non vengono più ritentate.
+        """
+        params = dict(params or {})
+        known = self._api_versions.get(self.server_key, family)
+        if known:
+            try:
+                return self._request(
+                    method, path, params={**params, "api-version": known}, json=json, family=family
+                )
+            except AzureDevOpsClientError as e:
+                if not is_version_error(e):
+                    raise
+                self.metrics.wasted_fallback(family, known)
+                # Server aggiornato/ripristinato: la versione nota non va più, si rinegozia
+                logger.info("api-version %s non più accettata per %s: nuova negoziazione", known, family)
+                self._api_versions.forget(self.server_key, family)
+                self._failed_versions.add((family, known))
+
+        last_error: Optional[AzureDevOpsClientError] = None
+        # Risposte scartate da accept: sprecate solo se poi un'altra versione risponde
+        rejected: list[tuple[str, Any]] = []
+        for api_ver in FAMILY_API_VERSIONS.get(family, DEFAULT_API_VERSIONS):
+            if (family, api_ver) in self._failed_versions:
+                continue
+            try:
+                data = self._request(
+                    method, path, params={**params, "api-version": api_ver}, json=json, family=family
+                )
+            except AzureDevOpsClientError as e:
+                # Solo un errore di versione fa provare il candidato successivo; un 404 vero (repo o commit
+                # inesistente), auth, throttling e 5xx valgono per tutte le versioni
+                if not is_version_error(e):
+                    raise
+                last_error = e
+                self._failed_versions.add((family, api_ver))
+                self.metrics.wasted_fallback(family, api_ver)
+                continue
+            if accept is not None and not accept(data):
+                rejected.append((api_ver, data))
+                continue
+            for wasted_ver, _ in rejected:
+                self.metrics.wasted_fallback(family, wasted_ver)
+            logger.info("api-version %s per %s su %s", api_ver, family, self.base_url)
+            self._api_versions.set(self.server_key, family, api_ver)
+            return data
+        if rejected:
+            # Nessuna versione dà di più: la risposta vuota è quella vera (es. commit inesistente)
+            return rejected[0][1]
+        if last_error is not None:
+            raise last_error
+        raise AzureDevOpsClientError(f"Nessuna api-version utilizzabile per {family}.")
+
     def test_connection(self) -> dict:
         """Test connection: call project or core API. Returns minimal project info."""
         path = f"/git/repositories"
-        params = {"api-version": API_VERSION, "$top": 1}
-        data = self._request("GET", path, params=params)
+        data = self._request_versioned("repositories", "GET", path, params={"$top": 1})
         return data or {"value": []}
 
     def discover_git_api_version(self) -> str:
         """
         Scopre quale api-version risponde per le API Git (repositories).
         Non esiste un endpoint ufficiale: si provano 5.0, 6.0, 7.1 e si restituisce la prima che risponde 200 con dati.
-        Il risultato viene cachato su self._detected_git_api_version.
+        Il risultato viene cachato su self._detected_git_api_version e nella mappa api-version del server.
         """
         if self._detected_git_api_version:
             return self._detected_git_api_version
         path = "/git/repositories"
-        for api_ver in (API_VERSION_ONPREM, "6.0", API_VERSION):
-            try:
-                data = self._request("GET", path, params={"api-version": api_ver, "$top": 1})
-                if data and isinstance(data.get("value"), list):
-                    logger.info("discover_git_api_version: usabile api-version=%s", api_ver)
-                    self._detected_git_api_version = api_ver
-                    return api_ver
-            except AzureDevOpsClientError:
-                continue
-        self._detected_git_api_version = API_VERSION_ONPREM
-        return API_VERSION_ONPREM  # fallback conservativo
+        try:
+            self._request_versioned(
+                "repositories",
+                "GET",
+                path,
+                params={"$top": 1},
+                accept=lambda data: bool(data) and isinstance(data.get("value"), list),
+            )
+        except AzureDevOpsClientError:
+            pass
+        api_ver = self._api_versions.get(self.server_key, "repositories")
+        if api_ver:
+            logger.info("discover_git_api_version: usabile api-version=%s", api_ver)
+        self._detected_git_api_version = api_ver or API_VERSION_ONPREM  # fallback conservativo
+        return self._detected_git_api_version
 
     def list_repositories(self) -> list[dict]:
         """List all Git repositories in the project. API: Git Repositories List."""
         path = "/git/repositories"
-        api_ver = self._detected_git_api_version or self.discover_git_api_version()
         try:
-            data = self._request("GET", path, params={"api-version": api_ver})
+            data = self._request_versioned("repositories", "GET", path)
         except AzureDevOpsClientError:
             data = None
-            for v in ("5.0", "6.0", API_VERSION):
-                if v == api_ver:
-                    continue
-                try:
-                    data = self._request("GET", path, params={"api-version": v})
-                    self._detected_git_api_version = v
-                    break
-                except AzureDevOpsClientError:
-                    continue
         if not data or "value" not in data:
             return []
         repos = data["value"]
         # Salva project GUID dal primo repo (alcuni TFS richiedono GUID nel path per refs/commits/diffs)
-        if repos and not self._project_id:
-            proj = repos[0].get("project") if isinstance(repos[0], dict) else None
-            if isinstance(proj, dict) and proj.get("id"):
-                self._project_id = proj["id"]
-                logger.debug("Usando project id per path API: %s", self._project_id)
+        self.use_repositories(repos)
         return repos
 
+    def use_repositories(self, repos: list[dict]) -> None:
+        """Project GUID da un elenco repo già noto (es. salvato in locale), come dopo list_repositories."""
+        if not self._project_id:
+            self._project_id = project_id_from_repos(repos)
+            if self._project_id:
+                logger.debug("Usando project id per path API: %s", self._project_id)
+
     def get_refs(
         self,
         repository_id: str,
         filter_prefix: Optional[str] = None,
         top: int = 1000,
+        peel_tags: bool = False,
     ) -> list[dict]:
-        """List refs (branches/tags). filter_prefix può essere refs/heads/ o refs/tags/ (normalizzato per TFS)."""
+        """
+        List refs (branches/tags). filter_prefix può essere refs/heads/ o refs/tags/ (normalizzato per TFS).
+        peel_tags: per i tag annotati aggiunge peeledObjectId (commit puntato dal tag).
+        """
         path = f"/git/repositories/{repository_id}/refs"
-        # TFS/ADO Server accetta filter=heads/ o filter=tags/, non refs/heads/
-        filter_norm = None
-        if filter_prefix:
-            filter_norm = filter_prefix.strip()
-            if filter_norm.startswith("refs/"):
-                filter_norm = filter_norm[len("refs/"):]
-        for api_ver in (API_VERSION, "6.0", API_VERSION_ONPREM):
-            params = {"api-version": api_ver, "$top": top}
-            if filter_norm:
-                params["filter"] = filter_norm
-            try:
-                data = self._request("GET", path, params=params)
-            except AzureDevOpsClientError:
-                continue
-            if not data:
-                continue
-            refs = data.get("value") if isinstance(data, dict) else None
-            if refs is None:
-                refs = data.get("refs")
-            if refs is not None and isinstance(refs, list):
-                return refs
-        return []
+        params = refs_params(filter_prefix, top, peel_tags)
+        try:
+            data = self._request_versioned(
+                "refs", "GET", path, params=params, accept=lambda d: refs_from_response(d) is not None
+            )
+        except AzureDevOpsClientError:
+            return []
+        return refs_from_response(data) or []
 
     def get_commits(
         self,
@@ -208,13 +569,8 @@ class AzureDevOpsClient:
     ) -> list[dict]:
         """Get commits. search_criteria can include itemVersion (version, versionType)."""
         path = f"/git/repositories/{repository_id}/commits"
-        params = {"api-version": API_VERSION, "$top": top}
-        if search_criteria:
-            for k, v in search_criteria.items():
-                if v is not None:
-                    key = k if k.startswith("searchCriteria.") else f"searchCriteria.{k}"
-                    params[key] = v
-        data = self._request("GET", path, params=params)
+        params = commits_params(search_criteria, top)
+        data = self._request_versioned("commits", "GET", path, params=params)
         if not data or "value" not in data:
             return []
         return data["value"]
@@ -223,16 +579,57 @@ class AzureDevOpsClient:
         """Restituisce un singolo commit per ID (message, author, ecc.) o None."""
         if not commit_id:
             return None
+        cacheable = is_full_sha(commit_id)
+        if cacheable:
+            cached = self._cache_get(repository_id, "commit", commit_id.lower())
+            if cached is not None:
+                return cached
         path = f"/git/repositories/{repository_id}/commits"
-        for api_ver in (self._detected_git_api_version or API_VERSION, API_VERSION_ONPREM, "6.0", API_VERSION):
-            try:
-                params = {"api-version": api_ver, "$top": 1, "searchCriteria.ids": commit_id}
-                data = self._request("GET", path, params=params)
-                if data and data.get("value"):
-                    return data["value"][0]
-            except AzureDevOpsClientError:
+        params = {"$top": 1, "searchCriteria.ids": commit_id}
+        try:
+            data = self._request_versioned(
+                "commits", "GET", path, params=params, accept=lambda d: bool(d and d.get("value"))
+            )
+        except AzureDevOpsClientError:
+            return None
+        if not data or not data.get("value"):
+            return None
+        commit = data["value"][0]
+        if cacheable:
+            self._cache_put(repository_id, "commit", commit_id.lower(), commit)
+        return commit
+
+    def get_commits_batch(
+        self,
+        repository_id: str,
+        commit_ids: list[str],
+    ) -> list[dict]:
+        """
+        Commit per lista di ID (POST commitsbatch), a blocchi di COMMITS_BATCH_SIZE.
+        Gli ID non trovati vengono semplicemente omessi dal risultato.
+        Solleva AzureDevOpsClientError se l'endpoint non risponde con nessuna api-version.
+        """
+        path = f"/git/repositories/{repository_id}/commitsbatch"
+        commits: list[dict] = []
+        ids = []
+        for c in dict.fromkeys(commit_ids):
+            if not c:
                 continue
-        return None
+            cached = self._cache_get(repository_id, "commit", c.lower()) if is_full_sha(c) else None
+            if cached is not None:
+                commits.append(cached)
+            else:
+                ids.append(c)
+        for start in range(0, len(ids), COMMITS_BATCH_SIZE):
+            chunk = ids[start:start + COMMITS_BATCH_SIZE]
+            body = {"ids": chunk, "$top": len(chunk)}
+            data = self._request_versioned("commitsbatch", "POST", path, json=body)
+            if data and isinstance(data.get("value"), list):
+                for c in data["value"]:
+                    if is_full_sha(c.get("commitId")):
+                        self._cache_put(repository_id, "commit", c["commitId"].lower(), c)
+                commits.extend(data["value"])
+        return commits
 
     def get_commits_compare(
         self,
@@ -242,20 +639,70 @@ class AzureDevOpsClient:
         source_version_type: str = "commit",
         target_version_type: str = "commit",
         top: int = 20,
+        skip: int = 0,
     ) -> list[dict]:
         """Get commits in source not in target (for diff list). Uses itemVersion=source, compareVersion=target."""
+        params, cache_key = commits_compare_params(
+            source_version, target_version, source_version_type, target_version_type, top, skip
+        )
+        if cache_key:
+            cached = self._cache_get(repository_id, "commits_compare", cache_key)
+            if cached is not None:
+                return cached
         path = f"/git/repositories/{repository_id}/commits"
-        params = {
-            "api-version": API_VERSION,
-            "searchCriteria.itemVersion.version": source_version,
-            "searchCriteria.itemVersion.versionType": source_version_type,
-            "searchCriteria.compareVersion.version": target_version,
-            "searchCriteria.compareVersion.versionType": target_version_type,
-            "searchCriteria.$top": top,
-        }
-        data = self._request("GET", path, params=params)
+        data = self._request_versioned("commits", "GET", path, params=params)
         if not data or "value" not in data:
             return []
+        if cache_key:
+            self._cache_put(repository_id, "commits_compare", cache_key, data["value"])
+        return data["value"]
+
+    def iter_commits_compare(
+        self,
+        repository_id: str,
+        source_version: str,
+        target_version: str,
+        source_version_type: str = "commit",
+        target_version_type: str = "commit",
+        page_size: int = COMMITS_PAGE_SIZE,
+    ) -> Iterator[dict]:
+        """
+        Tutti i commit in source non in target, una pagina ($skip) alla volta.
+        Il chiamante può fermarsi quando vuole: le pagine successive non vengono richieste.
+        """
+        skip = 0
+        while True:
+            page = self.get_commits_compare(
+                repository_id,
+                source_version=source_version,
+                target_version=target_version,
+                source_version_type=source_version_type,
+                target_version_type=target_version_type,
+                top=page_size,
+                skip=skip,
+            )
+            yield from page
+            if len(page) < page_size:
+                return
+            skip += len(page)
+
+    def get_pushes(
+        self,
+        repository_id: str,
+        from_date: Optional[str] = None,
+        top: int = 1,
+    ) -> list[dict]:
+        """
+        Push del repo (Pushes - List), con from_date (ISO 8601) solo quelli successivi.
+        Ogni push copre aggiornamenti di branch e tag; top=1 basta per sapere se ce ne sono stati.
+        """
+        path = f"/git/repositories/{repository_id}/pushes"
+        params: dict[str, Any] = {"$top": top}
+        if from_date:
+            params["searchCriteria.fromDate"] = from_date
+        data = self._request_versioned("pushes", "GET", path, params=params)
+        if not data or not isinstance(data.get("value"), list):
+            return []
         return data["value"]
 
     def get_annotated_tag(
@@ -265,14 +712,39 @@ class AzureDevOpsClient:
     ) -> Optional[dict]:
         """Get annotated tag by object ID (for tag date)."""
         path = f"/git/repositories/{repository_id}/annotatedtags/{object_id}"
-        params = {"api-version": API_VERSION}
         try:
-            return self._request("GET", path, params=params)
+            return self._request_versioned("annotatedtags", "GET", path)
         except AzureDevOpsClientError as e:
             if e.status_code == 404:
                 return None
             raise
 
+    def get_branch_stats(
+        self,
+        repository_id: str,
+        base_version: str,
+        base_version_type: str = "commit",
+        name: Optional[str] = None,
+    ) -> list[dict]:
+        """
+        Statistiche branch (stats/branches): aheadCount/behindCount di ogni branch rispetto a base_version.
+        name: limita la risposta a un solo branch (nome corto). Ogni voce: name, aheadCount, behindCount, commit.
+        """
+        path = f"/git/repositories/{repository_id}/stats/branches"
+        params = {
+            "baseVersionDescriptor.version": base_version,
+            "baseVersionDescriptor.versionType": base_version_type,
+        }
+        if name:
+            params["name"] = name
+        data = self._request_versioned("stats", "GET", path, params=params)
+        if not data:
+            return []
+        if isinstance(data, dict) and isinstance(data.get("value"), list):
+            return data["value"]
+        # Con name il servizio restituisce il singolo oggetto
+        return [data] if isinstance(data, dict) and "name" in data else []
+
     def get_diffs_commits(
         self,
         repository_id: str,
@@ -287,17 +759,45 @@ class AzureDevOpsClient:
         Get diff between base and target (merge base and list of changes).
         base_version/target_version: branch name, tag name, or commit SHA.
         base_version_type/target_version_type: 'branch' | 'tag' | 'commit'.
+        Con entrambe le versioni di tipo commit (SHA completi) il risultato viene messo in cache.
         """
+        params, cache_key = diffs_params(base_version, target_version, base_version_type, target_version_type, top, skip)
+        if cache_key:
+            cached = self._cache_get(repository_id, "diff", cache_key)
+            if cached is not None:
+                return cached
         path = f"/git/repositories/{repository_id}/diffs/commits"
-        params = {
-            "api-version": API_VERSION,
-            "baseVersion": base_version,
-            "targetVersion": target_version,
-            "$top": top,
-            "$skip": skip,
-        }
-        if base_version_type:
-            params["baseVersionType"] = base_version_type
-        if target_version_type:
-            params["targetVersionType"] = target_version_type
-        return self._request("GET", path, params=params) or {}
+        data = self._request_versioned("diffs", "GET", path, params=params) or {}
+        if cache_key and data:
+            self._cache_put(repository_id, "diff", cache_key, data)
+        return data
+
+    def iter_diff_changes(
+        self,
+        repository_id: str,
+        base_version: str,
+        target_version: str,
+        base_version_type: Optional[str] = None,
+        target_version_type: Optional[str] = None,
+        page_size: int = DIFF_PAGE_SIZE,
+        skip: int = 0,
+    ) -> Iterator[dict]:
+        """
+        Tutte le change del diff base..target, una pagina ($top/$skip) alla volta, a partire da skip.
+        Si ferma su pagina incompleta o allChangesIncluded; in memoria resta solo la pagina corrente.
+        """
+        while True:
+            page = self.get_diffs_commits(
+                repository_id,
+                base_version=base_version,
+                target_version=target_version,
+                base_version_type=base_version_type,
+                target_version_type=target_version_type,
+                top=page_size,
+                skip=skip,
+            )
+            changes = page.get("changes") or []
+            yield from changes
+            if len(changes) < page_size or page.get("allChangesIncluded"):
+                return
+            skip += len(changes)
@@ -0,0 +1,265 @@
+"""
+CLI headless di GitSnap (nessun import di Streamlit): confronto SOURCE vs TARGET per pipeline di rilascio.
+
+    python -m gitsnap compare --project "EACS Produzione" --source-type branch --source develop \
+        --target-type tag_pattern --target "prod*"
+
+Legge i progetti salvati da data/projects.json, stampa i risultati come NDJSON (uno per repo, appena pronti)
+o come unico documento JSON, ed esce con codice != 0 se ci sono divergenze o errori.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Any, Callable, Optional
+
+from api_versions import ApiVersionMap
+from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+from commit_cache import DEFAULT_MAX_BYTES, CommitCache
+from diff_service import (
+    DEFAULT_MAX_WORKERS,
+    STATUS_ALIGNED,
+    STATUS_DIVERGENT,
+    STATUS_ERROR,
+    STRATEGY_BRANCH_STATS,
+    STRATEGY_DIFF,
+    iter_compare_repos,
+)
+from ref_resolver import REF_TYPE_BRANCH, REF_TYPE_COMMIT, REF_TYPE_TAG_PATTERN, RefSnapshot
+from request_scheduler import DEFAULT_ASYNC_MAX_IN_FLIGHT
+from settings import API_VERSIONS_FILE, COMMIT_CACHE_FILE, load_config, load_projects
+from tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+EXIT_ALIGNED = 0
+EXIT_DIVERGENT = 1
+EXIT_ERROR = 2
+
+# Stesso ordine di REF_TYPES nell'app: ref_type_index di config.json
+REF_TYPE_CHOICES = [REF_TYPE_BRANCH, REF_TYPE_TAG_PATTERN, REF_TYPE_COMMIT]
+PAT_ENV_VARS = ("GITSNAP_PAT", "AZURE_DEVOPS_PAT")
+
+
+class CliError(Exception):
+    """Errore di configurazione o di utilizzo: messaggio su stderr ed EXIT_ERROR."""
+
+
+def _find_project(projects: list[dict], wanted: str) -> dict:
+    """Progetto per id, nome o org/project (case-insensitive)."""
+    wanted_l = wanted.strip().lower()
+    for p in projects:
+        keys = (
+            p.get("id") or "",
+            p.get("name") or "",
+            f"{p.get('organization', '')}/{p.get('project', '')}",
+        )
+        if wanted_l in (k.lower() for k in keys):
+            return p
+    names = ", ".join(p.get("name") or p.get("id") or "?" for p in projects) or "nessuno"
+    raise CliError(f"Progetto non trovato: {wanted} (disponibili: {names})")
+
+
+def _ref_from_config(config: dict, key: str) -> tuple[Optional[str], Optional[str]]:
+    entry = config.get(key) or {}
+    idx = entry.get("ref_type_index")
+    ref_type = REF_TYPE_CHOICES[idx] if isinstance(idx, int) and 0 <= idx < len(REF_TYPE_CHOICES) else None
+    return ref_type, entry.get("value")
+
+
+def _select_repos(repos: list[dict], wanted: list[str]) -> list[dict]:
+    """Filtra per id o nome (case-insensitive); senza filtro tutti i repo del progetto."""
+    if not wanted:
+        return repos
+    wanted_l = {w.strip().lower() for w in wanted}
+    selected = [
+        r for r in repos
+        if (r.get("id") or "").lower() in wanted_l or (r.get("name") or "").lower() in wanted_l
+    ]
+    found = {(r.get("id") or "").lower() for r in selected} | {(r.get("name") or "").lower() for r in selected}
+    missing = sorted(wanted_l - found)
+    if missing:
+        raise CliError(f"Repository non trovati: {', '.join(missing)}")
+    return selected
+
+
+def _print_json(obj: dict, pretty: bool = False) -> None:
+    sys.stdout.write(json.dumps(obj, ensure_ascii=False, indent=2 if pretty else None) + "\n")
+    sys.stdout.flush()
+
+
+def _exit_code(tally: dict[str, int]) -> int:
+    if tally.get(STATUS_ERROR):
+        return EXIT_ERROR
+    if tally.get(STATUS_DIVERGENT):
+        return EXIT_DIVERGENT
+    return EXIT_ALIGNED
+
+
+async def _compare_async(
+    args: argparse.Namespace,
+    client_kwargs: dict,
+    refs: tuple[str, str, str, str],
+    on_result: Callable[[int, dict[str, Any]], None],
+) -> int:
+    """Confronto con il client asincrono (--async): restituisce il numero di repo confrontati."""
+    # Import solo con --async: httpx è opzionale e il confronto sincrono non deve richiederlo
+    from async_client import AsyncAzureDevOpsClient
+    from async_service import iter_compare_repos_async
+
+    async with AsyncAzureDevOpsClient(**client_kwargs, max_in_flight=args.max_in_flight) as client:
+        repos = _select_repos(await client.list_repositories(), args.repo)
+        if not repos:
+            raise CliError("Nessun repository da confrontare.")
+        async for idx, res in iter_compare_repos_async(client, repos, *refs, quick=args.quick):
+            on_result(idx, res)
+        return len(repos)
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    config = load_config()
+    project = _find_project(load_projects(), args.project)
+    pat = args.pat or project.get("pat") or next((os.environ[v] for v in PAT_ENV_VARS if os.environ.get(v)), "")
+    if not pat:
+        raise CliError(f"PAT mancante: usa --pat, salvalo nel progetto o imposta {PAT_ENV_VARS[0]}.")
+
+    cfg_src_type, cfg_src_value = _ref_from_config(config, "source")
+    cfg_tgt_type, cfg_tgt_value = _ref_from_config(config, "target")
+    source_type = args.source_type or cfg_src_type or REF_TYPE_BRANCH
+    target_type = args.target_type or cfg_tgt_type or REF_TYPE_BRANCH
+    source_value = args.source or cfg_src_value
+    target_value = args.target or cfg_tgt_value
+    if not source_value or not target_value:
+        raise CliError("Indicare --source e --target (o salvarli in config.json).")
+
+    if args.use_async and args.trace:
+        raise CliError("--trace non è disponibile con --async.")
+
+    max_mb = config.get("cache_max_mb")
+    client_kwargs = dict(
+        organization=project.get("organization", ""),
+        project=project.get("project", ""),
+        pat=pat,
+        username=project.get("username") or None,
+        base_url=(project.get("base_url") or "").strip() or None,
+        cache=None if args.no_cache else CommitCache(
+            COMMIT_CACHE_FILE, max_bytes=int(max_mb) * 1024 * 1024 if max_mb else DEFAULT_MAX_BYTES
+        ),
+        api_versions=ApiVersionMap(API_VERSIONS_FILE),
+    )
+    refs = (source_type, source_value, target_type, target_value)
+
+    tally = {STATUS_ALIGNED: 0, STATUS_DIVERGENT: 0, STATUS_ERROR: 0}
+    results: dict[int, dict] = {}
+
+    def _on_result(idx: int, res: dict[str, Any]) -> None:
+        status = res.get("status")
+        tally[status if status in tally else STATUS_ERROR] += 1
+        if args.format == "ndjson":
+            _print_json({"type": "result", **res})
+        else:
+            results[idx] = res
+
+    if args.use_async:
+        repo_count = asyncio.run(_compare_async(args, client_kwargs, refs, _on_result))
+    else:
+        client = AzureDevOpsClient(**client_kwargs, max_in_flight=args.max_workers)
+        if args.trace:
+            client.tracer = Tracer()
+        repos = _select_repos(client.list_repositories(), args.repo)
+        if not repos:
+            raise CliError("Nessun repository da confrontare.")
+        repo_count = len(repos)
+        for idx, res in iter_compare_repos(
+            client,
+            repos,
+            *refs,
+            snapshot=RefSnapshot(client),
+            max_workers=args.max_workers,
+            quick=args.quick,
+            strategy=STRATEGY_BRANCH_STATS if args.quick else STRATEGY_DIFF,
+        ):
+            _on_result(idx, res)
+        if client.tracer is not None:
+            with open(args.trace, "w", encoding="utf-8") as f:
+                json.dump(client.tracer.to_chrome_trace(), f)
+
+    exit_code = _exit_code(tally)
+    summary = {
+        "project": project.get("name") or project.get("project"),
+        "source": {"ref_type": source_type, "value": source_value},
+        "target": {"ref_type": target_type, "value": target_value},
+        "repos": repo_count,
+        "aligned": tally[STATUS_ALIGNED],
+        "divergent": tally[STATUS_DIVERGENT],
+        "errors": tally[STATUS_ERROR],
+        "exit_code": exit_code,
+    }
+    if args.format == "ndjson":
+        _print_json({"type": "summary", **summary})
+    else:
+        _print_json({"summary": summary, "results": [results[i] for i in sorted(results)]}, pretty=True)
+    return exit_code
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="gitsnap", description="GitSnap da riga di comando (senza UI).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log dettagliati su stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser(
+        "compare",
+        help="confronta SOURCE vs TARGET sui repo di un progetto salvato",
+        description="Exit code: 0 tutto allineato, 1 almeno un repo divergente, 2 errori.",
+    )
+    p.add_argument("--project", required=True, help="progetto salvato in projects.json (id, nome o org/project)")
+    p.add_argument("--source-type", choices=REF_TYPE_CHOICES, help="default: da config.json, altrimenti branch")
+    p.add_argument("--source", help="branch, tag pattern o SHA (default: da config.json)")
+    p.add_argument("--target-type", choices=REF_TYPE_CHOICES, help="default: da config.json, altrimenti branch")
+    p.add_argument("--target", help="branch, tag pattern o SHA (default: da config.json)")
+    p.add_argument("--repo", action="append", default=[], help="repo da confrontare (id o nome, ripetibile); default tutti")
+    p.add_argument("--pat", help=f"PAT (default: dal progetto o da {' / '.join(PAT_ENV_VARS)})")
+    p.add_argument("--format", choices=("ndjson", "json"), default="ndjson", help="default: ndjson (un repo per riga)")
+    p.add_argument("--quick", action="store_true", help="solo stato e conteggi (nessun elenco file/commit)")
+    p.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="repo confrontati in parallelo")
+    p.add_argument("--no-cache", action="store_true", help="non usare la cache commit/diff su disco")
+    p.add_argument("--trace", metavar="FILE", help="salva gli span per fase in formato Chrome trace-event")
+    p.add_argument(
+        "--async", dest="use_async", action="store_true",
+        help="client asincrono (richiede httpx): tutte le richieste in un thread, per progetti con molti repo",
+    )
+    p.add_argument(
+        "--max-in-flight", type=int, default=DEFAULT_ASYNC_MAX_IN_FLIGHT,
+        help=f"con --async: richieste contemporanee verso il server (default {DEFAULT_ASYNC_MAX_IN_FLIGHT})",
+    )
+    p.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        stream=sys.stderr,
+    )
+    try:
+        return args.func(args)
+    except CliError as e:
+        print(f"gitsnap: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    except AzureDevOpsClientError as e:
+        print(f"gitsnap: errore Azure DevOps: {e.message}", file=sys.stderr)
+        return EXIT_ERROR
+    except ImportError as e:
+        # --async senza httpx installato
+        print(f"gitsnap: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Cache persistente (SQLite) per dati immutabili: commit, liste commit e diff tra due SHA.
+Chiave: (server, repo id, tipo, sha o coppia di sha). I commit non cambiano mai, quindi
+nessuna scadenza: solo eviction per dimensione (meno usati di recente per primi).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+# Dopo un'eviction la cache scende a questa frazione di max_bytes (evita eviction a ogni put)
+EVICT_TARGET_RATIO = 0.9
+# last_access si aggiorna solo se più vecchio di così: per l'LRU basta l'ordine di grandezza
+TOUCH_INTERVAL_SEC = 3600.0
+# Aggiornamenti di last_access accumulati prima di scriverli con un solo commit
+TOUCH_BATCH_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    server TEXT NOT NULL,
+    repo_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (server, repo_id, kind, key)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access);
+"""
+
+
+class CommitCache:
+    """
+    Cache key/value su file SQLite, thread-safe. Gli errori SQLite non vengono mai propagati:
+    in caso di problemi la cache si comporta come un miss.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+        self._evictions = 0
+        self._size = 0
+        # (server, repo_id, kind, key) -> last_access da scrivere (flush a lotti, prima di put ed eviction)
+        self._touched: dict[tuple[str, str, str, str], float] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+            try:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.Error:
+                pass
+            self._conn.executescript(_SCHEMA)
+            row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+            self._size = int(row[0] or 0)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Cache commit non disponibile (%s): %s", self.path, e)
+            self._conn = None
+
+    def get(self, server: str, repo_id: str, kind: str, key: str) -> Optional[Any]:
+        """Valore in cache o None (miss)."""
+        value = None
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, last_access FROM entries WHERE server=? AND repo_id=? AND kind=? AND key=?",
+                        (server, repo_id, kind, key),
+                    ).fetchone()
+                    if row is not None:
+                        value = json.loads(row[0])
+                        now = time.time()
+                        if now - float(row[1]) >= TOUCH_INTERVAL_SEC:
+                            self._touched[(server, repo_id, kind, key)] = now
+                            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                                self._flush_touched_locked()
+                                self._conn.commit()
+                except (sqlite3.Error, ValueError) as e:
+                    logger.debug("Cache get fallita: %s", e)
+                    value = None
+            counter = self._hits if value is not None else self._misses
+            counter[kind] = counter.get(kind, 0) + 1
+        return value
+
+    def put(self, server: str, repo_id: str, kind: str, key: str, value: Any) -> None:
+        """Salva value (serializzabile JSON); applica l'eviction se si supera max_bytes."""
+        if value is None:
+            return
+        try:
+            payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            logger.debug("Cache put: valore non serializzabile: %s", e)
+            return
+        size = len(payload.encode("utf-8"))
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._flush_touched_locked()
+                row = self._conn.execute(
+                    "SELECT size FROM entries WHERE server=? AND repo_id=? AND kind=? AND key=?",
+                    (server, repo_id, kind, key),
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (server, repo_id, kind, key, value, size, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (server, repo_id, kind, key, payload, size, time.time()),
+                )
+                self._size += size - (int(row[0]) if row else 0)
+                if self._size > self.max_bytes:
+                    self._evict_locked()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.debug("Cache put fallita: %s", e)
+
+    def _flush_touched_locked(self) -> None:
+        """Scrive i last_access accumulati da get (il commit resta a chi chiama)."""
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.executemany(
+            "UPDATE entries SET last_access=? WHERE server=? AND repo_id=? AND kind=? AND key=?",
+            [(ts, *entry) for entry, ts in touched.items()],
+        )
+
+    def _evict_locked(self) -> None:
+        """Rimuove le voci usate meno di recente fino a EVICT_TARGET_RATIO * max_bytes."""
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        freed = 0
+        removed = []
+        for rowid, size in self._conn.execute("SELECT rowid, size FROM entries ORDER BY last_access ASC"):
+            if self._size - freed <= target:
+                break
+            removed.append((rowid,))
+            freed += int(size)
+        self._conn.executemany("DELETE FROM entries WHERE rowid=?", removed)
+        self._size -= freed
+        self._evictions += len(removed)
+        logger.info("Cache commit: rimosse %s voci (%s byte)", len(removed), freed)
+
+    def clear(self) -> None:
+        """Svuota la cache e azzera le statistiche."""
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+            self._evictions = 0
+            self._touched.clear()
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.commit()
+                self._size = 0
+            except sqlite3.Error as e:
+                logger.warning("Svuotamento cache fallito: %s", e)
+
+    def close(self) -> None:
+        """Chiude la connessione SQLite; dopo close() get/put si comportano come cache disabilitata."""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._flush_touched_locked()
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.debug("Cache: aggiornamento last_access fallito: %s", e)
+                try:
+                    self._conn.close()
+                except sqlite3.Error:
+                    pass
+                self._conn = None
+
+    def stats(self) -> dict[str, Any]:
+        """Hit/miss per tipo (dalla creazione dell'oggetto), voci e dimensione su disco."""
+        with self._lock:
+            entries = 0
+            if self._conn is not None:
+                try:
+                    entries = int(self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0])
+                except sqlite3.Error:
+                    pass
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            return {
+                "path": str(self.path),
+                "enabled": self._conn is not None,
+                "entries": entries,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": (hits / (hits + misses)) if (hits + misses) else 0.0,
+                "evictions": self._evictions,
+                "by_kind": {
+                    kind: {"hits": self._hits.get(kind, 0), "misses": self._misses.get(kind, 0)}
+                    for kind in sorted(set(self._hits) | set(self._misses))
+                },
+            }
@@ -0,0 +1,63 @@
+"""
+Metadati dei commit SOURCE/TARGET (messaggio, autore, data) raccolti per esecuzione:
+- i commit già ricevuti durante il confronto (commitsbatch delle date dei tag, lista dei commit avanti)
+  vengono ricordati e non si richiedono di nuovo;
+- i mancanti di un repo si chiedono insieme con un solo commitsbatch (che usa e alimenta la cache commit);
+- solo se commitsbatch non è disponibile si ripiega su un get_commit_by_id per commit.
+"""
+
+import logging
+import threading
+from typing import Iterable, Optional
+
+from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+
+logger = logging.getLogger(__name__)
+
+
+class CommitMetadata:
+    """Commit per (repo, SHA) visti in un'esecuzione, thread-safe; condiviso tramite RefSnapshot."""
+
+    def __init__(self, client: AzureDevOpsClient):
+        self._client = client
+        self._lock = threading.Lock()
+        self._commits: dict[tuple[str, str], dict] = {}
+
+    def remember(self, repository_id: str, commits: Iterable[dict]) -> None:
+        """Registra commit completi (con commitId) già ricevuti da altre chiamate."""
+        with self._lock:
+            for c in commits:
+                commit_id = (c or {}).get("commitId")
+                if commit_id and len(commit_id) == 40:
+                    self._commits[(repository_id, commit_id.lower())] = c
+
+    def get_many(self, repository_id: str, commit_ids: Iterable[Optional[str]]) -> dict[str, dict]:
+        """SHA (minuscolo) -> commit per gli ID richiesti; gli ID non trovati mancano nel risultato."""
+        wanted = list(dict.fromkeys(c.lower() for c in commit_ids if c))
+        with self._lock:
+            found = {c: self._commits[(repository_id, c)] for c in wanted if (repository_id, c) in self._commits}
+        missing = [c for c in wanted if c not in found]
+        if not missing:
+            return found
+        try:
+            batch = self._client.get_commits_batch(repository_id, missing)
+        except AzureDevOpsClientError as e:
+            logger.debug("commitsbatch non disponibile per repo %s: %s", repository_id, e)
+            batch = []
+        self.remember(repository_id, batch)
+        for c in batch:
+            commit_id = (c.get("commitId") or "").lower()
+            if commit_id in missing:
+                found[commit_id] = c
+        for commit_id in missing:
+            if commit_id in found:
+                continue
+            commit = self._client.get_commit_by_id(repository_id, commit_id)
+            if commit:
+                found[commit_id] = commit
+                self.remember(repository_id, [commit])
+        return found
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._commits)
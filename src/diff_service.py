@@ -3,10 +3,17 @@ Diff service: compare SOURCE vs TARGET per repo using diffs/commits API (no clon
 Produces per-repo status (aligned/divergent/error), commit count, file list, commit list.
 """
 
+import itertools
 import logging
-from typing import Any, Optional
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional
 
-from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+from azure_devops_client import DIFF_PAGE_SIZE, AzureDevOpsClient, AzureDevOpsClientError
+from commit_metadata import CommitMetadata
+from ref_resolver import RefSnapshot, resolve_ref_entry
+from shared_cache import RESULTS_TTL_SEC
+from tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +21,18 @@ STATUS_ALIGNED = "aligned"
 STATUS_DIVERGENT = "divergent"
 STATUS_ERROR = "error"
 
-MAX_FILES_DISPLAY = 100
+# Commit mostrati per repo nella dashboard (la lista nel risultato è completa)
 MAX_COMMITS_DISPLAY = 20
+# Repo confrontati in parallelo (le chiamate REST sono I/O bound)
+DEFAULT_MAX_WORKERS = 8
+
+# Strategie di confronto: diffs/commits per coppia, oppure stats/branches (solo Branch vs Branch)
+STRATEGY_DIFF = "diff"
+STRATEGY_BRANCH_STATS = "branch_stats"
+
+# Margine del watermark dei push: assorbe lo scarto tra orologio locale e server (un repo può essere
+# ricalcolato una volta di troppo, mai saltato)
+PUSH_WATERMARK_SKEW_SEC = 120
 
 
 def _version_type_from_ref_type(ref_type: str) -> str:
@@ -26,24 +43,126 @@ def _version_type_from_ref_type(ref_type: str) -> str:
     return "commit"
 
 
-def get_diff_for_repo(
+def change_path(ch: dict) -> str:
+    item = ch.get("item") if isinstance(ch.get("item"), dict) else {}
+    return item.get("path") or item.get("originalPath") or ch.get("path") or ""
+
+
+def _collect_diff_files(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    source_commit: str,
+    target_commit: str,
+    first_page: Optional[dict] = None,
+) -> tuple[list[str], bool]:
+    """
+    Percorsi di tutte le change del diff TARGET..SOURCE, pagina per pagina (solo i path restano in memoria).
+    first_page: prima pagina già scaricata (top=DIFF_PAGE_SIZE), si prosegue da lì.
+    Restituisce (paths, completo); se una pagina successiva fallisce si tengono quelli già letti.
+    """
+    def _pages(skip: int) -> Iterable[dict]:
+        return client.iter_diff_changes(
+            repository_id,
+            base_version=target_commit,
+            target_version=source_commit,
+            base_version_type="commit",
+            target_version_type="commit",
+            page_size=DIFF_PAGE_SIZE,
+            skip=skip,
+        )
+
+    if first_page is None:
+        changes: Iterable[dict] = _pages(0)
+    else:
+        first = first_page.get("changes") or []
+        changes = first
+        if len(first) >= DIFF_PAGE_SIZE and not first_page.get("allChangesIncluded"):
+            changes = itertools.chain(first, _pages(len(first)))
+    paths: list[str] = []
+    try:
+        for ch in changes:
+            path = change_path(ch)
+            if path:
+                paths.append(path)
+    except AzureDevOpsClientError as e:
+        if not paths:
+            raise
+        logger.warning("Lista file incompleta per repo %s: %s", repository_id, e)
+        return paths, False
+    return paths, True
+
+
+def compact_commit(c: dict) -> dict:
+    """Voce della lista commit del risultato."""
+    return {
+        "commitId": c.get("commitId", "")[:7],
+        "comment": (c.get("comment") or "").strip(),
+        "author": (c.get("author") or {}).get("name", ""),
+        "date": (c.get("committer") or c.get("author") or {}).get("date", ""),
+    }
+
+
+def _fetch_ahead_commits(
     client: AzureDevOpsClient,
+    repository_id: str,
+    source_commit: str,
+    target_commit: str,
+    metadata: Optional[CommitMetadata] = None,
+) -> list[dict]:
+    """Tutti i commit in SOURCE non in TARGET (paginati), in forma compatta."""
+    commits = []
+    try:
+        for c in client.iter_commits_compare(
+            repository_id,
+            source_version=source_commit,
+            target_version=target_commit,
+            source_version_type="commit",
+            target_version_type="commit",
+        ):
+            if metadata is not None and not commits:
+                # Il primo è il commit SOURCE: il suo dettaglio non costa un'altra richiesta
+                metadata.remember(repository_id, [c])
+            commits.append(compact_commit(c))
+    except AzureDevOpsClientError as e:
+        logger.warning("Lista commit incompleta per repo %s: %s", repository_id, e)
+    return commits
+
+
+def _fill_commit_metadata(
+    client: AzureDevOpsClient,
+    result: dict[str, Any],
+    repository_id: str,
+    source_commit: str,
+    target_commit: str,
+    metadata: Optional[CommitMetadata] = None,
+) -> None:
+    """Dettaglio messaggio e autore per SOURCE e TARGET commit (un solo commitsbatch per i commit non ancora visti)."""
+    if metadata is None:
+        metadata = CommitMetadata(client)
+    found = metadata.get_many(repository_id, [source_commit, target_commit])
+    apply_commit_metadata(result, found, source_commit, target_commit)
+
+
+def apply_commit_metadata(result: dict[str, Any], found: dict[str, dict], source_commit: str, target_commit: str) -> None:
+    """Messaggio, autore e data di SOURCE e TARGET da SHA (minuscolo) -> commit."""
+    for prefix, commit_id in (("source", source_commit), ("target", target_commit)):
+        c = found.get((commit_id or "").lower())
+        if c:
+            result[f"{prefix}_commit_message"] = (c.get("comment") or "").strip()
+            result[f"{prefix}_commit_author"] = (c.get("author") or {}).get("name", "")
+            result[f"{prefix}_commit_date"] = (c.get("committer") or c.get("author") or {}).get("date", "")
+
+
+def new_result(
     repository_id: str,
     repo_name: str,
     source_commit: str,
     target_commit: str,
     source_display: str,
     target_display: str,
-    source_ref_type: str,
-    target_ref_type: str,
-    fetch_commits: bool = True,
+    quick: bool = False,
 ) -> dict[str, Any]:
-    """
-    Compare source vs target for one repo. Uses baseVersion=target, targetVersion=source
-    so we get "what's in source that's not in target" (aheadCount = commits in source ahead of target).
-    Returns dict with: status, commit_count, file_count, commits, files, note, source_ref, target_ref.
-    """
-    result = {
+    return {
         "repo_id": repository_id,
         "repo_name": repo_name,
         "status": STATUS_ERROR,
@@ -56,6 +175,8 @@ def get_diff_for_repo(
         "target_ref": target_display,
         "source_commit": (source_commit or "")[:7],
         "target_commit": (target_commit or "")[:7],
+        "source_commit_id": source_commit or "",
+        "target_commit_id": target_commit or "",
         "source_commit_message": "",
         "source_commit_author": "",
         "source_commit_date": "",
@@ -64,8 +185,86 @@ def get_diff_for_repo(
         "target_commit_date": "",
         "ahead_count": 0,
         "behind_count": 0,
+        "details_loaded": not quick,
     }
 
+
+def divergent_note(ahead_count: int, file_count: Optional[int], files_complete: bool = True) -> str:
+    """Nota di un repo divergente; file_count None = totale non noto."""
+    note = f"{ahead_count} commit in SOURCE non in TARGET"
+    if file_count is not None:
+        note += f", {file_count} file modificati"
+    if not files_complete:
+        note += ", elenco file incompleto"
+    return note
+
+
+def classify_diff(
+    result: dict[str, Any],
+    diff: dict,
+    quick: bool,
+    files: Optional[tuple[list[str], bool]] = None,
+) -> None:
+    """
+    Stato, conteggi e nota dalla prima pagina di diffs/commits (TARGET..SOURCE) e, nel confronto completo,
+    dalla lista file raccolta (paths, completa). Con lista incompleta il conteggio resta quello del diff
+    (None se la pagina non era completa) e la nota lo segnala.
+    """
+    change_counts = diff.get("changeCounts") or {}
+    total_changes = sum(change_counts.values()) if isinstance(change_counts, dict) else 0
+    ahead_count = diff.get("aheadCount") or 0
+    behind_count = diff.get("behindCount") or 0
+
+    # changeCounts descrive solo la pagina ricevuta ($top/$skip), aheadCount/behindCount l'intero diff:
+    # il totale dei file è noto solo se la pagina è completa, altrimenti (modalità rapida) resta None
+    first_changes = diff.get("changes") or []
+    page_complete = diff.get("allChangesIncluded") or len(first_changes) < (1 if quick else DIFF_PAGE_SIZE)
+    file_count: Optional[int] = total_changes if page_complete else None
+    files_complete = True
+    if files is not None:
+        result["files"], files_complete = files
+        if files_complete:
+            # La lista raccolta contiene già la prima pagina: è il conteggio più preciso disponibile
+            file_count = len(result["files"])
+    result["file_count"] = file_count
+    result["ahead_count"] = ahead_count
+    result["behind_count"] = behind_count
+    result["commit_count"] = ahead_count  # commits in source not in target
+
+    if total_changes == 0 and ahead_count == 0:
+        result["status"] = STATUS_ALIGNED
+        result["note"] = "Nessuna differenza"
+    else:
+        result["status"] = STATUS_DIVERGENT
+        result["note"] = divergent_note(ahead_count, file_count, files_complete)
+
+
+def get_diff_for_repo(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    repo_name: str,
+    source_commit: str,
+    target_commit: str,
+    source_display: str,
+    target_display: str,
+    source_ref_type: str,
+    target_ref_type: str,
+    fetch_commits: bool = True,
+    quick: bool = False,
+    metadata: Optional[CommitMetadata] = None,
+) -> dict[str, Any]:
+    """
+    Compare source vs target for one repo. Uses baseVersion=target, targetVersion=source
+    so we get "what's in source that's not in target" (aheadCount = commits in source ahead of target).
+    Returns dict with: status, commit_count, file_count, commits, files, note, source_ref, target_ref.
+    quick=True: solo stato e conteggi ahead/behind (una chiamata); commit, file e dettaglio
+    SOURCE/TARGET si caricano dopo con load_diff_details (details_loaded=False).
+    metadata: commit già visti nel run (RefSnapshot.commits) per il dettaglio SOURCE/TARGET.
+    """
+    result = new_result(
+        repository_id, repo_name, source_commit, target_commit, source_display, target_display, quick=quick
+    )
+
     if source_commit == target_commit:
         result["status"] = STATUS_ALIGNED
         result["note"] = "Stesso commit"
@@ -73,90 +272,249 @@ def get_diff_for_repo(
 
     try:
         # baseVersion=target, targetVersion=source -> diff from target to source (what's ahead in source)
-        base_vt = _version_type_from_ref_type(target_ref_type)
-        target_vt = _version_type_from_ref_type(source_ref_type)
         # When using commit SHA we must pass versionType=commit
-        diff = client.get_diffs_commits(
-            repository_id,
-            base_version=target_commit,
-            target_version=source_commit,
-            base_version_type="commit",
-            target_version_type="commit",
-            top=MAX_FILES_DISPLAY,
-        )
+        # In modalità rapida basta una pagina minima: aheadCount/behindCount sono sull'intero diff, mentre
+        # changeCounts conta solo le modifiche della pagina (con $top=1 dice solo se ce n'è almeno una)
+        with span(client.tracer, "diff.first_page", repo=repo_name):
+            diff = client.get_diffs_commits(
+                repository_id,
+                base_version=target_commit,
+                target_version=source_commit,
+                base_version_type="commit",
+                target_version_type="commit",
+                top=1 if quick else DIFF_PAGE_SIZE,
+            )
     except AzureDevOpsClientError as e:
         result["note"] = e.message or str(e)
-        result["source_commit"] = (source_commit or "")[:7]
-        result["target_commit"] = (target_commit or "")[:7]
         if e.status_code == 404:
             result["note"] = "Ref non trovato o repository inaccessibile."
+        result["details_loaded"] = True
         return result
 
-    change_counts = diff.get("changeCounts") or {}
-    total_changes = sum(change_counts.values()) if isinstance(change_counts, dict) else 0
-    changes = diff.get("changes") or []
-    ahead_count = diff.get("aheadCount") or 0
-    behind_count = diff.get("behindCount") or 0
+    files: Optional[tuple[list[str], bool]] = None
+    if not quick:
+        with span(client.tracer, "diff.files", repo=repo_name) as sp:
+            files = _collect_diff_files(client, repository_id, source_commit, target_commit, first_page=diff)
+            sp["files"] = len(files[0])
+    classify_diff(result, diff, quick, files)
+    ahead_count = result["ahead_count"]
 
-    file_paths = []
-    for ch in changes[:MAX_FILES_DISPLAY]:
-        item = ch.get("item") if isinstance(ch.get("item"), dict) else {}
-        path = item.get("path") or item.get("originalPath") or ch.get("path") or ""
-        if path:
-            file_paths.append(path)
-    result["files"] = file_paths
-    result["file_count"] = total_changes
+    if quick:
+        return result
+
+    if fetch_commits and ahead_count > 0:
+        with span(client.tracer, "diff.ahead_commits", repo=repo_name, ahead=ahead_count):
+            result["commits"] = _fetch_ahead_commits(client, repository_id, source_commit, target_commit, metadata)
+    with span(client.tracer, "diff.commit_metadata", repo=repo_name):
+        _fill_commit_metadata(client, result, repository_id, source_commit, target_commit, metadata)
+    return result
+
+
+def get_branch_stats_for_repo(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    repo_name: str,
+    source_commit: str,
+    target_commit: str,
+    source_branch: str,
+    target_display: str,
+) -> Optional[dict[str, Any]]:
+    """
+    Classifica aligned/divergent con stats/branches (SOURCE branch vs TARGET commit come base), senza diffs/commits.
+    Restituisce un risultato rapido (details_loaded=False, file_count None) oppure None se le statistiche
+    non sono utilizzabili (endpoint assente, branch non trovato o spostato dopo la risoluzione):
+    in quel caso il chiamante ripiega sul diff per coppia.
+    """
+    try:
+        stats = client.get_branch_stats(
+            repository_id,
+            base_version=target_commit,
+            base_version_type="commit",
+            name=source_branch,
+        )
+    except AzureDevOpsClientError as e:
+        logger.debug("stats/branches non disponibile per repo %s: %s", repo_name, e)
+        return None
+    entry = next((b for b in stats if b.get("name") == source_branch), None)
+    if not entry or (entry.get("commit") or {}).get("commitId") != source_commit:
+        return None
+
+    ahead_count = entry.get("aheadCount") or 0
+    behind_count = entry.get("behindCount") or 0
+    result = new_result(
+        repository_id, repo_name, source_commit, target_commit, source_branch, target_display, quick=True
+    )
+    result["file_count"] = None  # noto solo dopo load_diff_details
     result["ahead_count"] = ahead_count
     result["behind_count"] = behind_count
-    result["commit_count"] = ahead_count  # commits in source not in target
-
-    if total_changes == 0 and ahead_count == 0:
+    result["commit_count"] = ahead_count
+    if ahead_count == 0:
+        # SOURCE contenuto in TARGET: il diff dal merge-base è vuoto
         result["status"] = STATUS_ALIGNED
         result["note"] = "Nessuna differenza"
+        result["file_count"] = 0
     else:
         result["status"] = STATUS_DIVERGENT
-        result["note"] = f"{ahead_count} commit in SOURCE non in TARGET, {total_changes} file modificati"
+        result["note"] = f"{ahead_count} commit in SOURCE non in TARGET"
+    return result
 
-    if fetch_commits and ahead_count > 0:
-        try:
-            commits = client.get_commits_compare(
-                repository_id,
-                source_version=source_commit,
-                target_version=target_commit,
-                source_version_type="commit",
-                target_version_type="commit",
-                top=MAX_COMMITS_DISPLAY,
-            )
-            result["commits"] = [
-                {
-                    "commitId": c.get("commitId", "")[:7],
-                    "comment": (c.get("comment") or "").strip(),
-                    "author": (c.get("author") or {}).get("name", ""),
-                    "date": (c.get("committer") or c.get("author") or {}).get("date", ""),
-                }
-                for c in commits
-            ]
-        except AzureDevOpsClientError:
-            result["commits"] = []
-
-    result["source_commit"] = (source_commit or "")[:7]
-    result["target_commit"] = (target_commit or "")[:7]
-    # Dettaglio messaggio e autore per SOURCE e TARGET commit
-    if source_commit:
-        src_c = client.get_commit_by_id(repository_id, source_commit)
-        if src_c:
-            result["source_commit_message"] = (src_c.get("comment") or "").strip()
-            result["source_commit_author"] = (src_c.get("author") or {}).get("name", "")
-            result["source_commit_date"] = (src_c.get("committer") or src_c.get("author") or {}).get("date", "")
-    if target_commit:
-        tgt_c = client.get_commit_by_id(repository_id, target_commit)
-        if tgt_c:
-            result["target_commit_message"] = (tgt_c.get("comment") or "").strip()
-            result["target_commit_author"] = (tgt_c.get("author") or {}).get("name", "")
-            result["target_commit_date"] = (tgt_c.get("committer") or tgt_c.get("author") or {}).get("date", "")
+
+def load_diff_details(
+    client: AzureDevOpsClient,
+    result: dict[str, Any],
+    fetch_commits: bool = True,
+    metadata: Optional[CommitMetadata] = None,
+) -> dict[str, Any]:
+    """
+    Secondo livello del confronto rapido: lista file, commit SOURCE non in TARGET e dettaglio
+    SOURCE/TARGET per un risultato con details_loaded=False. Aggiorna result in place e lo restituisce.
+    """
+    if result.get("details_loaded") or result.get("status") == STATUS_ERROR:
+        return result
+    repository_id = result.get("repo_id")
+    source_commit = result.get("source_commit_id") or ""
+    target_commit = result.get("target_commit_id") or ""
+    if not repository_id or not source_commit or not target_commit:
+        return result
+    repo_name = result.get("repo_name")
+    try:
+        if source_commit != target_commit:
+            with span(client.tracer, "diff.files", repo=repo_name):
+                files, files_complete = _collect_diff_files(client, repository_id, source_commit, target_commit)
+            result["files"] = files
+            if files_complete:
+                result["file_count"] = len(files)
+            if result.get("status") == STATUS_DIVERGENT:
+                result["note"] = divergent_note(
+                    result.get("ahead_count") or 0, result.get("file_count"), files_complete
+                )
+            if fetch_commits and (result.get("ahead_count") or 0) > 0:
+                with span(client.tracer, "diff.ahead_commits", repo=repo_name):
+                    result["commits"] = _fetch_ahead_commits(
+                        client, repository_id, source_commit, target_commit, metadata
+                    )
+        with span(client.tracer, "diff.commit_metadata", repo=repo_name):
+            _fill_commit_metadata(client, result, repository_id, source_commit, target_commit, metadata)
+    except AzureDevOpsClientError as e:
+        logger.warning("Dettagli non caricati per repo %s: %s", repo_name, e)
+        result["details_error"] = e.message or str(e)
+        return result
+    result.pop("details_error", None)
+    result["details_loaded"] = True
     return result
 
 
+def error_result(
+    repo_id: Optional[str],
+    repo_name: str,
+    note: str,
+    source_ref: str = "",
+    target_ref: str = "",
+    source_commit: Optional[str] = "",
+    target_commit: Optional[str] = "",
+) -> dict[str, Any]:
+    return {
+        "repo_id": repo_id,
+        "repo_name": repo_name,
+        "status": STATUS_ERROR,
+        "commit_count": 0,
+        "file_count": 0,
+        "commits": [],
+        "files": [],
+        "note": note,
+        "source_ref": source_ref,
+        "target_ref": target_ref,
+        "source_commit": (source_commit or "")[:7],
+        "target_commit": (target_commit or "")[:7],
+    }
+
+
+def _diff_for_repo_entry(
+    client: AzureDevOpsClient,
+    repo: dict,
+    source_resolved: dict[str, dict],
+    target_resolved: dict[str, dict],
+    source_ref_type: str,
+    target_ref_type: str,
+    quick: bool = False,
+    strategy: str = STRATEGY_DIFF,
+    metadata: Optional[CommitMetadata] = None,
+) -> dict[str, Any]:
+    """Confronto di un singolo repo della lista: gli errori restano confinati nel suo risultato."""
+    repo_id = repo.get("id") or repo.get("name")
+    repo_name = repo.get("name", str(repo_id))
+    if not repo_id:
+        return error_result(repo_id, repo_name, "Repo senza id")
+
+    src = source_resolved.get(repo_id) or {}
+    tgt = target_resolved.get(repo_id) or {}
+    source_ref = src.get("display_ref") or ""
+    target_ref = tgt.get("display_ref") or ""
+
+    if src.get("error"):
+        return error_result(
+            repo_id, repo_name, f"SOURCE: {src.get('error')}",
+            source_ref, target_ref, src.get("commit_id"), tgt.get("commit_id"),
+        )
+    if tgt.get("error"):
+        return error_result(
+            repo_id, repo_name, f"TARGET: {tgt.get('error')}",
+            source_ref, target_ref, src.get("commit_id"), tgt.get("commit_id"),
+        )
+
+    source_commit = src.get("commit_id")
+    target_commit = tgt.get("commit_id")
+    if not source_commit or not target_commit:
+        return error_result(
+            repo_id, repo_name, "Ref non risolto",
+            source_ref, target_ref, source_commit, target_commit,
+        )
+
+    if (
+        strategy == STRATEGY_BRANCH_STATS
+        and source_ref_type == "branch"
+        and target_ref_type == "branch"
+        and source_commit != target_commit
+        and src.get("display_ref")
+    ):
+        with span(client.tracer, "branch_stats", repo=repo_name):
+            stats_result = get_branch_stats_for_repo(
+                client,
+                repository_id=repo_id,
+                repo_name=repo_name,
+                source_commit=source_commit,
+                target_commit=target_commit,
+                source_branch=src["display_ref"],
+                target_display=target_ref or target_commit[:7],
+            )
+        if stats_result is not None:
+            return stats_result
+
+    try:
+        with span(client.tracer, "diff", repo=repo_name, quick=quick):
+            return get_diff_for_repo(
+                client,
+                repository_id=repo_id,
+                repo_name=repo_name,
+                source_commit=source_commit,
+                target_commit=target_commit,
+                source_display=source_ref or source_commit[:7],
+                target_display=target_ref or target_commit[:7],
+                source_ref_type=source_ref_type,
+                target_ref_type=target_ref_type,
+                fetch_commits=True,
+                quick=quick,
+                metadata=metadata,
+            )
+    except AzureDevOpsClientError as e:
+        # Errori non gestiti dentro get_diff_for_repo (es. dettaglio commit): restano sul singolo repo
+        logger.warning("Confronto fallito per repo %s: %s", repo_name, e)
+        return error_result(
+            repo_id, repo_name, e.message or str(e),
+            source_ref, target_ref, source_commit, target_commit,
+        )
+
+
 def get_diffs_for_repos(
     client: AzureDevOpsClient,
     repositories: list[dict],
@@ -164,98 +522,244 @@ def get_diffs_for_repos(
     target_resolved: dict[str, dict],
     source_ref_type: str,
     target_ref_type: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    quick: bool = False,
+    strategy: str = STRATEGY_DIFF,
 ) -> list[dict[str, Any]]:
     """
     For each repo, resolve refs and run diff. source/target_resolved: repo_id -> { commit_id, display_ref, error }.
+    Con max_workers > 1 i repo vengono confrontati in parallelo (al massimo max_workers alla volta);
+    l'ordine dei risultati resta quello di repositories. quick: vedi get_diff_for_repo.
+    strategy=STRATEGY_BRANCH_STATS (solo Branch vs Branch): stato da stats/branches senza diffs/commits,
+    con ripiego sul diff per coppia dove le statistiche non bastano.
     """
-    results = []
-    for repo in repositories:
-        repo_id = repo.get("id") or repo.get("name")
-        repo_name = repo.get("name", str(repo_id))
-        if not repo_id:
-            results.append({
-                "repo_id": repo_id,
-                "repo_name": repo_name,
-                "status": STATUS_ERROR,
-                "commit_count": 0,
-                "file_count": 0,
-                "commits": [],
-                "files": [],
-                "note": "Repo senza id",
-                "source_ref": "",
-                "target_ref": "",
-                "source_commit": "",
-                "target_commit": "",
-            })
-            continue
-
-        src = source_resolved.get(repo_id) or {}
-        tgt = target_resolved.get(repo_id) or {}
-
-        if src.get("error"):
-            results.append({
-                "repo_id": repo_id,
-                "repo_name": repo_name,
-                "status": STATUS_ERROR,
-                "commit_count": 0,
-                "file_count": 0,
-                "commits": [],
-                "files": [],
-                "note": f"SOURCE: {src.get('error')}",
-                "source_ref": src.get("display_ref") or "",
-                "target_ref": tgt.get("display_ref") or "",
-                "source_commit": (src.get("commit_id") or "")[:7],
-                "target_commit": (tgt.get("commit_id") or "")[:7],
-            })
-            continue
-        if tgt.get("error"):
-            results.append({
-                "repo_id": repo_id,
-                "repo_name": repo_name,
-                "status": STATUS_ERROR,
-                "commit_count": 0,
-                "file_count": 0,
-                "commits": [],
-                "files": [],
-                "note": f"TARGET: {tgt.get('error')}",
-                "source_ref": src.get("display_ref") or "",
-                "target_ref": tgt.get("display_ref") or "",
-                "source_commit": (src.get("commit_id") or "")[:7],
-                "target_commit": (tgt.get("commit_id") or "")[:7],
-            })
-            continue
-
-        source_commit = src.get("commit_id")
-        target_commit = tgt.get("commit_id")
-        if not source_commit or not target_commit:
-            results.append({
-                "repo_id": repo_id,
-                "repo_name": repo_name,
-                "status": STATUS_ERROR,
-                "commit_count": 0,
-                "file_count": 0,
-                "commits": [],
-                "files": [],
-                "note": "Ref non risolto",
-                "source_ref": src.get("display_ref") or "",
-                "target_ref": tgt.get("display_ref") or "",
-                "source_commit": (source_commit or "")[:7],
-                "target_commit": (target_commit or "")[:7],
-            })
-            continue
-
-        r = get_diff_for_repo(
-            client,
-            repository_id=repo_id,
-            repo_name=repo_name,
-            source_commit=source_commit,
-            target_commit=target_commit,
-            source_display=src.get("display_ref") or source_commit[:7],
-            target_display=tgt.get("display_ref") or target_commit[:7],
-            source_ref_type=source_ref_type,
-            target_ref_type=target_ref_type,
-            fetch_commits=True,
+    def _run(repo: dict) -> dict[str, Any]:
+        return _diff_for_repo_entry(
+            client, repo, source_resolved, target_resolved, source_ref_type, target_ref_type,
+            quick=quick, strategy=strategy,
         )
-        results.append(r)
 
+    results: list[dict[str, Any]] = [{} for _ in repositories]
+    for index, result in _iter_parallel(_run, repositories, max_workers):
+        results[index] = result
     return results
+
+
+def _iter_parallel(
+    fn: Callable[[dict], dict[str, Any]],
+    repositories: list[dict],
+    max_workers: int,
+) -> Iterator[tuple[int, dict[str, Any]]]:
+    """
+    Esegue fn su ogni repo con al massimo max_workers thread e produce (indice, risultato)
+    nell'ordine di completamento. Se il consumatore si ferma, i repo non ancora avviati vengono annullati.
+    """
+    workers = max(1, min(max_workers or 1, len(repositories)))
+    if workers == 1:
+        for index, repo in enumerate(repositories):
+            yield index, fn(repo)
+        return
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gitsnap-diff")
+    try:
+        pending = {pool.submit(fn, repo): index for index, repo in enumerate(repositories)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _reuse_result(
+    client: AzureDevOpsClient,
+    previous: Optional[dict[str, Any]],
+    src: dict,
+    tgt: dict,
+    quick: bool,
+    metadata: Optional[CommitMetadata] = None,
+) -> Optional[dict[str, Any]]:
+    """
+    Copia del risultato precedente se SOURCE e TARGET risolvono agli stessi commit (il diff tra due SHA
+    non cambia); si aggiornano solo i ref mostrati. None se va ricalcolato.
+    """
+    if not previous or previous.get("status") == STATUS_ERROR or src.get("error") or tgt.get("error"):
+        return None
+    if not src.get("commit_id") or not tgt.get("commit_id"):
+        return None
+    if previous.get("source_commit_id") != src["commit_id"] or previous.get("target_commit_id") != tgt["commit_id"]:
+        return None
+    result = _reused_copy(client, previous, quick, metadata)
+    result["source_ref"] = src.get("display_ref") or result.get("source_ref", "")
+    result["target_ref"] = tgt.get("display_ref") or result.get("target_ref", "")
+    return result
+
+
+def _reused_copy(
+    client: AzureDevOpsClient,
+    previous: dict[str, Any],
+    quick: bool,
+    metadata: Optional[CommitMetadata] = None,
+) -> dict[str, Any]:
+    result = dict(previous)
+    result["reused"] = True
+    result.pop("cached", None)
+    if not quick and result.get("details_loaded") is False:
+        # Risultato rapido riusato in un confronto completo: si caricano solo i dettagli mancanti
+        load_diff_details(client, result, metadata=metadata)
+    return result
+
+
+def _push_watermark() -> str:
+    """Istante (UTC, ISO 8601) da cui cercare nuovi push al prossimo refresh, preso prima della risoluzione."""
+    moment = datetime.now(timezone.utc) - timedelta(seconds=PUSH_WATERMARK_SKEW_SEC)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _no_pushes_since(
+    client: AzureDevOpsClient,
+    repo_id: str,
+    previous: Optional[dict[str, Any]],
+    ref_spec: list[str],
+) -> bool:
+    """
+    True se il repo non ha ricevuto push (branch o tag) dal watermark del risultato precedente, calcolato
+    con gli stessi SOURCE/TARGET: il risultato vale ancora senza risolvere i ref. Nel dubbio False.
+    """
+    if not previous or previous.get("status") == STATUS_ERROR or not previous.get("push_watermark"):
+        return False
+    if previous.get("ref_spec") != ref_spec:
+        return False
+    with span(client.tracer, "pushes.probe"):
+        try:
+            return not client.get_pushes(repo_id, from_date=previous["push_watermark"], top=1)
+        except AzureDevOpsClientError as e:
+            logger.debug("Push di %s non disponibili (%s): ricalcolo completo", repo_id, e)
+            return False
+
+
+def _shared_diff(
+    client: AzureDevOpsClient,
+    repo: dict,
+    src: dict,
+    tgt: dict,
+    source_ref_type: str,
+    target_ref_type: str,
+    quick: bool,
+    strategy: str,
+    metadata: Optional[CommitMetadata],
+) -> dict[str, Any]:
+    """
+    _diff_for_repo_entry condiviso tra sessioni: stessa coppia di SHA, stesse credenziali e modalità
+    danno lo stesso risultato, calcolato una volta sola (anche se richiesto in contemporanea).
+    Un risultato calcolato da un'altra richiesta (in cache fino a RESULTS_TTL_SEC) ha cached=True.
+    """
+    computed = []
+
+    def _compute() -> dict[str, Any]:
+        computed.append(True)
+        return _diff_for_repo_entry(
+            client, repo, {repo_id: src}, {repo_id: tgt}, source_ref_type, target_ref_type,
+            quick=quick, strategy=strategy, metadata=metadata,
+        )
+
+    repo_id = repo.get("id") or repo.get("name")
+    if client.shared is None or src.get("error") or tgt.get("error"):
+        return _compute()
+    if not src.get("commit_id") or not tgt.get("commit_id"):
+        return _compute()
+    key = ("result", client.scope_key, repo_id, src["commit_id"], tgt["commit_id"], quick, strategy)
+    # Copia profonda dalla cache: il chiamante la aggiorna (ref mostrati, dettagli caricati dopo)
+    result = client.shared.get_or_compute(
+        key, _compute, ttl_sec=RESULTS_TTL_SEC, cacheable=lambda r: r.get("status") != STATUS_ERROR
+    )
+    if not computed:
+        result["cached"] = True
+    result["source_ref"] = src.get("display_ref") or result.get("source_ref", "")
+    result["target_ref"] = tgt.get("display_ref") or result.get("target_ref", "")
+    return result
+
+
+def _compare_repo(
+    client: AzureDevOpsClient,
+    repo: dict,
+    source_ref_type: str,
+    source_value: str,
+    target_ref_type: str,
+    target_value: str,
+    snapshot: RefSnapshot,
+    quick: bool,
+    strategy: str,
+    previous: Optional[dict[str, Any]] = None,
+    detect_pushes: bool = False,
+) -> dict[str, Any]:
+    """Risoluzione SOURCE/TARGET e confronto di un repo, come unica unità di lavoro (span "repo")."""
+    repo_id = repo.get("id") or repo.get("name")
+    if not repo_id:
+        return error_result(repo_id, repo.get("name", str(repo_id)), "Repo senza id")
+    ref_spec = [source_ref_type, source_value, target_ref_type, target_value]
+    with span(client.tracer, "repo", repo=repo.get("name", str(repo_id))) as sp:
+        watermark = _push_watermark() if detect_pushes else None
+        if detect_pushes and _no_pushes_since(client, repo_id, previous, ref_spec):
+            # Nessun push: si tiene anche il vecchio watermark
+            result = _reused_copy(client, previous, quick, snapshot.commits)
+            sp["status"] = result.get("status")
+            sp["reused"] = "pushes"
+            return result
+        try:
+            with span(client.tracer, "resolve.source"):
+                src = resolve_ref_entry(client, repo_id, source_ref_type, source_value, snapshot=snapshot)
+            with span(client.tracer, "resolve.target"):
+                tgt = resolve_ref_entry(client, repo_id, target_ref_type, target_value, snapshot=snapshot)
+        except AzureDevOpsClientError as e:
+            sp["status"] = STATUS_ERROR
+            return error_result(repo_id, repo.get("name", str(repo_id)), e.message or str(e))
+        result = _reuse_result(client, previous, src, tgt, quick, snapshot.commits)
+        if result is not None:
+            sp["reused"] = True
+        else:
+            result = _shared_diff(
+                client, repo, src, tgt, source_ref_type, target_ref_type, quick, strategy, snapshot.commits
+            )
+        if result.get("status") != STATUS_ERROR:
+            result["ref_spec"] = ref_spec
+            if watermark:
+                result["push_watermark"] = watermark
+        sp["status"] = result.get("status")
+        return result
+
+
+def iter_compare_repos(
+    client: AzureDevOpsClient,
+    repositories: list[dict],
+    source_ref_type: str,
+    source_value: str,
+    target_ref_type: str,
+    target_value: str,
+    snapshot: Optional[RefSnapshot] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    quick: bool = False,
+    strategy: str = STRATEGY_DIFF,
+    previous: Optional[dict[str, dict[str, Any]]] = None,
+    detect_pushes: bool = False,
+) -> Iterator[tuple[int, dict[str, Any]]]:
+    """
+    Confronto progressivo: per ogni repo risolve SOURCE e TARGET (dallo stesso snapshot) e calcola il diff,
+    producendo (indice in repositories, risultato) appena il repo è finito. Utile per mostrare i risultati
+    man mano; l'ordine finale si ricostruisce con l'indice.
+    previous: repo_id -> risultato del confronto precedente. I repo con la stessa coppia di SHA risolti
+    riusano quel risultato (reused=True) senza nuovo diff: un refresh costa la sola risoluzione dei ref.
+    detect_pushes: prima della risoluzione si chiede al repo se ha ricevuto push dal watermark del risultato
+    precedente (pushes, top=1); senza push il risultato si riusa senza leggere refs né tag. Il Pushes API è
+    per repository: il costo di un refresh resta una richiesta minima per repo, più il lavoro dei soli repo attivi.
+    """
+    if snapshot is None:
+        snapshot = RefSnapshot(client)
+    previous = previous or {}
+
+    def _run(repo: dict) -> dict[str, Any]:
+        return _compare_repo(
+            client, repo, source_ref_type, source_value, target_ref_type, target_value,
+            snapshot, quick, strategy, previous.get(repo.get("id") or repo.get("name")), detect_pushes,
+        )
+
+    yield from _iter_parallel(_run, repositories, max_workers)
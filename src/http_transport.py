@@ -0,0 +1,134 @@
+"""
+Trasporto HTTP del client sincrono: requests.Session con pool di connessioni dimensionato sulla concorrenza.
+- pool per host >= richieste in volo del client (+ margine): nessuna connessione scartata a pool pieno,
+  quindi niente handshake TCP/TLS ripetuti quando i worker lavorano in parallelo;
+- timeout separati: connessione breve (server irraggiungibile = errore presto), lettura lunga (diff grandi);
+- statistiche di riuso: richieste, connessioni aperte (handshake), connessioni scartate a pool pieno.
+HTTP/2 non è supportato da requests: è disponibile con il client asincrono (httpx, http2=True).
+"""
+
+import threading
+from typing import Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+CONNECT_TIMEOUT_SEC = 10
+READ_TIMEOUT_SEC = 60
+# Connessioni oltre le richieste in volo: richieste in streaming non ancora lette, prefetch, UI
+POOL_HEADROOM = 4
+
+
+class TransportStats:
+    """Contatori del pool, thread-safe: requests - connections_opened = richieste su connessioni riusate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.discarded = 0
+
+    def _add(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.connections_opened = self.discarded = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests_ = self.requests
+            opened = self.connections_opened
+            discarded = self.discarded
+        reused = max(0, requests_ - opened)
+        return {
+            "requests": requests_,
+            "connections_opened": opened,
+            "reused": reused,
+            "reuse_ratio": round(reused / requests_, 3) if requests_ else None,
+            "discarded": discarded,
+        }
+
+
+def _counting_pool_classes(stats: TransportStats) -> dict:
+    """Classi di pool urllib3 (http, https) che aggiornano stats: una coppia per trasporto."""
+
+    def _connection_cls(base: type) -> type:
+        def connect(self) -> None:
+            # Chiamato per ogni nuova connessione e per le riconnessioni di una connessione chiusa dal server
+            stats._add("connections_opened")
+            base.connect(self)
+
+        return type(f"Counting{base.__name__}", (base,), {"connect": connect})
+
+    def _pool_cls(base: type, connection_cls: type) -> type:
+        def _get_conn(self, timeout=None):
+            stats._add("requests")
+            return base._get_conn(self, timeout)
+
+        def _put_conn(self, conn) -> None:
+            if conn is not None and self.pool is not None and self.pool.full():
+                stats._add("discarded")
+            base._put_conn(self, conn)
+
+        return type(
+            f"Counting{base.__name__}",
+            (base,),
+            {"ConnectionCls": connection_cls, "_get_conn": _get_conn, "_put_conn": _put_conn},
+        )
+
+    return {
+        "http": _pool_cls(HTTPConnectionPool, _connection_cls(HTTPConnection)),
+        "https": _pool_cls(HTTPSConnectionPool, _connection_cls(HTTPSConnection)),
+    }
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter con pool per host di pool_size connessioni e conteggi in stats."""
+
+    def __init__(self, pool_size: int, stats: TransportStats):
+        self.pool_size = pool_size
+        self.stats = stats
+        super().__init__(pool_connections=4, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self.stats)
+
+
+def pool_size_for(max_in_flight: int) -> int:
+    return max(1, int(max_in_flight)) + POOL_HEADROOM
+
+
+def build_session(
+    username: str,
+    pat: str,
+    max_in_flight: int,
+    stats: TransportStats,
+) -> requests.Session:
+    """Session autenticata con PooledAdapter per http e https."""
+    session = requests.Session()
+    session.auth = HTTPBasicAuth(username, pat)
+    session.headers["Accept"] = "application/json"
+    session.headers["Content-Type"] = "application/json"
+    mount_adapter(session, pool_size_for(max_in_flight), stats)
+    return session
+
+
+def verify_argument(verify: Union[bool, str]) -> Optional[Union[bool, str]]:
+    """
+    verify per session.request: None lascia a requests la scelta abituale (anche REQUESTS_CA_BUNDLE);
+    False o un bundle CA vanno passati per richiesta, perché le variabili d'ambiente prevalgono su Session.verify.
+    """
+    return None if verify is True else verify
+
+
+def mount_adapter(session: requests.Session, pool_size: int, stats: TransportStats) -> None:
+    """Monta un nuovo PooledAdapter; quello precedente non si chiude (può avere richieste in corso)."""
+    adapter = PooledAdapter(pool_size, stats)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
@@ -0,0 +1,167 @@
+"""
+Confronto multi-ambiente: N ambienti (es. Sviluppo, Collaudo, Produzione) in un solo passaggio,
+con una matrice ambiente×ambiente di allineamento per ogni repo.
+- ogni ambiente viene risolto una sola volta per repo (heads/tags dallo stesso RefSnapshot);
+- ambienti sullo stesso commit sono allineati senza chiamate; per ogni coppia non ordinata di commit
+  distinti basta un diffs/commits (aheadCount e behindCount danno entrambe le direzioni);
+- risoluzioni e diff di coppia di tutti i repo condividono lo stesso pool di worker.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Iterator, Optional
+
+from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+from diff_service import DEFAULT_MAX_WORKERS, STATUS_ALIGNED, STATUS_DIVERGENT, STATUS_ERROR
+from ref_resolver import RefSnapshot, resolve_ref_entry
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve_environments(
+    client: AzureDevOpsClient,
+    repo_id: str,
+    environments: list[dict],
+    snapshot: RefSnapshot,
+) -> list[dict]:
+    """Risolve ogni ambiente del repo: [{ name, ref, commit_id, error }] nello stesso ordine."""
+    resolved = []
+    for env in environments:
+        with span(client.tracer, "resolve.env", env=env.get("name")):
+            try:
+                entry = resolve_ref_entry(client, repo_id, env["ref_type"], env["value"], snapshot=snapshot)
+            except AzureDevOpsClientError as e:
+                entry = {"commit_id": None, "display_ref": env["value"], "error": e.message or str(e)}
+        resolved.append({
+            "name": env.get("name") or env["value"],
+            "ref": entry.get("display_ref") or env["value"],
+            "commit_id": entry.get("commit_id"),
+            "error": entry.get("error"),
+        })
+    return resolved
+
+
+def _unique_pairs(resolved: list[dict]) -> list[tuple[str, str]]:
+    """Coppie non ordinate di commit distinti (ordine stabile: per primo il commit dell'ambiente precedente)."""
+    commits = list(dict.fromkeys(r["commit_id"] for r in resolved if r["commit_id"] and not r["error"]))
+    return [(a, b) for i, a in enumerate(commits) for b in commits[i + 1:]]
+
+
+def _pair_diff(client: AzureDevOpsClient, repo_id: str, repo_name: str, pair: tuple[str, str]) -> dict:
+    """Un diffs/commits minimo (top=1) per la coppia: { ahead, behind } di b rispetto ad a, o { error }."""
+    a, b = pair
+    with span(client.tracer, "matrix.pair_diff", repo=repo_name):
+        try:
+            diff = client.get_diffs_commits(
+                repo_id,
+                base_version=a,
+                target_version=b,
+                base_version_type="commit",
+                target_version_type="commit",
+                top=1,
+            )
+        except AzureDevOpsClientError as e:
+            return {"error": e.message or str(e)}
+    return {"ahead": diff.get("aheadCount") or 0, "behind": diff.get("behindCount") or 0}
+
+
+def _cell(source: dict, target: dict, pair_results: dict[tuple[str, str], dict]) -> dict[str, Any]:
+    """Cella SOURCE (riga) vs TARGET (colonna): ahead = commit in SOURCE non in TARGET, come nel confronto singolo."""
+    if source["error"] or target["error"] or not source["commit_id"] or not target["commit_id"]:
+        return {"status": STATUS_ERROR, "ahead": None, "behind": None, "note": source["error"] or target["error"] or "Ref non risolto"}
+    if source["commit_id"] == target["commit_id"]:
+        return {"status": STATUS_ALIGNED, "ahead": 0, "behind": 0, "note": "Stesso commit"}
+    forward = pair_results.get((target["commit_id"], source["commit_id"]))
+    if forward is not None:
+        ahead, behind = forward.get("ahead"), forward.get("behind")
+    else:
+        # Coppia calcolata nell'altro verso (base=SOURCE, target=TARGET): si scambiano i conteggi
+        reverse = pair_results.get((source["commit_id"], target["commit_id"])) or {"error": "Diff mancante"}
+        forward = reverse
+        ahead, behind = reverse.get("behind"), reverse.get("ahead")
+    if forward.get("error"):
+        return {"status": STATUS_ERROR, "ahead": None, "behind": None, "note": forward["error"]}
+    status = STATUS_ALIGNED if not ahead else STATUS_DIVERGENT
+    note = "Nessuna differenza" if status == STATUS_ALIGNED else f"{ahead} commit in SOURCE non in TARGET"
+    return {"status": status, "ahead": ahead, "behind": behind, "note": note}
+
+
+def _build_matrix(repo: dict, resolved: list[dict], pair_results: dict[tuple[str, str], dict]) -> dict[str, Any]:
+    n = len(resolved)
+    cells = [
+        [None if i == j else _cell(resolved[i], resolved[j], pair_results) for j in range(n)]
+        for i in range(n)
+    ]
+    return {
+        "repo_id": repo.get("id") or repo.get("name"),
+        "repo_name": repo.get("name", ""),
+        "environments": resolved,
+        "cells": cells,
+        "pair_diffs": len(pair_results),
+    }
+
+
+def iter_compare_matrix(
+    client: AzureDevOpsClient,
+    repositories: list[dict],
+    environments: list[dict],
+    snapshot: Optional[RefSnapshot] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Iterator[tuple[int, dict[str, Any]]]:
+    """
+    environments: [{ "name", "ref_type", "value" }] (ref_type come in ref_resolver).
+    Produce (indice in repositories, matrice del repo) appena tutte le coppie del repo sono calcolate.
+    Matrice: { repo_id, repo_name, environments: [{ name, ref, commit_id, error }],
+    cells[i][j] (None sulla diagonale): { status, ahead, behind, note } per ambiente i (SOURCE) vs j (TARGET) }.
+    """
+    if snapshot is None:
+        snapshot = RefSnapshot(client)
+    workers = max(1, min(max_workers or 1, max(1, len(repositories))))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gitsnap-matrix")
+    try:
+        # future -> ("resolve", repo index) | ("pair", repo index, pair)
+        pending: dict[Any, tuple] = {}
+        resolved: dict[int, list[dict]] = {}
+        pair_results: dict[int, dict[tuple[str, str], dict]] = {}
+        open_pairs: dict[int, int] = {}
+        for index, repo in enumerate(repositories):
+            repo_id = repo.get("id") or repo.get("name")
+            future = pool.submit(_resolve_environments, client, repo_id, environments, snapshot)
+            pending[future] = ("resolve", index)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                index = task[1]
+                repo = repositories[index]
+                if task[0] == "resolve":
+                    resolved[index] = future.result()
+                    pairs = _unique_pairs(resolved[index])
+                    pair_results[index] = {}
+                    open_pairs[index] = len(pairs)
+                    repo_id = repo.get("id") or repo.get("name")
+                    for pair in pairs:
+                        pair_future = pool.submit(_pair_diff, client, repo_id, repo.get("name", ""), pair)
+                        pending[pair_future] = ("pair", index, pair)
+                else:
+                    pair_results[index][task[2]] = future.result()
+                    open_pairs[index] -= 1
+                if open_pairs[index] == 0:
+                    yield index, _build_matrix(repo, resolved.pop(index), pair_results.pop(index))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def matrix_summary(matrices: list[dict], n_environments: int) -> list[list[Optional[dict[str, int]]]]:
+    """Per ogni cella SOURCE i vs TARGET j: quanti repo sono allineati, divergenti, in errore (diagonale None)."""
+    summary: list[list[Optional[dict[str, int]]]] = [
+        [None if i == j else {STATUS_ALIGNED: 0, STATUS_DIVERGENT: 0, STATUS_ERROR: 0} for j in range(n_environments)]
+        for i in range(n_environments)
+    ]
+    for m in matrices:
+        for i, row in enumerate(m.get("cells") or []):
+            for j, cell in enumerate(row):
+                if cell is not None and summary[i][j] is not None:
+                    summary[i][j][cell["status"]] += 1
+    return summary
@@ -0,0 +1,157 @@
+"""
+Prefetch in background dei refs (heads/tags) appena il progetto è caricato, mentre l'utente sceglie
+repo e ambienti: il confronto parte con le liste già nella cache di processo del client.
+- ordine di priorità: prima i repo selezionati (riordinabile con prioritize), poi gli altri;
+- pochi worker dedicati, con le richieste comunque limitate dallo scheduler del client;
+- finita la coda, i refs dei repo selezionati si riscaricano ogni WARM_INTERVAL_SEC (meno del TTL dei refs)
+  finché l'utente interagisce con la pagina (prioritize) negli ultimi WARM_IDLE_SEC: scegliere i repo
+  richiede spesso più del TTL e il confronto deve trovare la cache ancora valida;
+- cancel() ferma i worker dopo la richiesta in corso (es. all'avvio del confronto, che poi si aggancia
+  alle richieste ancora in volo grazie al single-flight).
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+from ref_resolver import RefSnapshot
+from shared_cache import REFS_TTL_SEC
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_WORKERS = 4
+# Aggiornamento dei repo selezionati: sotto REFS_TTL_SEC, così la voce in cache non scade mai tra due giri
+WARM_INTERVAL_SEC = 20
+# Senza interazioni per questo tempo (utente andato via) l'aggiornamento si ferma
+WARM_IDLE_SEC = 300
+# Repo selezionati tenuti aggiornati al massimo (richieste ogni WARM_INTERVAL_SEC)
+WARM_MAX_REPOS = 200
+
+
+class RefPrefetcher:
+    """Scarica heads (e tags) dei repo in background; thread-safe, si usa una volta (start, poi cancel)."""
+
+    def __init__(
+        self,
+        client: AzureDevOpsClient,
+        repositories: list[dict],
+        priority_ids: Iterable[str] = (),
+        include_tags: bool = True,
+        workers: int = PREFETCH_WORKERS,
+        ttl_sec: float = REFS_TTL_SEC,
+        warm_interval_sec: float = WARM_INTERVAL_SEC,
+        warm_idle_sec: float = WARM_IDLE_SEC,
+    ):
+        self._client = client
+        self._ttl_sec = ttl_sec
+        self._snapshot = RefSnapshot(client, refs_ttl_sec=ttl_sec)
+        self._include_tags = include_tags
+        self._workers = max(1, workers)
+        self._warm_interval_sec = warm_interval_sec
+        self._warm_idle_sec = warm_idle_sec
+        self._warm_ids: list[str] = []
+        self._last_activity = time.monotonic()
+        self._warm_thread: Optional[threading.Thread] = None
+        self.warm_rounds = 0
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._threads: list[threading.Thread] = []
+        ids = [r.get("id") or r.get("name") for r in repositories]
+        self._queue: deque[str] = deque(i for i in ids if i)
+        self.total = len(self._queue)
+        self.done = 0
+        self.errors = 0
+        self.prioritize(priority_ids)
+
+    def start(self) -> "RefPrefetcher":
+        if self._client.shared is None:
+            # Senza cache di processo il confronto non vedrebbe i refs scaricati qui
+            logger.debug("Prefetch refs disattivato: il client non ha una cache condivisa")
+            return self
+        for n in range(min(self._workers, self.total)):
+            t = threading.Thread(target=self._run, name=f"gitsnap-prefetch-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if self._warm_interval_sec > 0:
+            self._warm_thread = threading.Thread(target=self._keep_warm, name="gitsnap-prefetch-warm", daemon=True)
+            self._warm_thread.start()
+        return self
+
+    def prioritize(self, repo_ids: Iterable[str]) -> None:
+        """
+        Sposta in testa alla coda i repo indicati (nell'ordine dato) non ancora scaricati; sono anche
+        i repo tenuti aggiornati a coda finita. Ogni chiamata conta come interazione dell'utente.
+        """
+        wanted = list(dict.fromkeys(i for i in repo_ids if i))
+        with self._lock:
+            self._warm_ids = wanted[:WARM_MAX_REPOS]
+            self._last_activity = time.monotonic()
+            pending = set(self._queue)
+            first = [i for i in wanted if i in pending]
+            if not first:
+                return
+            chosen = set(first)
+            self._queue = deque(first + [i for i in self._queue if i not in chosen])
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        with self._lock:
+            self._queue.clear()
+
+    @property
+    def running(self) -> bool:
+        """Coda in lavorazione o repo selezionati tenuti aggiornati."""
+        return any(t.is_alive() for t in self._threads) or self.warming
+
+    @property
+    def warming(self) -> bool:
+        return self._warm_thread is not None and self._warm_thread.is_alive()
+
+    def _next(self) -> Optional[str]:
+        with self._lock:
+            return self._queue.popleft() if self._queue and not self._cancelled.is_set() else None
+
+    def _run(self) -> None:
+        while True:
+            repo_id = self._next()
+            if repo_id is None:
+                return
+            try:
+                self._snapshot.heads(repo_id)
+                if self._include_tags and not self._cancelled.is_set():
+                    self._snapshot.tags(repo_id)
+            except AzureDevOpsClientError as e:
+                logger.debug("Prefetch refs fallito per %s: %s", repo_id, e)
+                with self._lock:
+                    self.errors += 1
+            with self._lock:
+                self.done += 1
+
+    def _keep_warm(self) -> None:
+        """Finita la coda, riscarica i refs dei repo selezionati a intervalli finché l'utente è attivo."""
+        while not self._cancelled.wait(self._warm_interval_sec):
+            with self._lock:
+                idle = time.monotonic() - self._last_activity
+                queued = bool(self._queue)
+                repo_ids = list(self._warm_ids)
+            if idle > self._warm_idle_sec:
+                logger.debug("Prefetch refs: nessuna interazione da %.0f s, aggiornamento fermato", idle)
+                return
+            if queued or any(t.is_alive() for t in self._threads):
+                continue
+            # Snapshot nuovo a ogni giro: liste dal server, pubblicate nella cache di processo
+            snapshot = RefSnapshot(self._client, refs_ttl_sec=self._ttl_sec, force_refresh=True)
+            for repo_id in repo_ids:
+                if self._cancelled.is_set():
+                    return
+                try:
+                    snapshot.heads(repo_id)
+                    if self._include_tags:
+                        snapshot.tags(repo_id)
+                except AzureDevOpsClientError as e:
+                    logger.debug("Aggiornamento refs fallito per %s: %s", repo_id, e)
+            with self._lock:
+                self.warm_rounds += 1
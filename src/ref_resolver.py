@@ -1,13 +1,20 @@
 """
 Resolves environment ref (branch, tag pattern, or commit SHA) to a concrete commit ID per repository.
 Tag pattern: lists tags matching pattern and selects the most recent by commit date.
+RefSnapshot: heads/tags di ogni repo scaricati una sola volta per run e condivisi tra SOURCE e TARGET,
+insieme ai commit già ricevuti (CommitMetadata) per il dettaglio SOURCE/TARGET.
 """
 
+import copy
 import fnmatch
 import logging
+import threading
 from typing import Optional
 
 from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+from commit_metadata import CommitMetadata
+from shared_cache import REFS_TTL_SEC
+from tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -38,113 +45,356 @@ def _branch_short_name(ref_name: str) -> Optional[str]:
     return None
 
 
+class RefSnapshot:
+    """
+    Snapshot dei refs per una singola esecuzione del confronto.
+    Ogni lista (heads o tags) di un repo viene scaricata al più una volta; le risoluzioni
+    successive (SOURCE, TARGET, ...) sono servite dalla memoria. Thread-safe.
+    commits: metadati dei commit visti nel run (es. date dei tag), riusati per il dettaglio SOURCE/TARGET.
+    refs_ttl_sec: per quanto le liste scaricate da altre sessioni (cache di processo del client) sono
+    ancora valide; 0 = sempre dal server.
+    force_refresh: liste sempre dal server (es. l'utente riesegue il confronto per vedere un push appena fatto),
+    poi pubblicate nella cache di processo per prefetch, matrice e altre sessioni.
+    """
+
+    def __init__(self, client: AzureDevOpsClient, refs_ttl_sec: float = REFS_TTL_SEC, force_refresh: bool = False):
+        self._client = client
+        self._refs_ttl_sec = refs_ttl_sec
+        self._force_refresh = force_refresh
+        self.commits = CommitMetadata(client)
+        self._refs: dict[tuple[str, str], list[dict]] = {}
+        self._key_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, repository_id: str, filter_prefix: str) -> list[dict]:
+        key = (repository_id, filter_prefix)
+        with self._lock:
+            if key in self._refs:
+                return self._refs[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Lock per chiave: due risoluzioni concorrenti sullo stesso repo fanno una sola chiamata
+        with key_lock:
+            with self._lock:
+                if key in self._refs:
+                    return self._refs[key]
+            with span(self._client.tracer, "refs." + filter_prefix[len("refs/"):].rstrip("/"), repo=repository_id):
+                refs = self._fetch(repository_id, filter_prefix)
+            with self._lock:
+                self._refs[key] = refs
+            return refs
+
+    def _fetch(self, repository_id: str, filter_prefix: str) -> list[dict]:
+        def _download() -> list[dict]:
+            return self._client.get_refs(
+                repository_id,
+                filter_prefix=filter_prefix,
+                top=1000,
+                peel_tags=(filter_prefix == "refs/tags/"),
+            )
+
+        shared = self._client.shared
+        if shared is None or self._refs_ttl_sec <= 0:
+            return _download()
+        key = ("refs", self._client.scope_key, repository_id, filter_prefix)
+        if self._force_refresh:
+            refs = _download()
+            if refs:
+                # Copia in cache: la lista restituita resta di questo snapshot
+                shared.put(key, copy.deepcopy(refs), ttl_sec=self._refs_ttl_sec)
+            return refs
+        return shared.get_or_compute(
+            key,
+            _download,
+            ttl_sec=self._refs_ttl_sec,
+            # Lista vuota anche per errori assorbiti da get_refs: non si condivide
+            cacheable=bool,
+        )
+
+    def heads(self, repository_id: str) -> list[dict]:
+        """Branch del repo (refs/heads/)."""
+        return self._get(repository_id, "refs/heads/")
+
+    def tags(self, repository_id: str) -> list[dict]:
+        """Tag del repo (refs/tags/), con peeledObjectId per i tag annotati."""
+        return self._get(repository_id, "refs/tags/")
+
+
+# Cache di processo: (server, repo, objectId del tag) -> (commit_id, data commit).
+# Un objectId identifica un oggetto git immutabile: se il tag viene spostato cambia objectId e quindi chiave.
+_TAG_COMMIT_CACHE: dict[tuple[str, str, str], tuple[str, str]] = {}
+_TAG_COMMIT_CACHE_MAX = 50_000
+_tag_cache_lock = threading.Lock()
+
+
+def tag_cache_key(client: AzureDevOpsClient, repository_id: str, obj_id: str) -> tuple[str, str, str]:
+    return (client.server_key, repository_id, obj_id)
+
+
+def tag_cache_put(key: tuple[str, str, str], commit_id: str, date_str: str) -> None:
+    with _tag_cache_lock:
+        if len(_TAG_COMMIT_CACHE) >= _TAG_COMMIT_CACHE_MAX:
+            _TAG_COMMIT_CACHE.clear()
+        _TAG_COMMIT_CACHE[key] = (commit_id, date_str)
+
+
+def legacy_tag_commit(commits: list[dict], obj_id: str) -> Optional[tuple[str, str]]:
+    """(commit_id, data) dalla risposta di get_commits con versionType=tag."""
+    if not commits:
+        # Lightweight tag: objectId might be the commit
+        return obj_id, ""
+    c = commits[0]
+    commit_id = c.get("commitId")
+    if not commit_id:
+        return None
+    date_str = c.get("committer", {}).get("date") or c.get("author", {}).get("date") or ""
+    return commit_id, date_str
+
+
+def legacy_tag_criteria(tag_name: str) -> dict:
+    return {"itemVersion.version": tag_name, "itemVersion.versionType": "tag"}
+
+
+def _resolve_tag_commit_legacy(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    tag_name: str,
+    obj_id: str,
+) -> Optional[tuple[str, str]]:
+    """Una chiamata get_commits per tag (versionType=tag): usata solo se peel/commitsbatch non bastano."""
+    try:
+        commits = client.get_commits(repository_id, search_criteria=legacy_tag_criteria(tag_name), top=1)
+    except AzureDevOpsClientError:
+        return obj_id, ""
+    return legacy_tag_commit(commits, obj_id)
+
+
+# Parti pure della risoluzione tag (condivise con il resolver asincrono di async_service):
+# plan_tag_commits -> commitsbatch dei candidati -> apply_tag_batch -> legacy per i rimasti -> tag_results
+def plan_tag_commits(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    matching: list[tuple[str, Optional[str], Optional[str]]],
+) -> tuple[dict[str, tuple[str, str]], dict[str, list[tuple[str, str]]]]:
+    """(tag già risolti dalla cache, commit_id candidato -> [(tag_name, obj_id)] da chiedere a commitsbatch)."""
+    resolved: dict[str, tuple[str, str]] = {}
+    pending: dict[str, list[tuple[str, str]]] = {}
+    for tag_name, obj_id, peeled_id in matching:
+        if not obj_id:
+            continue
+        with _tag_cache_lock:
+            cached = _TAG_COMMIT_CACHE.get(tag_cache_key(client, repository_id, obj_id))
+        if cached:
+            resolved[tag_name] = cached
+            continue
+        pending.setdefault(peeled_id or obj_id, []).append((tag_name, obj_id))
+    return resolved, pending
+
+
+def apply_tag_batch(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    batch: list[dict],
+    resolved: dict[str, tuple[str, str]],
+    pending: dict[str, list[tuple[str, str]]],
+) -> None:
+    """Commit ricevuti da commitsbatch: tag risolti (e in cache), tolti da pending."""
+    for c in batch:
+        commit_id = c.get("commitId")
+        if commit_id not in pending:
+            continue
+        date_str = (c.get("committer") or {}).get("date") or (c.get("author") or {}).get("date") or ""
+        for tag_name, obj_id in pending.pop(commit_id):
+            resolved[tag_name] = (commit_id, date_str)
+            tag_cache_put(tag_cache_key(client, repository_id, obj_id), commit_id, date_str)
+
+
+def tag_results(
+    matching: list[tuple[str, Optional[str], Optional[str]]],
+    resolved: dict[str, tuple[str, str]],
+) -> list[tuple[str, str, str]]:
+    return [
+        (tag_name, *resolved[tag_name])
+        for tag_name, _, _ in matching
+        if tag_name in resolved
+    ]
+
+
+def _resolve_tag_commits(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    matching: list[tuple[str, Optional[str], Optional[str]]],
+    commits: Optional[CommitMetadata] = None,
+) -> list[tuple[str, str, str]]:
+    """
+    Risolve i tag (tag_name, objectId, peeledObjectId) in (tag_name, commit_id, date_str).
+    Commit da peeledObjectId (tag annotati) o objectId (lightweight), date con commitsbatch:
+    un numero costante di chiamate per repo invece di una per tag. I risultati sono in cache.
+    """
+    resolved, pending = plan_tag_commits(client, repository_id, matching)
+    if pending:
+        try:
+            with span(client.tracer, "tags.commitsbatch", repo=repository_id, commits=len(pending)):
+                batch = client.get_commits_batch(repository_id, list(pending))
+        except AzureDevOpsClientError as e:
+            logger.debug("commitsbatch non disponibile per repo %s: %s", repository_id, e)
+            batch = []
+        if commits is not None:
+            commits.remember(repository_id, batch)
+        apply_tag_batch(client, repository_id, batch, resolved, pending)
+        # Rimasti: server senza peelTags (objectId = oggetto tag) o commitsbatch non supportato
+        for tags in pending.values():
+            for tag_name, obj_id in tags:
+                with span(client.tracer, "tags.legacy", repo=repository_id, tag=tag_name):
+                    found = _resolve_tag_commit_legacy(client, repository_id, tag_name, obj_id)
+                if not found:
+                    continue
+                resolved[tag_name] = found
+                if found[1]:
+                    tag_cache_put(tag_cache_key(client, repository_id, obj_id), *found)
+    return tag_results(matching, resolved)
+
+
+def select_branch(
+    heads: list[dict],
+    wanted: str,
+    repository_id: str,
+) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """Branch da una lista heads: nome esatto, poi senza maiuscole/minuscole, poi suffisso del ref."""
+    if not heads:
+        return None, None, f"Branch not found: {wanted}"
+
+    candidates = []
+    for r in heads:
+        full = (r.get("name") or "").strip()
+        short = _branch_short_name(full)
+        if short is None:
+            continue
+        candidates.append((full, short, r.get("objectId")))
+
+    exact = [c for c in candidates if c[1] == wanted]
+    if exact:
+        full, short, obj_id = exact[0]
+        if obj_id:
+            return obj_id, short, None
+
+    ci = [c for c in candidates if c[1].lower() == wanted.lower()]
+    if ci:
+        full, short, obj_id = ci[0]
+        if obj_id:
+            return obj_id, short, None
+
+    suffix = [c for c in candidates if c[0].endswith("/" + wanted)]
+    if suffix:
+        full, short, obj_id = suffix[0]
+        if obj_id:
+            return obj_id, short, None
+
+    logger.debug(
+        "Branch '%s' not found in repo %s. Available heads: %s",
+        wanted,
+        repository_id,
+        [c[1] for c in candidates],
+    )
+    return None, None, f"Branch not found: {wanted}"
+
+
+def matching_tags(tags: list[dict], pattern: str) -> list[tuple[str, Optional[str], Optional[str]]]:
+    """(tag_name, objectId, peeledObjectId) dei tag che corrispondono al pattern (fnmatch)."""
+    matching = []
+    for r in tags:
+        if not r.get("name", "").startswith("refs/tags/"):
+            continue
+        tag_name = _tag_name_from_ref(r.get("name", ""))
+        if fnmatch.fnmatch(tag_name, pattern):
+            matching.append((tag_name, r.get("objectId"), r.get("peeledObjectId")))
+    return matching
+
+
+def latest_tag(
+    tag_commits: list[tuple[str, str, str]],
+    pattern: str,
+) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """Il tag con il commit più recente (data vuota in fondo)."""
+    if not tag_commits:
+        return None, None, f"No resolvable tags for pattern: {pattern}"
+    tag_commits = sorted(tag_commits, key=lambda x: (x[2] or "0000"), reverse=True)
+    chosen_name, chosen_commit, _ = tag_commits[0]
+    return chosen_commit, chosen_name, None
+
+
+def check_ref_value(ref_type: str, ref_value: str) -> Optional[tuple[Optional[str], Optional[str], Optional[str]]]:
+    """Esito immediato (valore vuoto, SHA, tipo sconosciuto) senza chiamate; None se servono i refs."""
+    if not ref_value:
+        return None, None, "Ref value is empty."
+    if ref_type == REF_TYPE_COMMIT:
+        if len(ref_value) < 7:
+            return None, None, "Commit SHA too short."
+        return ref_value, ref_value[:7], None
+    if ref_type not in (REF_TYPE_BRANCH, REF_TYPE_TAG_PATTERN):
+        return None, None, f"Unknown ref type: {ref_type}"
+    return None
+
+
 def resolve_ref_for_repo(
     client: AzureDevOpsClient,
     repository_id: str,
     ref_type: str,
     ref_value: str,
+    snapshot: Optional[RefSnapshot] = None,
 ) -> tuple[Optional[str], Optional[str], Optional[str]]:
     """
     Resolve ref to (commit_id, display_ref, error_message).
     display_ref is the resolved ref to show (e.g. tag name chosen for tag pattern).
+    snapshot: se passato, heads/tags vengono letti dallo snapshot invece di chiamare get_refs.
     """
-    ref_value = (ref_value or "").strip()
-    if not ref_value:
-        return None, None, "Ref value is empty."
+    with span(client.tracer, f"resolve.{ref_type}", repo=repository_id, value=ref_value) as sp:
+        commit_id, display_ref, error = _resolve_ref_for_repo(client, repository_id, ref_type, ref_value, snapshot)
+        sp["ref"] = display_ref
+        if error:
+            sp["error"] = error
+    return commit_id, display_ref, error
 
-    if ref_type == REF_TYPE_COMMIT:
-        if len(ref_value) < 7:
-            return None, None, "Commit SHA too short."
-        return ref_value, ref_value[:7], None
+
+def _resolve_ref_for_repo(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    ref_type: str,
+    ref_value: str,
+    snapshot: Optional[RefSnapshot],
+) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    if snapshot is None:
+        snapshot = RefSnapshot(client)
+    ref_value = (ref_value or "").strip()
+    immediate = check_ref_value(ref_type, ref_value)
+    if immediate is not None:
+        return immediate
 
     if ref_type == REF_TYPE_BRANCH:
-        wanted = ref_value
-        all_heads = client.get_refs(repository_id, filter_prefix="refs/heads/", top=1000)
-        if not all_heads:
-            return None, None, f"Branch not found: {ref_value}"
-
-        candidates = []
-        for r in all_heads:
-            full = (r.get("name") or "").strip()
-            short = _branch_short_name(full)
-            if short is None:
-                continue
-            candidates.append((full, short, r.get("objectId")))
-
-        exact = [c for c in candidates if c[1] == wanted]
-        if exact:
-            full, short, obj_id = exact[0]
-            if obj_id:
-                return obj_id, short, None
-
-        ci = [c for c in candidates if c[1].lower() == wanted.lower()]
-        if ci:
-            full, short, obj_id = ci[0]
-            if obj_id:
-                return obj_id, short, None
-
-        suffix = [c for c in candidates if c[0].endswith("/" + wanted)]
-        if suffix:
-            full, short, obj_id = suffix[0]
-            if obj_id:
-                return obj_id, short, None
-
-        logger.debug(
-            "Branch '%s' not found in repo %s. Available heads: %s",
-            ref_value,
-            repository_id,
-            [c[1] for c in candidates],
-        )
-        return None, None, f"Branch not found: {ref_value}"
-
-    if ref_type == REF_TYPE_TAG_PATTERN:
-        all_tags = client.get_refs(repository_id, filter_prefix="refs/tags/", top=1000)
-        tag_refs = [r for r in all_tags if r.get("name", "").startswith("refs/tags/")]
-        matching = []
-        for r in tag_refs:
-            tag_name = _tag_name_from_ref(r.get("name", ""))
-            if fnmatch.fnmatch(tag_name, ref_value):
-                matching.append((tag_name, r.get("objectId")))
-
-        if not matching:
-            return None, None, f"No tags matching pattern: {ref_value}"
-
-        # Resolve each tag to commit + date; lightweight tag objectId may be commit already
-        tag_commits: list[tuple[str, str, Optional[str]]] = []  # (tag_name, commit_id, date_str)
-        for tag_name, obj_id in matching:
-            if not obj_id:
-                continue
-            # Get commit for this ref (versionType=Tag, version=tag_name)
-            try:
-                commits = client.get_commits(
-                    repository_id,
-                    search_criteria={
-                        "itemVersion.version": tag_name,
-                        "itemVersion.versionType": "tag",
-                    },
-                    top=1,
-                )
-                if commits:
-                    c = commits[0]
-                    commit_id = c.get("commitId")
-                    date_str = c.get("committer", {}).get("date") or c.get("author", {}).get("date") or ""
-                    if commit_id:
-                        tag_commits.append((tag_name, commit_id, date_str))
-                else:
-                    # Lightweight tag: objectId might be the commit
-                    tag_commits.append((tag_name, obj_id, ""))
-            except AzureDevOpsClientError:
-                tag_commits.append((tag_name, obj_id, ""))
-
-        if not tag_commits:
-            return None, None, f"No resolvable tags for pattern: {ref_value}"
-
-        # Sort by date descending (most recent first); empty date last
-        tag_commits.sort(key=lambda x: (x[2] or "0000"), reverse=True)
-        chosen_name, chosen_commit, _ = tag_commits[0]
-        return chosen_commit, chosen_name, None
-
-    return None, None, f"Unknown ref type: {ref_type}"
+        return select_branch(snapshot.heads(repository_id), ref_value, repository_id)
+
+    matching = matching_tags(snapshot.tags(repository_id), ref_value)
+    if not matching:
+        return None, None, f"No tags matching pattern: {ref_value}"
+    tag_commits = _resolve_tag_commits(client, repository_id, matching, snapshot.commits)
+    return latest_tag(tag_commits, ref_value)
+
+
+def resolve_ref_entry(
+    client: AzureDevOpsClient,
+    repository_id: str,
+    ref_type: str,
+    ref_value: str,
+    snapshot: Optional[RefSnapshot] = None,
+) -> dict:
+    """resolve_ref_for_repo nel formato per repo di resolve_refs_for_repos: { "commit_id", "display_ref", "error" }."""
+    commit_id, display_ref, error = resolve_ref_for_repo(
+        client, repository_id, ref_type, ref_value, snapshot=snapshot
+    )
+    return {
+        "commit_id": commit_id,
+        "display_ref": display_ref or ref_value,
+        "error": error,
+    }
 
 
 def resolve_refs_for_repos(
@@ -152,10 +402,14 @@ def resolve_refs_for_repos(
     repositories: list[dict],
     ref_type: str,
     ref_value: str,
+    snapshot: Optional[RefSnapshot] = None,
 ) -> dict[str, dict]:
     """
     For each repo, resolve ref. Returns dict: repo_id -> { "commit_id", "display_ref", "error" }.
+    Passare lo stesso snapshot per SOURCE e TARGET evita di riscaricare heads/tags.
     """
+    if snapshot is None:
+        snapshot = RefSnapshot(client)
     result = {}
     for repo in repositories:
         repo_id = repo.get("id") or repo.get("name")
@@ -163,12 +417,5 @@ def resolve_refs_for_repos(
         if not repo_id:
             result[name] = {"commit_id": None, "display_ref": None, "error": "No repo id"}
             continue
-        commit_id, display_ref, error = resolve_ref_for_repo(
-            client, repo_id, ref_type, ref_value
-        )
-        result[repo_id] = {
-            "commit_id": commit_id,
-            "display_ref": display_ref or ref_value,
-            "error": error,
-        }
+        result[repo_id] = resolve_ref_entry(client, repo_id, ref_type, ref_value, snapshot=snapshot)
     return result
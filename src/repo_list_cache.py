@@ -0,0 +1,133 @@
+"""
+Ultimo elenco repository di ogni progetto, salvato su file JSON (data/repo_lists.json), per mostrare subito
+la lista all'apertura (stale-while-revalidate): l'elenco salvato è visibile senza attendere il server,
+RepoListRefresh lo verifica in background e segnala solo se repo sono stati aggiunti, rimossi o rinominati.
+"""
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from azure_devops_client import AzureDevOpsClient, AzureDevOpsClientError
+
+logger = logging.getLogger(__name__)
+
+# Campi del repo usati dall'app e dal client (project.id per i path on-prem); il resto non si salva
+_REPO_FIELDS = ("id", "name", "defaultBranch", "isDisabled", "size")
+
+
+def repo_list_key(server_key: str, project: str) -> str:
+    """Chiave per server/organization e progetto (nomi di progetto senza maiuscole/minuscole)."""
+    return f"{server_key}|{project.strip().lower()}"
+
+
+def _compact_repo(repo: dict) -> dict:
+    out = {k: repo[k] for k in _REPO_FIELDS if k in repo}
+    project = repo.get("project")
+    if isinstance(project, dict):
+        out["project"] = {k: project[k] for k in ("id", "name") if k in project}
+    return out
+
+
+def repo_list_changes(old: list[dict], new: list[dict]) -> dict[str, list[str]]:
+    """Differenze visibili tra due elenchi: nomi dei repo aggiunti, rimossi e rinominati ("vecchio → nuovo")."""
+    old_by_id = {r.get("id") or r.get("name"): r.get("name", "") for r in old}
+    new_by_id = {r.get("id") or r.get("name"): r.get("name", "") for r in new}
+    return {
+        "added": sorted(name for rid, name in new_by_id.items() if rid not in old_by_id),
+        "removed": sorted(name for rid, name in old_by_id.items() if rid not in new_by_id),
+        "renamed": sorted(
+            f"{old_by_id[rid]} → {name}"
+            for rid, name in new_by_id.items()
+            if rid in old_by_id and old_by_id[rid] != name
+        ),
+    }
+
+
+class RepoListStore:
+    """
+    chiave progetto -> { "repos": [...], "saved_at": epoch }, thread-safe.
+    Con path=None l'elenco resta solo in memoria.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._lists: dict[str, dict] = {}
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._lists = {
+                        str(k): v for k, v in data.items()
+                        if isinstance(v, dict) and isinstance(v.get("repos"), list)
+                    }
+            except Exception as e:
+                logger.warning("Load repo lists failed: %s", e)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._lists.get(key)
+            return {"repos": list(entry["repos"]), "saved_at": entry.get("saved_at")} if entry else None
+
+    def put(self, key: str, repos: list[dict]) -> None:
+        with self._lock:
+            self._lists[key] = {"repos": [_compact_repo(r) for r in repos], "saved_at": time.time()}
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._lists, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.warning("Save repo lists failed: %s", e)
+
+
+class RepoListRefresh:
+    """
+    Rilettura dell'elenco dal server in un thread, confrontata con quello mostrato (stale).
+    A fine lavoro: done=True e repos (nuovo elenco salvato nello store) e changes, oppure error.
+    Con repos valorizzato il client (e il suo PAT) è verificato.
+    """
+
+    def __init__(self, client: AzureDevOpsClient, store: RepoListStore, key: str, stale: list[dict]):
+        self.client = client
+        self._store = store
+        self._key = key
+        self._stale = stale
+        self._thread: Optional[threading.Thread] = None
+        self.done = False
+        self.repos: Optional[list[dict]] = None
+        self.changes: dict[str, list[str]] = {"added": [], "removed": [], "renamed": []}
+        self.error: Optional[str] = None
+
+    def start(self) -> "RepoListRefresh":
+        self._thread = threading.Thread(target=self._run, name="gitsnap-repo-list", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def changed(self) -> bool:
+        return any(self.changes.values())
+
+    def _run(self) -> None:
+        try:
+            repos = self.client.list_repositories()
+            if not repos:
+                # list_repositories assorbe gli errori in una lista vuota: non si cancella l'elenco salvato
+                self.error = "Nessun repository restituito dal server."
+                return
+            self._store.put(self._key, repos)
+            self.changes = repo_list_changes(self._stale, repos)
+            self.repos = repos
+        except AzureDevOpsClientError as e:
+            self.error = e.message or str(e)
+        finally:
+            self.done = True
@@ -0,0 +1,111 @@
+"""
+Selezione dei repository per progetti con migliaia di repo (nessuna dipendenza da Streamlit):
+- filtro per nome (sottostringa) e per espressione regolare, senza maiuscole/minuscole;
+- selezione come insieme di id aggiornato dalle sole modifiche della tabella (righe cambiate);
+- gruppi di repo salvati per progetto in data/repo_groups.json (es. «backend», «portale»).
+"""
+
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def repo_key(repo: dict) -> str:
+    """Id del repo usato nella selezione (nome se manca l'id)."""
+    return repo.get("id") or repo.get("name") or ""
+
+
+def filter_repos(
+    repos: list[dict],
+    name_filter: str = "",
+    regex_filter: str = "",
+) -> tuple[list[dict], Optional[str]]:
+    """Repo il cui nome contiene name_filter e corrisponde a regex_filter (re.search); (repo, errore regex)."""
+    name_filter = (name_filter or "").strip().lower()
+    pattern = None
+    error = None
+    if (regex_filter or "").strip():
+        try:
+            pattern = re.compile(regex_filter.strip(), re.IGNORECASE)
+        except re.error as e:
+            error = f"Regex non valida: {e}"
+    if not name_filter and pattern is None:
+        return repos, error
+    out = []
+    for r in repos:
+        name = r.get("name") or repo_key(r)
+        if name_filter and name_filter not in name.lower():
+            continue
+        if pattern is not None and not pattern.search(name):
+            continue
+        out.append(r)
+    return out, error
+
+
+def apply_row_edits(selected: set, shown_ids: list[str], edited_rows: dict, column: str) -> set:
+    """
+    Aggiorna selected con le modifiche della tabella (edited_rows di st.data_editor: indice riga -> {colonna: valore}).
+    Le modifiche sono cumulative rispetto ai dati iniziali della tabella: riapplicarle è idempotente.
+    """
+    for index, change in (edited_rows or {}).items():
+        index = int(index)
+        if column not in change or not 0 <= index < len(shown_ids):
+            continue
+        if change[column]:
+            selected.add(shown_ids[index])
+        else:
+            selected.discard(shown_ids[index])
+    return selected
+
+
+class RepoGroupStore:
+    """
+    chiave progetto (repo_list_key) -> { nome gruppo -> [id repo] }, thread-safe.
+    Con path=None i gruppi restano solo in memoria.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._groups: dict[str, dict[str, list[str]]] = {}
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._groups = {
+                        str(project): {str(name): [str(i) for i in ids] for name, ids in groups.items() if isinstance(ids, list)}
+                        for project, groups in data.items()
+                        if isinstance(groups, dict)
+                    }
+            except Exception as e:
+                logger.warning("Load repo groups failed: %s", e)
+
+    def groups(self, project_key: str) -> dict[str, list[str]]:
+        with self._lock:
+            return {name: list(ids) for name, ids in sorted(self._groups.get(project_key, {}).items())}
+
+    def save(self, project_key: str, name: str, repo_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._groups.setdefault(project_key, {})[name] = sorted(set(repo_ids))
+            self._save_locked()
+
+    def delete(self, project_key: str, name: str) -> None:
+        with self._lock:
+            if self._groups.get(project_key, {}).pop(name, None) is not None:
+                self._save_locked()
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._groups, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.warning("Save repo groups failed: %s", e)
@@ -0,0 +1,169 @@
+"""
+Metriche delle richieste REST del client, per famiglia di endpoint e api-version:
+conteggi, istogramma latenze, byte ricevuti, retry, errori 4xx/5xx/rete e tentativi sprecati
+nella negoziazione dell'api-version. Report strutturato (dict serializzabile JSON) per la diagnostica.
+"""
+
+import threading
+import time
+from typing import Any, Optional
+
+# Limiti superiori (ms) delle fasce dell'istogramma; l'ultima fascia è "oltre"
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _bucket_label(index: int) -> str:
+    if index < len(LATENCY_BUCKETS_MS):
+        return f"<={LATENCY_BUCKETS_MS[index]}ms"
+    return f">{LATENCY_BUCKETS_MS[-1]}ms"
+
+
+def _percentile_ms(buckets: list[int], count: int, q: float) -> Optional[float]:
+    """Percentile approssimato: limite superiore della fascia che contiene il q-esimo campione."""
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= rank:
+            return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+
+class _EndpointStats:
+    __slots__ = (
+        "requests", "ok", "errors_4xx", "errors_5xx", "network_errors", "throttled",
+        "retries", "wasted_fallbacks", "bytes", "latency_sum", "latency_max", "buckets",
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.ok = 0
+        self.errors_4xx = 0
+        self.errors_5xx = 0
+        self.network_errors = 0
+        self.throttled = 0
+        self.retries = 0
+        self.wasted_fallbacks = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def as_dict(self) -> dict[str, Any]:
+        latency_ms = self.latency_sum * 1000
+        return {
+            "requests": self.requests,
+            "ok": self.ok,
+            "errors_4xx": self.errors_4xx,
+            "errors_5xx": self.errors_5xx,
+            "network_errors": self.network_errors,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "wasted_fallbacks": self.wasted_fallbacks,
+            "bytes": self.bytes,
+            "latency_ms": {
+                "total": round(latency_ms, 1),
+                "mean": round(latency_ms / self.requests, 1) if self.requests else None,
+                "max": round(self.latency_max * 1000, 1),
+                "p50": _percentile_ms(self.buckets, self.requests, 0.50),
+                "p95": _percentile_ms(self.buckets, self.requests, 0.95),
+                "histogram": {_bucket_label(i): n for i, n in enumerate(self.buckets) if n},
+            },
+        }
+
+
+class RequestMetrics:
+    """
+    Contatori thread-safe per (famiglia, api-version), condivisi dai worker di un client.
+    record() per ogni tentativo HTTP (retry inclusi), retry() e wasted_fallback() dal client;
+    reset() all'inizio di ogni confronto per avere un report per run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[tuple[str, str], _EndpointStats] = {}
+        self._started = time.time()
+
+    def _get(self, family: str, api_version: Optional[str]) -> _EndpointStats:
+        key = (family or "other", api_version or "-")
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _EndpointStats()
+        return stats
+
+    def record(
+        self,
+        family: str,
+        api_version: Optional[str],
+        status_code: Optional[int],
+        elapsed_sec: float,
+        response_bytes: int = 0,
+    ) -> None:
+        """Un tentativo HTTP; status_code None = errore di rete (nessuna risposta)."""
+        with self._lock:
+            s = self._get(family, api_version)
+            s.requests += 1
+            s.bytes += max(0, response_bytes)
+            s.latency_sum += elapsed_sec
+            s.latency_max = max(s.latency_max, elapsed_sec)
+            ms = elapsed_sec * 1000
+            index = next((i for i, limit in enumerate(LATENCY_BUCKETS_MS) if ms <= limit), len(LATENCY_BUCKETS_MS))
+            s.buckets[index] += 1
+            if status_code is None:
+                s.network_errors += 1
+            elif status_code in (429, 503):
+                s.throttled += 1
+                if status_code == 503:
+                    s.errors_5xx += 1
+                else:
+                    s.errors_4xx += 1
+            elif status_code >= 500:
+                s.errors_5xx += 1
+            elif status_code >= 400:
+                s.errors_4xx += 1
+            else:
+                s.ok += 1
+
+    def retry(self, family: str, api_version: Optional[str]) -> None:
+        """Il client ripete la stessa richiesta (rete o throttling)."""
+        with self._lock:
+            self._get(family, api_version).retries += 1
+
+    def wasted_fallback(self, family: str, api_version: Optional[str]) -> None:
+        """Tentativo con un'api-version rifiutata (o risposta non valida) durante la negoziazione."""
+        with self._lock:
+            self._get(family, api_version).wasted_fallbacks += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._started = time.time()
+
+    def report(self) -> dict[str, Any]:
+        """Report JSON-serializzabile: totali, per famiglia e per (famiglia, api-version)."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            endpoints = [
+                {"family": family, "api_version": api_version, **stats.as_dict()}
+                for (family, api_version), stats in items
+            ]
+            families: dict[str, _EndpointStats] = {}
+            total = _EndpointStats()
+            for (family, _), stats in items:
+                for agg in (families.setdefault(family, _EndpointStats()), total):
+                    for field in _EndpointStats.__slots__:
+                        if field == "buckets":
+                            agg.buckets = [a + b for a, b in zip(agg.buckets, stats.buckets)]
+                        elif field == "latency_max":
+                            agg.latency_max = max(agg.latency_max, stats.latency_max)
+                        else:
+                            setattr(agg, field, getattr(agg, field) + getattr(stats, field))
+            return {
+                "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started)),
+                "elapsed_sec": round(time.time() - self._started, 3),
+                "total": total.as_dict(),
+                "by_family": {family: stats.as_dict() for family, stats in families.items()},
+                "by_endpoint": endpoints,
+            }
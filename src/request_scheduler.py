@@ -0,0 +1,234 @@
+"""
+Scheduler delle richieste REST: limita le richieste in volo e si adatta al throttling di Azure DevOps.
+- AIMD: il limite di concorrenza cresce di 1 dopo una serie di risposte ok, si dimezza su 429/503.
+- Retry-After / X-RateLimit-*: tutte le richieste del client vengono sospese fino alla scadenza indicata.
+- Backoff esponenziale con jitter per errori di rete e throttling senza indicazioni dal server.
+RequestScheduler per i thread del client sincrono, AsyncRequestScheduler per le coroutine del client
+asincrono: stessa logica (_AimdLimit), cambia solo l'attesa di uno slot.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 8
+# Client asincrono: il limite pratico è il server (throttling), non i thread
+DEFAULT_ASYNC_MAX_IN_FLIGHT = 64
+MIN_IN_FLIGHT = 1
+# Risposte ok consecutive prima di aumentare il limite di 1 (additive increase)
+INCREASE_EVERY = 10
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 60.0
+# Tetto a Retry-After / X-RateLimit-Reset per non bloccare il confronto su valori anomali
+MAX_SERVER_DELAY_SEC = 300.0
+# Sotto questa quota residua (X-RateLimit-Remaining) si rallenta in modo preventivo
+LOW_REMAINING_THRESHOLD = 5
+
+
+def jittered_backoff(attempt: int, base: float = BACKOFF_BASE_SEC, cap: float = BACKOFF_MAX_SEC) -> float:
+    """Full jitter: attesa casuale in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Secondi da attendere secondo il server: Retry-After, altrimenti X-RateLimit-Reset (epoch) se la
+    quota è esaurita. None se il server non dà indicazioni.
+    """
+    retry_after = _header_float(headers, "Retry-After")
+    if retry_after is not None:
+        return min(MAX_SERVER_DELAY_SEC, max(0.0, retry_after))
+    remaining = _header_float(headers, "X-RateLimit-Remaining")
+    reset = _header_float(headers, "X-RateLimit-Reset")
+    if remaining is not None and remaining <= 0 and reset is not None:
+        return min(MAX_SERVER_DELAY_SEC, max(0.0, reset - time.time()))
+    return None
+
+
+class _AimdLimit:
+    """Stato AIMD e pausa del server; i metodi _locked vanno chiamati con il lock della sottoclasse."""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max(MIN_IN_FLIGHT, int(max_in_flight))
+        self._limit = float(self.max_in_flight)
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._throttle_events = 0
+
+    @property
+    def limit(self) -> int:
+        """Richieste in volo consentite in questo momento."""
+        return max(MIN_IN_FLIGHT, int(self._limit))
+
+    def _try_acquire_locked(self) -> Optional[float]:
+        """None se lo slot è preso; altrimenti i secondi di pausa residui (0 = attendere un rilascio)."""
+        wait = self._paused_until - time.monotonic()
+        if wait <= 0 and self._in_flight < self.limit:
+            self._in_flight += 1
+            return None
+        return max(0.0, wait)
+
+    def _release_locked(self, throttled: bool, headers: Optional[Mapping[str, str]]) -> None:
+        self._in_flight = max(0, self._in_flight - 1)
+        delay = retry_delay_from_headers(headers) if headers else None
+        if throttled:
+            self._throttle_events += 1
+            self._successes = 0
+            self._limit = max(float(MIN_IN_FLIGHT), self._limit / 2)
+            logger.warning("Throttling dal server: richieste in volo ridotte a %s", self.limit)
+        elif headers is not None:
+            remaining = _header_float(headers, "X-RateLimit-Remaining")
+            delayed = _header_float(headers, "X-RateLimit-Delay")
+            if (remaining is not None and remaining <= LOW_REMAINING_THRESHOLD) or (delayed or 0) > 0:
+                # Quota quasi esaurita o richiesta già rallentata dal server: niente aumenti, un worker in meno
+                self._successes = 0
+                self._limit = max(float(MIN_IN_FLIGHT), self._limit - 1)
+            else:
+                self._successes += 1
+                if self._successes >= INCREASE_EVERY and self._limit < self.max_in_flight:
+                    self._successes = 0
+                    self._limit = min(float(self.max_in_flight), self._limit + 1)
+        if delay:
+            self._pause_locked(delay)
+
+    def _set_max_locked(self, max_in_flight: int) -> None:
+        self.max_in_flight = max(MIN_IN_FLIGHT, int(max_in_flight))
+        if self._throttle_events:
+            # Già throttlati: si riparte dal limite appreso, senza superare il nuovo tetto
+            self._limit = min(self._limit, float(self.max_in_flight))
+        else:
+            self._limit = float(self.max_in_flight)
+
+    def _pause_locked(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, seconds))
+
+    def _stats_locked(self) -> dict:
+        return {
+            "limit": self.limit,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "throttle_events": self._throttle_events,
+            "paused_for_sec": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+
+class RequestScheduler(_AimdLimit):
+    """
+    Semaforo adattivo condiviso dai worker di un client: acquire() prima di ogni richiesta,
+    release() dopo, con l'esito (ok/throttled) e gli header di risposta.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        super().__init__(max_in_flight)
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        """Attende uno slot libero e la fine di un'eventuale pausa imposta dal server."""
+        with self._cond:
+            while True:
+                wait = self._try_acquire_locked()
+                if wait is None:
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, throttled: bool = False, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Libera lo slot e aggiorna il limite (AIMD) e la pausa in base alla risposta."""
+        with self._cond:
+            self._release_locked(throttled, headers)
+            self._cond.notify_all()
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        """Nuovo tetto (es. dal numero di worker del confronto); il limite corrente non lo supera."""
+        with self._cond:
+            self._set_max_locked(max_in_flight)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Sospende tutte le nuove richieste per seconds (la pausa più lunga vince)."""
+        with self._cond:
+            self._pause_locked(seconds)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return self._stats_locked()
+
+
+class AsyncRequestScheduler(_AimdLimit):
+    """
+    RequestScheduler per le coroutine di un solo event loop (nessun lock: lo stato cambia solo tra un await
+    e l'altro). Le coroutine in attesa sono in coda FIFO e un rilascio cede lo slot direttamente alla prima,
+    così migliaia di richieste in coda non vengono risvegliate tutte a ogni risposta.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        super().__init__(max_in_flight)
+        self._waiters: deque[asyncio.Future] = deque()
+        self._pause_timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self) -> None:
+        """Attende uno slot libero e la fine di un'eventuale pausa imposta dal server."""
+        if not self._waiters and self._try_acquire_locked() is None:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._wake()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot già ceduto a questa coroutine: passa alla successiva
+                self._in_flight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, throttled: bool = False, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Libera lo slot, aggiorna limite e pausa e cede gli slot liberi alle coroutine in coda."""
+        self._release_locked(throttled, headers)
+        self._wake()
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        self._set_max_locked(max_in_flight)
+        self._wake()
+
+    def pause(self, seconds: float) -> None:
+        self._pause_locked(seconds)
+
+    def _wake(self) -> None:
+        wait = self._paused_until - time.monotonic()
+        if wait > 0:
+            # In pausa: la coda riparte alla scadenza anche se nel frattempo non termina nessuna richiesta
+            if self._waiters and self._pause_timer is None:
+                self._pause_timer = asyncio.get_running_loop().call_later(wait, self._pause_ended)
+            return
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def _pause_ended(self) -> None:
+        self._pause_timer = None
+        self._wake()
+
+    def stats(self) -> dict:
+        return {**self._stats_locked(), "waiting": len(self._waiters)}
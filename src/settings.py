@@ -0,0 +1,76 @@
+"""
+Percorsi dei dati (config.json, projects.json, cache) e lettura/scrittura della configurazione.
+Nessuna dipendenza da Streamlit: usato sia dall'app sia dalla CLI.
+"""
+
+import json
+import logging
+import sys
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def _data_base_dir() -> Path:
+    """Cartella base per dati: scrivibile (AppData/GitSnap) quando frozen, altrimenti repo/data."""
+    if getattr(sys, "frozen", False):
+        import os
+        if sys.platform == "win32":
+            appdata = os.environ.get("APPDATA") or str(Path(sys.executable).resolve().parent)
+            base = Path(appdata) / "GitSnap"
+        else:
+            base = Path.home() / ".config" / "GitSnap"
+        return base
+    return Path(__file__).resolve().parent.parent
+
+_DATA_DIR = _data_base_dir() / "data"
+CONFIG_FILE = _DATA_DIR / "config.json"
+PROJECTS_FILE = _DATA_DIR / "projects.json"
+COMMIT_CACHE_FILE = _DATA_DIR / "cache.sqlite"
+API_VERSIONS_FILE = _DATA_DIR / "api_versions.json"
+REPO_LISTS_FILE = _DATA_DIR / "repo_lists.json"
+REPO_GROUPS_FILE = _DATA_DIR / "repo_groups.json"
+
+
+def load_config() -> dict:
+    if not CONFIG_FILE.exists():
+        return {}
+    try:
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning("Load config failed: %s", e)
+        return {}
+
+
+def save_config(config: dict) -> None:
+    """Aggiorna config.json con le chiavi di config: quelle non gestite dall'app (es. cache_max_mb) restano."""
+    # Never persist PAT
+    out = {k: v for k, v in {**load_config(), **config}.items() if k not in ("pat", "PAT")}
+    try:
+        CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2, ensure_ascii=False)
+    except Exception as e:
+        logger.warning("Save config failed: %s", e)
+
+
+def load_projects() -> list[dict]:
+    if not PROJECTS_FILE.exists():
+        return []
+    try:
+        with open(PROJECTS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("projects", data) if isinstance(data, dict) else (data if isinstance(data, list) else [])
+    except Exception as e:
+        logger.warning("Load projects failed: %s", e)
+        return []
+
+
+def save_projects(projects: list[dict]) -> None:
+    try:
+        PROJECTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(PROJECTS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"projects": projects}, f, indent=2, ensure_ascii=False)
+    except Exception as e:
+        logger.warning("Save projects failed: %s", e)
@@ -0,0 +1,159 @@
+"""
+Cache condivisa dal processo: tutte le sessioni Streamlit (e tutti i worker) dello stesso server la vedono.
+- valori con TTL per chiave, con un limite di voci (escono per prime le più vecchie); chi legge con
+  get_or_compute accetta solo voci più giovani del proprio ttl_sec, anche se chi le ha scritte ne ha dato uno più lungo;
+- single-flight: chiamate identiche contemporanee fanno un solo lavoro upstream, gli altri chiamanti
+  attendono e ricevono lo stesso risultato (o la stessa eccezione).
+Le chiavi includono l'ambito credenziali (server, progetto, hash di utente e PAT): chi usa un PAT diverso
+non condivide nulla. Ogni chiamante riceve una copia profonda del valore condiviso: può modificarla
+(es. annotare un risultato) senza toccare quella in cache o quella degli altri chiamanti.
+"""
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Refs (heads/tags): breve, un push recente deve comparire al confronto successivo
+REFS_TTL_SEC = 30
+# Risultati per coppia di SHA: immutabili, il TTL limita solo la memoria occupata
+RESULTS_TTL_SEC = 30 * 60
+MAX_ENTRIES = 20000
+
+
+def credentials_scope(server_key: str, project: str, username: str, pat: str) -> str:
+    """Ambito delle chiavi: il PAT non compare in chiaro, solo un suo hash."""
+    digest = hashlib.sha256(f"{username}\n{pat}".encode("utf-8")).hexdigest()[:16]
+    return f"{server_key}|{project}|{digest}"
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SharedCache:
+    """Valori con scadenza e chiamate in volo per chiave, thread-safe."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        # chiave -> (scrittura, scadenza, valore), istanti di time.monotonic()
+        self._values: OrderedDict[Hashable, tuple[float, float, Any]] = OrderedDict()
+        self._flights: dict[Hashable, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key: Hashable, max_age_sec: Optional[float] = None) -> tuple[bool, Any]:
+        """(trovato, valore) per una voce non scaduta e non più vecchia di max_age_sec; da chiamare con il lock."""
+        entry = self._values.get(key)
+        if entry is None:
+            return False, None
+        stored, expires, value = entry
+        now = time.monotonic()
+        if expires < now:
+            del self._values[key]
+            return False, None
+        if max_age_sec is not None and now - stored > max_age_sec:
+            return False, None
+        return True, value
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Any, ttl_sec: float) -> None:
+        if ttl_sec <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._values[key] = (now, now + ttl_sec, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_entries:
+                self._values.popitem(last=False)
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        ttl_sec: float = 0,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Valore in cache, oppure compute() eseguito una sola volta anche con più chiamanti contemporanei.
+        ttl_sec è anche l'età massima accettata: una voce scritta da altri con un TTL più lungo
+        (es. dal prefetch) non si usa se è più vecchia di ttl_sec.
+        ttl_sec 0: solo single-flight, nulla resta in cache. cacheable(value) False: il valore non si memorizza.
+        """
+        with self._lock:
+            if ttl_sec > 0:
+                found, value = self._lookup(key, max_age_sec=ttl_sec)
+                if found:
+                    self.hits += 1
+                    return copy.deepcopy(value)
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.value)
+        shared = False
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            # In cache prima di chiudere il volo: chi arriva dopo trova il valore
+            if ttl_sec > 0 and (cacheable is None or cacheable(flight.value)):
+                self.put(key, flight.value, ttl_sec)
+                shared = True
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                # Dopo il pop nessuno si aggiunge al volo: waiters è definitivo
+                shared = shared or flight.waiters > 0
+            flight.event.set()
+        # Il valore originale resta a cache e attendenti (che ne fanno una copia): il leader ne riceve una sua
+        return copy.deepcopy(flight.value) if shared else flight.value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self.hits = self.misses = self.coalesced = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._values),
+                "in_flight": len(self._flights),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+
+_PROCESS_CACHE = SharedCache()
+
+
+def process_cache() -> SharedCache:
+    """Istanza unica del processo (il modulo è importato una volta sola anche con più sessioni Streamlit)."""
+    return _PROCESS_CACHE
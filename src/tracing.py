@@ -0,0 +1,146 @@
+"""
+Span di timing gerarchici per le fasi del confronto (risoluzione ref, diff, commit, metadati, HTTP).
+Un Tracer raccoglie gli span di tutti i thread; export in formato Chrome trace-event (chrome://tracing,
+Perfetto, speedscope) e riepilogo per fase con tempo totale ed esclusivo.
+Con tracer None (default del client) gli span non registrano nulla.
+"""
+
+import threading
+import time
+from typing import Any, Optional
+
+
+class _Span:
+    __slots__ = ("_tracer", "name", "cat", "args", "_start", "_children")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self._start = 0.0
+        self._children = 0.0
+
+    def __enter__(self) -> dict[str, Any]:
+        self._tracer._stack().append(self)
+        self._start = time.perf_counter()
+        return self.args
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter()
+        stack = self._tracer._stack()
+        stack.pop()
+        duration = end - self._start
+        if stack:
+            stack[-1]._children += duration
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self._tracer._add(self, duration, duration - self._children)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> dict[str, Any]:
+        return {}
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Raccoglie span completi (inizio, durata, thread, argomenti), thread-safe.
+    La gerarchia è per thread: uno span aperto dentro un altro sullo stesso thread ne è figlio.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._events: list[tuple[str, str, float, float, float, int, dict[str, Any]]] = []
+        self._threads: dict[int, str] = {}
+
+    def span(self, name: str, cat: str = "gitsnap", **args: Any) -> _Span:
+        """Context manager; restituisce il dict degli argomenti (si possono aggiungere valori dentro il blocco)."""
+        return _Span(self, name, cat, args)
+
+    def _stack(self) -> list[_Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add(self, span: _Span, duration: float, self_time: float) -> None:
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(thread.ident or 0, thread.name)
+            self._events.append(
+                (span.name, span.cat, span._start - self._origin, duration, self_time, thread.ident or 0, span.args)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._events)
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        """Documento trace-event (eventi "X" completi, tempi in microsecondi) con i nomi dei thread."""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        trace = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        for name, cat, start, duration, _, tid, args in sorted(events, key=lambda e: e[2]):
+            trace.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": round(start * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "pid": 1,
+                "tid": tid,
+                "args": {k: v if isinstance(v, (str, int, float, bool)) or v is None else str(v) for k, v in args.items()},
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def summary(self) -> list[dict[str, Any]]:
+        """Per nome di span: chiamate, tempo totale, esclusivo (senza i figli) e massimo, in ms; i più costosi prima."""
+        totals: dict[str, list[float]] = {}
+        with self._lock:
+            for name, _, _, duration, self_time, _, _ in self._events:
+                t = totals.setdefault(name, [0, 0.0, 0.0, 0.0])
+                t[0] += 1
+                t[1] += duration
+                t[2] += self_time
+                t[3] = max(t[3], duration)
+        rows = [
+            {
+                "name": name,
+                "calls": int(calls),
+                "total_ms": round(total * 1000, 1),
+                "self_ms": round(self_total * 1000, 1),
+                "max_ms": round(longest * 1000, 1),
+            }
+            for name, (calls, total, self_total, longest) in totals.items()
+        ]
+        return sorted(rows, key=lambda r: r["self_ms"], reverse=True)
+
+    def slowest(self, name: str, limit: int = 10) -> list[dict[str, Any]]:
+        """Gli span più lunghi con un dato nome (es. "repo"), con i loro argomenti."""
+        with self._lock:
+            matching = [e for e in self._events if e[0] == name]
+        matching.sort(key=lambda e: e[3], reverse=True)
+        return [{"duration_ms": round(e[3] * 1000, 1), **e[6]} for e in matching[:limit]]
+
+
+def span(tracer: Optional[Tracer], name: str, cat: str = "gitsnap", **args: Any):
+    """tracer.span(...) oppure uno span nullo se il tracing non è attivo."""
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, cat, **args)
+
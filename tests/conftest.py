@@ -0,0 +1,31 @@
+"""I moduli dell'app sono in src/ e si importano per nome (come fa src/app.py); il server finto è in scripts/."""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+
+@pytest.fixture
+def mock_server():
+    """Avvia server Azure DevOps finti in thread (porta libera); restituisce una factory che dà la base_url."""
+    from mock_ado_server import MockData, MockServer
+
+    servers = []
+
+    def _start(repos: int = 4, api_versions=None, **data_options) -> str:
+        options = {"tags": 3, "divergence": 2, "divergent_ratio": 0.5, "files_per_commit": 2, **data_options}
+        server = MockServer(("127.0.0.1", 0), MockData(repos, **options), api_versions=api_versions)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,53 @@
+import pytest
+
+from azure_devops_client import API_VERSION_ONPREM, AzureDevOpsClient, AzureDevOpsClientError, is_version_error
+from shared_cache import SharedCache
+
+REPO = "00000000-0000-4000-8000-000000000000"
+BAD_SHA = "f" * 40
+
+
+def _client(base_url: str) -> AzureDevOpsClient:
+    return AzureDevOpsClient("org", "bench", "pat", base_url=base_url, shared=SharedCache())
+
+
+@pytest.mark.parametrize("status, text, expected", [
+    (400, '{"typeKey": "VssVersionOutOfRangeException"}', True),
+    (400, '{"typeKey": "VssInvalidPreviewVersionException"}', True),
+    (400, "The api-version 7.1 is not supported", True),
+    (404, "TF401175: The version descriptor <Commit: ffff> could not be resolved to a version", False),
+    (404, '{"message": "Versione non trovata: ffff", "typeKey": "GitItemNotFoundException"}', False),
+    (400, "Invalid search criteria", False),
+])
+def test_is_version_error(status, text, expected):
+    assert is_version_error(AzureDevOpsClientError("x", status, text)) is expected
+
+
+def test_old_server_negotiates_the_accepted_version(mock_server):
+    client = _client(mock_server(api_versions={API_VERSION_ONPREM}))
+    diff = client.get_diffs_commits(REPO, "main", "develop", "branch", "branch")
+    assert diff.get("commonCommit")
+    assert client._api_versions.get(client.server_key, "diffs") == API_VERSION_ONPREM
+    assert client.metrics.report()["total"]["wasted_fallbacks"] >= 1
+
+
+def test_missing_commit_does_not_poison_the_api_version(mock_server):
+    client = _client(mock_server())
+    assert client.get_diffs_commits(REPO, "main", "develop", "branch", "branch").get("commonCommit")
+    learned = client._api_versions.get(client.server_key, "diffs")
+
+    with pytest.raises(AzureDevOpsClientError) as excinfo:
+        client.get_diffs_commits(REPO, BAD_SHA, "main", "commit", "branch")
+    assert excinfo.value.status_code == 404
+
+    # Stesso client: la versione appresa resta e il diff valido continua a funzionare
+    assert client._api_versions.get(client.server_key, "diffs") == learned
+    assert client.get_diffs_commits(REPO, "main", "develop", "branch", "branch").get("commonCommit")
+    assert client.metrics.report()["total"]["wasted_fallbacks"] == 0
+
+
+def test_missing_commit_on_first_request_keeps_the_candidates(mock_server):
+    client = _client(mock_server())
+    with pytest.raises(AzureDevOpsClientError):
+        client.get_diffs_commits(REPO, BAD_SHA, "main", "commit", "branch")
+    assert client.get_diffs_commits(REPO, "main", "develop", "branch", "branch").get("commonCommit")
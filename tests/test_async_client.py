@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from async_client import AsyncAzureDevOpsClient
+from azure_devops_client import API_VERSION_ONPREM, AzureDevOpsClientError
+
+REPO = "00000000-0000-4000-8000-000000000000"
+BAD_SHA = "f" * 40
+
+
+def _run(base_url: str, scenario):
+    async def _main():
+        async with AsyncAzureDevOpsClient("org", "bench", "pat", base_url=base_url) as client:
+            return await scenario(client)
+
+    return asyncio.run(_main())
+
+
+def test_lists_repositories_and_refs(mock_server):
+    async def _scenario(client):
+        repos = await client.list_repositories()
+        refs = await client.get_refs(repos[0]["id"], filter_prefix="heads/")
+        return repos, refs
+
+    repos, refs = _run(mock_server(repos=3), _scenario)
+    assert [r["name"] for r in repos] == ["repo-0000", "repo-0001", "repo-0002"]
+    assert {r["name"] for r in refs} == {"refs/heads/main", "refs/heads/develop"}
+
+
+def test_old_server_negotiates_the_accepted_version(mock_server):
+    async def _scenario(client):
+        await asyncio.gather(*(client.get_diffs_commits(REPO, "main", "develop", "branch", "branch") for _ in range(5)))
+        return client._api_versions.get(client.server_key, "diffs")
+
+    assert _run(mock_server(api_versions={API_VERSION_ONPREM}), _scenario) == API_VERSION_ONPREM
+
+
+def test_missing_commit_does_not_poison_the_api_version(mock_server):
+    async def _scenario(client):
+        with pytest.raises(AzureDevOpsClientError) as excinfo:
+            await client.get_diffs_commits(REPO, BAD_SHA, "main", "commit", "branch")
+        assert excinfo.value.status_code == 404
+        return await client.get_diffs_commits(REPO, "main", "develop", "branch", "branch")
+
+    assert _run(mock_server(), _scenario).get("commonCommit")
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+import cli
+from cli import EXIT_ALIGNED, EXIT_DIVERGENT, EXIT_ERROR, main
+
+
+@pytest.fixture
+def project(monkeypatch, tmp_path, mock_server):
+    """Progetto salvato che punta al server finto; config e api-version fuori da data/."""
+    base_url = mock_server(repos=3, divergent_ratio=1.0)
+    saved = {"id": "p1", "name": "Bench", "organization": "org", "project": "bench", "base_url": base_url, "pat": "x"}
+    monkeypatch.setattr(cli, "load_projects", lambda: [saved])
+    monkeypatch.setattr(cli, "load_config", lambda: {})
+    monkeypatch.setattr(cli, "API_VERSIONS_FILE", str(tmp_path / "api_versions.json"))
+    return saved
+
+
+def _compare(*options: str) -> int:
+    return main(["compare", "--project", "Bench", "--no-cache", *options])
+
+
+def _lines(capsys) -> list[dict]:
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_aligned_exits_zero(project, capsys):
+    assert _compare("--source", "main", "--target", "main") == EXIT_ALIGNED
+    lines = _lines(capsys)
+    assert [line["type"] for line in lines] == ["result"] * 3 + ["summary"]
+    assert lines[-1]["aligned"] == 3
+
+
+def test_divergent_exits_one(project, capsys):
+    assert _compare("--source", "develop", "--target", "main", "--quick") == EXIT_DIVERGENT
+    assert _lines(capsys)[-1]["divergent"] == 3
+
+
+def test_missing_ref_exits_two(project, capsys):
+    assert _compare("--source", "no-such-branch", "--target", "main", "--repo", "repo-0001") == EXIT_ERROR
+    summary = _lines(capsys)[-1]
+    assert summary["repos"] == 1 and summary["errors"] == 1
+
+
+@pytest.mark.parametrize("options, message", [
+    (["--project", "Altro", "--source", "main", "--target", "main"], "Progetto non trovato"),
+    (["--project", "Bench", "--source", "main"], "--source e --target"),
+    (["--project", "Bench", "--source", "main", "--target", "main", "--repo", "repo-9999"], "Repository non trovati"),
+])
+def test_usage_errors_exit_two(project, capsys, options, message):
+    assert main(["compare", "--no-cache", *options]) == EXIT_ERROR
+    assert message in capsys.readouterr().err
+
+
+def test_json_format_and_trace(project, capsys, tmp_path):
+    trace = tmp_path / "trace.json"
+    options = ("--source", "develop", "--target", "main", "--format", "json", "--trace", str(trace))
+    assert _compare(*options) == EXIT_DIVERGENT
+    document = json.loads(capsys.readouterr().out)
+    assert document["summary"]["exit_code"] == EXIT_DIVERGENT
+    assert [r["repo_name"] for r in document["results"]] == ["repo-0000", "repo-0001", "repo-0002"]
+    assert json.loads(trace.read_text())["traceEvents"]
+
+
+def test_async_client_gives_the_same_exit_code(project, capsys):
+    pytest.importorskip("httpx")
+    assert _compare("--async", "--source", "develop", "--target", "main") == EXIT_DIVERGENT
+    assert _lines(capsys)[-1]["divergent"] == 3
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+import commit_cache
+from commit_cache import TOUCH_INTERVAL_SEC, CommitCache
+
+VALUE = {"comment": "x" * 300}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(commit_cache, "time", SimpleNamespace(time=lambda: fake.now))
+    return fake
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = CommitCache(tmp_path / "cache.sqlite", max_bytes=3000)
+    yield cache
+    cache.close()
+
+
+def test_put_and_get(cache):
+    cache.put("srv", "repo", "commit", "a", VALUE)
+    assert cache.get("srv", "repo", "commit", "a") == VALUE
+    assert cache.get("srv", "repo", "commit", "b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_eviction_removes_least_recently_used(cache, clock):
+    for i in range(10):
+        clock.now += 1
+        cache.put("srv", "repo", "commit", str(i), VALUE)
+    stats = cache.stats()
+    assert stats["evictions"] > 0
+    assert stats["size_bytes"] <= cache.max_bytes
+    assert cache.get("srv", "repo", "commit", "0") is None
+    assert cache.get("srv", "repo", "commit", "9") == VALUE
+
+
+def test_recently_read_entry_survives_eviction(cache, clock):
+    for i in range(8):
+        clock.now += 1
+        cache.put("srv", "repo", "commit", str(i), VALUE)
+    clock.now += TOUCH_INTERVAL_SEC + 1
+    assert cache.get("srv", "repo", "commit", "0") == VALUE
+    for i in range(8, 12):
+        clock.now += 1
+        cache.put("srv", "repo", "commit", str(i), VALUE)
+    assert cache.get("srv", "repo", "commit", "0") == VALUE
+    assert cache.get("srv", "repo", "commit", "1") is None
+
+
+def test_access_time_is_written_at_most_once_per_interval(cache, clock):
+    cache.put("srv", "repo", "commit", "a", VALUE)
+    clock.now += TOUCH_INTERVAL_SEC / 2
+    cache.get("srv", "repo", "commit", "a")
+    assert not cache._touched
+    clock.now += TOUCH_INTERVAL_SEC
+    cache.get("srv", "repo", "commit", "a")
+    cache.get("srv", "repo", "commit", "a")
+    assert list(cache._touched.values()) == [clock.now]
+
+
+def test_closed_cache_behaves_as_miss(cache):
+    cache.put("srv", "repo", "commit", "a", VALUE)
+    cache.close()
+    assert cache.get("srv", "repo", "commit", "a") is None
+    cache.put("srv", "repo", "commit", "b", VALUE)
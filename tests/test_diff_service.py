@@ -0,0 +1,72 @@
+from azure_devops_client import DIFF_PAGE_SIZE
+from diff_service import STATUS_ALIGNED, STATUS_DIVERGENT, classify_diff, new_result
+
+
+def _result():
+    return new_result("repo-id", "repo", "a" * 40, "b" * 40, "develop", "main")
+
+
+def _changes(n):
+    return [{"item": {"path": f"/f{i}.txt"}, "changeType": "edit"} for i in range(n)]
+
+
+def test_no_changes_and_no_commits_is_aligned():
+    result = _result()
+    classify_diff(result, {"aheadCount": 0, "behindCount": 4, "changeCounts": {}, "changes": []}, quick=True)
+    assert result["status"] == STATUS_ALIGNED
+    assert result["file_count"] == 0
+    assert result["behind_count"] == 4
+
+
+def test_quick_page_not_complete_leaves_file_count_unknown():
+    # $top=1: changeCounts conta solo la pagina, il totale dei file non è noto
+    diff = {"aheadCount": 5, "changeCounts": {"Edit": 1}, "changes": _changes(1), "allChangesIncluded": False}
+    result = _result()
+    classify_diff(result, diff, quick=True)
+    assert result["status"] == STATUS_DIVERGENT
+    assert result["file_count"] is None
+    assert result["commit_count"] == 5
+    assert result["note"] == "5 commit in SOURCE non in TARGET"
+
+
+def test_complete_page_gives_file_count():
+    diff = {"aheadCount": 2, "changeCounts": {"Edit": 2, "Add": 1}, "changes": _changes(3), "allChangesIncluded": True}
+    result = _result()
+    classify_diff(result, diff, quick=False)
+    assert result["file_count"] == 3
+    assert result["note"] == "2 commit in SOURCE non in TARGET, 3 file modificati"
+
+
+def test_short_page_without_all_changes_flag_is_complete():
+    diff = {"aheadCount": 1, "changeCounts": {"Edit": 2}, "changes": _changes(2)}
+    result = _result()
+    classify_diff(result, diff, quick=False)
+    assert result["file_count"] == 2
+
+
+def test_full_page_uses_collected_files():
+    diff = {"aheadCount": 1, "changeCounts": {"Edit": DIFF_PAGE_SIZE}, "changes": _changes(DIFF_PAGE_SIZE)}
+    files = [f"/f{i}.txt" for i in range(DIFF_PAGE_SIZE + 7)]
+    result = _result()
+    classify_diff(result, diff, quick=False, files=(files, True))
+    assert result["file_count"] == DIFF_PAGE_SIZE + 7
+    assert result["files"] == files
+
+
+def test_partial_file_list_does_not_become_the_count():
+    # Pagina piena e seconda pagina fallita: la lista è parziale, il totale non è noto
+    diff = {"aheadCount": 7, "changeCounts": {"Edit": DIFF_PAGE_SIZE}, "changes": _changes(DIFF_PAGE_SIZE)}
+    partial = [f"/f{i}.txt" for i in range(DIFF_PAGE_SIZE + 10)]
+    result = _result()
+    classify_diff(result, diff, quick=False, files=(partial, False))
+    assert result["files"] == partial
+    assert result["file_count"] is None
+    assert result["note"] == "7 commit in SOURCE non in TARGET, elenco file incompleto"
+
+
+def test_changes_without_commits_are_divergent():
+    # SOURCE dietro TARGET con contenuto diverso (es. revert): nessun commit avanti ma file diversi
+    diff = {"aheadCount": 0, "behindCount": 2, "changeCounts": {"Delete": 1}, "changes": _changes(1), "allChangesIncluded": True}
+    result = _result()
+    classify_diff(result, diff, quick=True)
+    assert result["status"] == STATUS_DIVERGENT
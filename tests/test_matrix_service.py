@@ -0,0 +1,40 @@
+from diff_service import STATUS_ALIGNED, STATUS_DIVERGENT, STATUS_ERROR
+from matrix_service import _cell
+
+A = "a" * 40
+B = "b" * 40
+
+
+def _env(commit_id, error=None):
+    return {"commit_id": commit_id, "error": error}
+
+
+def test_forward_pair_counts():
+    # Diff calcolato con base=TARGET (B), target=SOURCE (A): ahead = commit di A non in B
+    pairs = {(B, A): {"ahead": 3, "behind": 1}}
+    cell = _cell(_env(A), _env(B), pairs)
+    assert (cell["status"], cell["ahead"], cell["behind"]) == (STATUS_DIVERGENT, 3, 1)
+
+
+def test_reverse_pair_swaps_ahead_and_behind():
+    # Solo la coppia nell'altro verso (base=A, target=B): i conteggi si scambiano
+    pairs = {(A, B): {"ahead": 3, "behind": 1}}
+    cell = _cell(_env(A), _env(B), pairs)
+    assert (cell["status"], cell["ahead"], cell["behind"]) == (STATUS_DIVERGENT, 1, 3)
+
+
+def test_reverse_pair_with_source_only_behind_is_aligned():
+    pairs = {(A, B): {"ahead": 2, "behind": 0}}
+    cell = _cell(_env(A), _env(B), pairs)
+    assert (cell["status"], cell["ahead"], cell["behind"]) == (STATUS_ALIGNED, 0, 2)
+
+
+def test_same_commit():
+    assert _cell(_env(A), _env(A), {})["note"] == "Stesso commit"
+
+
+def test_unresolved_or_failed_pairs_are_errors():
+    assert _cell(_env(None, "Branch non trovato"), _env(B), {})["note"] == "Branch non trovato"
+    assert _cell(_env(A), _env(B), {})["note"] == "Diff mancante"
+    cell = _cell(_env(A), _env(B), {(B, A): {"error": "Timeout"}})
+    assert (cell["status"], cell["note"]) == (STATUS_ERROR, "Timeout")
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+import requests
+
+from azure_devops_client import AzureDevOpsClient
+from ref_prefetch import RefPrefetcher
+from ref_resolver import RefSnapshot
+from shared_cache import SharedCache
+
+REPO = "00000000-0000-4000-8000-000000000000"
+
+
+def _client(base_url: str) -> AzureDevOpsClient:
+    return AzureDevOpsClient("org", "bench", "pat", base_url=base_url, shared=SharedCache())
+
+
+def _develop(client: AzureDevOpsClient) -> str:
+    heads = RefSnapshot(client).heads(REPO)
+    return next(r["objectId"] for r in heads if r["name"] == "refs/heads/develop")
+
+
+def _wait(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.02)
+
+
+def test_prefetch_fills_the_shared_cache(mock_server):
+    client = _client(mock_server(repos=6))
+    repos = [{"id": f"{i:08x}-0000-4000-8000-{i:012x}"} for i in range(6)]
+    prefetcher = RefPrefetcher(client, repos, include_tags=False, warm_interval_sec=0).start()
+    _wait(lambda: prefetcher.done == prefetcher.total)
+    requests_before = client.metrics.report()["total"]["requests"]
+    _develop(client)
+    assert client.metrics.report()["total"]["requests"] == requests_before
+
+
+def test_selected_repos_stay_warm(mock_server):
+    base_url = mock_server()
+    client = _client(base_url)
+    prefetcher = RefPrefetcher(
+        client, [{"id": REPO}], priority_ids=[REPO], include_tags=False, warm_interval_sec=0.05
+    ).start()
+    try:
+        _wait(lambda: prefetcher.warm_rounds >= 1)
+        before = _develop(client)
+        requests.post(f"{base_url}/_mock/push", params={"repo": REPO}, timeout=5).raise_for_status()
+        rounds = prefetcher.warm_rounds
+        _wait(lambda: prefetcher.warm_rounds >= rounds + 2)
+        # Il confronto legge dalla cache (TTL) e vede già il push
+        assert _develop(client) != before
+    finally:
+        prefetcher.cancel()
+    _wait(lambda: not prefetcher.running)
+
+
+@pytest.mark.parametrize("stop", ["idle", "cancel"])
+def test_keep_warm_stops(mock_server, stop):
+    client = _client(mock_server())
+    prefetcher = RefPrefetcher(
+        client, [{"id": REPO}], priority_ids=[REPO], include_tags=False, warm_interval_sec=0.05, warm_idle_sec=0.2
+    ).start()
+    assert prefetcher.warming
+    if stop == "cancel":
+        prefetcher.cancel()
+    _wait(lambda: not prefetcher.running, timeout=2)
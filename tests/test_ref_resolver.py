@@ -0,0 +1,34 @@
+import requests
+
+from azure_devops_client import AzureDevOpsClient
+from ref_resolver import RefSnapshot
+from shared_cache import SharedCache
+
+REPO = "00000000-0000-4000-8000-000000000000"
+
+
+def _develop(snapshot: RefSnapshot) -> str:
+    return next(r["objectId"] for r in snapshot.heads(REPO) if r["name"] == "refs/heads/develop")
+
+
+def test_snapshot_downloads_each_list_once(mock_server):
+    client = AzureDevOpsClient("org", "bench", "pat", base_url=mock_server(), shared=None)
+    snapshot = RefSnapshot(client)
+    for _ in range(3):
+        snapshot.heads(REPO)
+        snapshot.tags(REPO)
+    assert client.metrics.report()["by_family"]["refs"]["requests"] == 2
+
+
+def test_rerun_sees_a_push_hidden_by_the_shared_cache(mock_server):
+    base_url = mock_server()
+    client = AzureDevOpsClient("org", "bench", "pat", base_url=base_url, shared=SharedCache())
+    before = _develop(RefSnapshot(client))
+    requests.post(f"{base_url}/_mock/push", params={"repo": REPO}, timeout=5).raise_for_status()
+
+    # Entro il TTL un nuovo snapshot usa ancora i refs della cache di processo
+    assert _develop(RefSnapshot(client)) == before
+    # Riesecuzione esplicita: refs dal server, poi pubblicati per gli altri snapshot
+    after = _develop(RefSnapshot(client, force_refresh=True))
+    assert after != before
+    assert _develop(RefSnapshot(client)) == after
@@ -0,0 +1,70 @@
+import json
+
+from repo_picker import RepoGroupStore, apply_row_edits, filter_repos, repo_key
+
+REPOS = [{"id": f"id-{name}", "name": name} for name in ("api-orders", "api-users", "portal-web", "Portal-Admin")]
+
+
+def _names(repos):
+    return [r["name"] for r in repos]
+
+
+def test_repo_key_falls_back_to_the_name():
+    assert repo_key({"id": "1", "name": "a"}) == "1"
+    assert repo_key({"name": "a"}) == "a"
+
+
+def test_no_filter_returns_the_same_list():
+    repos, error = filter_repos(REPOS)
+    assert repos is REPOS and error is None
+
+
+def test_name_and_regex_filters_ignore_case():
+    assert _names(filter_repos(REPOS, name_filter=" PORTAL ")[0]) == ["portal-web", "Portal-Admin"]
+    assert _names(filter_repos(REPOS, regex_filter="^API-")[0]) == ["api-orders", "api-users"]
+    # Entrambi: devono valere tutti e due
+    assert _names(filter_repos(REPOS, name_filter="portal", regex_filter="admin$")[0]) == ["Portal-Admin"]
+
+
+def test_invalid_regex_keeps_the_name_filter():
+    repos, error = filter_repos(REPOS, name_filter="api", regex_filter="api-(")
+    assert error and error.startswith("Regex non valida")
+    assert _names(repos) == ["api-orders", "api-users"]
+
+
+def test_row_edits_update_only_the_changed_rows():
+    shown = ["id-api-orders", "id-api-users", "id-portal-web"]
+    selected = {"id-portal-web", "id-hidden"}
+    edits = {0: {"Seleziona": True}, "2": {"Seleziona": False}, 1: {"Altro": True}, 7: {"Seleziona": True}}
+    assert apply_row_edits(selected, shown, edits, "Seleziona") == {"id-api-orders", "id-hidden"}
+    # Le modifiche sono cumulative: riapplicarle non cambia nulla
+    assert apply_row_edits(set(selected), shown, edits, "Seleziona") == selected
+
+
+def test_groups_are_saved_per_project(tmp_path):
+    path = tmp_path / "data" / "repo_groups.json"
+    store = RepoGroupStore(path)
+    store.save("server/org/p1", "backend", ["b", "a", "a"])
+    store.save("server/org/p1", "portale", ["c"])
+    store.save("server/org/p2", "backend", ["z"])
+    store.delete("server/org/p1", "portale")
+
+    reloaded = RepoGroupStore(path)
+    assert reloaded.groups("server/org/p1") == {"backend": ["a", "b"]}
+    assert reloaded.groups("server/org/p2") == {"backend": ["z"]}
+    assert reloaded.groups("altro") == {}
+
+
+def test_groups_returned_are_copies():
+    store = RepoGroupStore()
+    store.save("p", "g", ["a"])
+    store.groups("p")["g"].append("b")
+    assert store.groups("p") == {"g": ["a"]}
+
+
+def test_invalid_groups_file_is_ignored(tmp_path):
+    path = tmp_path / "repo_groups.json"
+    path.write_text(json.dumps({"p": {"ok": ["a"], "bad": "x"}, "q": []}), encoding="utf-8")
+    assert RepoGroupStore(path).groups("p") == {"ok": ["a"]}
+    path.write_text("{non json", encoding="utf-8")
+    assert RepoGroupStore(path).groups("p") == {}
@@ -0,0 +1,76 @@
+import json
+
+from request_metrics import RequestMetrics
+
+
+def _sample() -> RequestMetrics:
+    metrics = RequestMetrics()
+    metrics.record("refs", "7.1", 200, 0.008, response_bytes=1000)
+    metrics.record("refs", "7.1", 200, 0.040, response_bytes=3000)
+    metrics.record("refs", "7.1", 429, 0.300)
+    metrics.retry("refs", "7.1")
+    metrics.record("diffs", "7.1", 404, 0.020, response_bytes=50)
+    metrics.record("diffs", "7.1", 503, 0.060)
+    metrics.record("diffs", "5.0", 200, 0.090, response_bytes=500)
+    metrics.record("diffs", "7.1", None, 12.0)
+    metrics.wasted_fallback("diffs", "7.1")
+    return metrics
+
+
+def test_counts_by_outcome():
+    total = _sample().report()["total"]
+    assert total["requests"] == 7
+    assert total["ok"] == 3
+    # 429 e 503 sono throttling e restano anche negli errori della loro classe
+    assert total["throttled"] == 2
+    assert total["errors_4xx"] == 2
+    assert total["errors_5xx"] == 1
+    assert total["network_errors"] == 1
+    assert total["retries"] == 1
+    assert total["wasted_fallbacks"] == 1
+    assert total["bytes"] == 4550
+
+
+def test_latency_summary_and_histogram():
+    refs = _sample().report()["by_family"]["refs"]["latency_ms"]
+    assert refs["total"] == 348.0
+    assert refs["mean"] == 116.0
+    assert refs["max"] == 300.0
+    assert refs["histogram"] == {"<=10ms": 1, "<=50ms": 1, "<=500ms": 1}
+    assert refs["p50"] == 50.0
+    assert refs["p95"] == 500.0
+
+
+def test_slowest_bucket_has_no_percentile_bound():
+    diffs = _sample().report()["by_family"]["diffs"]["latency_ms"]
+    assert diffs["histogram"][">10000ms"] == 1
+    assert diffs["max"] == 12000.0
+    assert diffs["p95"] is None
+
+
+def test_breakdown_by_family_and_api_version():
+    report = _sample().report()
+    assert sorted(report["by_family"]) == ["diffs", "refs"]
+    assert report["by_family"]["diffs"]["requests"] == 4
+    endpoints = {(e["family"], e["api_version"]): e for e in report["by_endpoint"]}
+    assert sorted(endpoints) == [("diffs", "5.0"), ("diffs", "7.1"), ("refs", "7.1")]
+    assert endpoints[("diffs", "5.0")]["ok"] == 1
+    assert endpoints[("diffs", "7.1")]["wasted_fallbacks"] == 1
+    # Il report va nella Diagnostica e nel file JSON del benchmark
+    json.dumps(report)
+
+
+def test_reset_starts_a_new_report():
+    metrics = _sample()
+    metrics.reset()
+    report = metrics.report()
+    assert report["total"]["requests"] == 0
+    assert report["total"]["latency_ms"]["mean"] is None
+    assert report["by_endpoint"] == []
+
+
+def test_empty_family_and_version_are_grouped():
+    metrics = RequestMetrics()
+    metrics.record("", None, 200, 0.001)
+    assert metrics.report()["by_endpoint"][0]["family"] == "other"
+    assert metrics.report()["by_endpoint"][0]["api_version"] == "-"
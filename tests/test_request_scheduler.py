@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import request_scheduler
+from request_scheduler import (
+    INCREASE_EVERY,
+    MAX_SERVER_DELAY_SEC,
+    AsyncRequestScheduler,
+    RequestScheduler,
+    retry_delay_from_headers,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Orologio finto per le pause: monotonic e time avanzano solo con clock.now += ..."""
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        request_scheduler, "time", SimpleNamespace(monotonic=lambda: fake.now, time=lambda: fake.now)
+    )
+    return fake
+
+
+# ----- retry_delay_from_headers -----
+
+def test_retry_after_seconds():
+    assert retry_delay_from_headers({"Retry-After": "7"}) == 7.0
+
+
+def test_retry_after_is_clamped():
+    assert retry_delay_from_headers({"Retry-After": "100000"}) == MAX_SERVER_DELAY_SEC
+    assert retry_delay_from_headers({"Retry-After": "-3"}) == 0.0
+
+
+def test_rate_limit_reset_only_when_quota_exhausted(clock):
+    reset = str(clock.now + 12)
+    assert retry_delay_from_headers({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}) == 12.0
+    assert retry_delay_from_headers({"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": reset}) is None
+
+
+def test_retry_after_wins_over_rate_limit_reset(clock):
+    headers = {"Retry-After": "3", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(clock.now + 60)}
+    assert retry_delay_from_headers(headers) == 3.0
+
+
+@pytest.mark.parametrize("headers", [{}, {"Retry-After": "domani"}, {"X-RateLimit-Remaining": "0"}])
+def test_no_server_hint(headers):
+    assert retry_delay_from_headers(headers) is None
+
+
+# ----- AIMD -----
+
+def test_throttling_halves_the_limit():
+    scheduler = RequestScheduler(8)
+    scheduler.acquire()
+    scheduler.release(throttled=True)
+    assert scheduler.limit == 4
+    scheduler.acquire()
+    scheduler.release(throttled=True)
+    assert scheduler.limit == 2
+    assert scheduler.stats()["throttle_events"] == 2
+
+
+def test_limit_never_below_one():
+    scheduler = RequestScheduler(2)
+    for _ in range(5):
+        scheduler.acquire()
+        scheduler.release(throttled=True)
+    assert scheduler.limit == 1
+
+
+def test_successes_increase_the_limit_up_to_max():
+    scheduler = RequestScheduler(4)
+    scheduler.acquire()
+    scheduler.release(throttled=True)
+    assert scheduler.limit == 2
+    for _ in range(INCREASE_EVERY):
+        scheduler.acquire()
+        scheduler.release(headers={})
+    assert scheduler.limit == 3
+    for _ in range(10 * INCREASE_EVERY):
+        scheduler.acquire()
+        scheduler.release(headers={})
+    assert scheduler.limit == 4
+
+
+def test_low_remaining_quota_decreases_by_one():
+    scheduler = RequestScheduler(8)
+    scheduler.acquire()
+    scheduler.release(headers={"X-RateLimit-Remaining": "1"})
+    assert scheduler.limit == 7
+
+
+def test_set_max_keeps_learned_limit_after_throttling():
+    scheduler = RequestScheduler(8)
+    scheduler.acquire()
+    scheduler.release(throttled=True)
+    scheduler.set_max_in_flight(16)
+    assert scheduler.limit == 4
+    scheduler.set_max_in_flight(2)
+    assert scheduler.limit == 2
+
+
+def test_acquire_waits_for_a_free_slot():
+    scheduler = RequestScheduler(1)
+    scheduler.acquire()
+    acquired = threading.Event()
+
+    def _worker():
+        scheduler.acquire()
+        acquired.set()
+        scheduler.release()
+
+    thread = threading.Thread(target=_worker)
+    thread.start()
+    assert not acquired.wait(0.1)
+    scheduler.release()
+    assert acquired.wait(2)
+    thread.join(2)
+
+
+def test_retry_after_pauses_new_requests(clock):
+    scheduler = RequestScheduler(4)
+    scheduler.acquire()
+    scheduler.release(throttled=True, headers={"Retry-After": "5"})
+    assert scheduler.stats()["paused_for_sec"] == 5.0
+    clock.now += 5.5
+    assert scheduler.stats()["paused_for_sec"] == 0.0
+    scheduler.acquire()
+    scheduler.release()
+
+
+# ----- AsyncRequestScheduler -----
+
+def test_async_scheduler_respects_the_limit():
+    peak = 0
+
+    async def _main():
+        scheduler = AsyncRequestScheduler(3)
+        in_flight = 0
+
+        async def _request():
+            nonlocal in_flight, peak
+            await scheduler.acquire()
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.005)
+            in_flight -= 1
+            scheduler.release(headers={})
+
+        await asyncio.gather(*(_request() for _ in range(30)))
+        return scheduler.stats()
+
+    stats = asyncio.run(_main())
+    assert peak == 3
+    assert stats["in_flight"] == 0
+    assert stats["waiting"] == 0
+
+
+def test_async_scheduler_resumes_after_pause():
+    async def _main():
+        scheduler = AsyncRequestScheduler(2)
+        await scheduler.acquire()
+        scheduler.release(throttled=True, headers={"Retry-After": "0.05"})
+        started = time.monotonic()
+        await asyncio.wait_for(scheduler.acquire(), timeout=2)
+        scheduler.release()
+        return time.monotonic() - started
+
+    assert asyncio.run(_main()) >= 0.04
+
+
+def test_async_cancelled_waiter_gives_back_its_slot():
+    async def _main():
+        scheduler = AsyncRequestScheduler(1)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release()
+        await asyncio.wait_for(scheduler.acquire(), timeout=1)
+        return scheduler.stats()
+
+    stats = asyncio.run(_main())
+    assert stats["in_flight"] == 1
+    assert stats["waiting"] == 0
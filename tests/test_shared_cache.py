@@ -0,0 +1,128 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import shared_cache
+from shared_cache import SharedCache, credentials_scope
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(shared_cache, "time", SimpleNamespace(monotonic=lambda: fake.now))
+    return fake
+
+
+def test_single_flight_runs_compute_once():
+    cache = SharedCache()
+    calls = []
+    start = threading.Barrier(8)
+    results = []
+
+    def _compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"value": 42}
+
+    def _caller():
+        start.wait()
+        results.append(cache.get_or_compute("k", _compute))
+
+    threads = [threading.Thread(target=_caller) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 8
+    # Ogni chiamante ha la sua copia
+    assert len({id(r) for r in results}) == 8
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_single_flight_shares_the_error():
+    cache = SharedCache()
+    release = threading.Event()
+    errors = []
+
+    def _compute():
+        release.wait(2)
+        raise ValueError("boom")
+
+    def _caller():
+        try:
+            cache.get_or_compute("k", _compute)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=_caller) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert errors == ["boom"] * 3
+    # L'errore non resta in cache
+    assert cache.get_or_compute("k", lambda: "ok", ttl_sec=10) == "ok"
+
+
+def test_ttl_hit_then_expiry(clock):
+    cache = SharedCache()
+    calls = []
+
+    def _compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_compute("k", _compute, ttl_sec=30) == 1
+    clock.now += 29
+    assert cache.get_or_compute("k", _compute, ttl_sec=30) == 1
+    clock.now += 2
+    assert cache.get_or_compute("k", _compute, ttl_sec=30) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_reader_ttl_caps_entry_age(clock):
+    cache = SharedCache()
+    cache.put("refs", ["old"], ttl_sec=120)
+    clock.now += 31
+    # Scritta con TTL lungo (es. prefetch): chi accetta 30 s la ricalcola
+    assert cache.get_or_compute("refs", lambda: ["new"], ttl_sec=30) == ["new"]
+
+
+def test_zero_ttl_is_only_single_flight():
+    cache = SharedCache()
+    cache.get_or_compute("k", lambda: 1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_not_cacheable_value_is_not_stored():
+    cache = SharedCache()
+    cache.get_or_compute("k", lambda: [], ttl_sec=30, cacheable=bool)
+    assert cache.get("k") is None
+
+
+def test_callers_cannot_modify_the_cached_value():
+    cache = SharedCache()
+    first = cache.get_or_compute("k", lambda: {"items": [1]}, ttl_sec=30)
+    first["items"].append(2)
+    second = cache.get_or_compute("k", lambda: None, ttl_sec=30)
+    second["cached"] = True
+    assert cache.get("k") == {"items": [1]}
+
+
+def test_max_entries_drops_the_oldest():
+    cache = SharedCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, ttl_sec=30)
+    assert cache.get("a") is None
+    assert cache.get("b") == "b" and cache.get("c") == "c"
+
+
+def test_credentials_scope_hides_the_pat():
+    scope = credentials_scope("server", "project", "user", "secret-pat")
+    assert "secret-pat" not in scope
+    assert scope != credentials_scope("server", "project", "user", "other-pat")
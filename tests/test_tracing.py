@@ -0,0 +1,99 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import tracing
+from azure_devops_client import AzureDevOpsClient
+from diff_service import iter_compare_repos
+from ref_resolver import REF_TYPE_BRANCH, RefSnapshot
+from tracing import Tracer, span
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(tracing, "time", SimpleNamespace(perf_counter=lambda: fake.now))
+    return fake
+
+
+def test_self_time_excludes_children(clock):
+    tracer = Tracer()
+    with tracer.span("repo", repo="a"):
+        clock.now += 0.010
+        with tracer.span("diff"):
+            clock.now += 0.030
+        clock.now += 0.005
+    rows = {r["name"]: r for r in tracer.summary()}
+    assert rows["repo"]["total_ms"] == 45.0
+    assert rows["repo"]["self_ms"] == 15.0
+    assert rows["diff"]["self_ms"] == 30.0
+    # I più costosi (tempo esclusivo) prima
+    assert [r["name"] for r in tracer.summary()] == ["diff", "repo"]
+
+
+def test_chrome_trace_events(clock):
+    tracer = Tracer()
+    clock.now = 1.0
+    with tracer.span("repo", repo="a") as args:
+        clock.now += 0.002
+        args["status"] = "aligned"
+        args["refs"] = ["x"]
+    trace = tracer.to_chrome_trace()
+    meta = [e for e in trace["traceEvents"] if e["ph"] == "M"]
+    (event,) = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert meta[0]["args"]["name"] == threading.current_thread().name
+    assert event["dur"] == 2000.0
+    # Gli argomenti non scalari diventano stringhe (il documento resta JSON)
+    assert event["args"] == {"repo": "a", "status": "aligned", "refs": "['x']"}
+
+
+def test_error_is_recorded_and_raised(clock):
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("repo"):
+            raise ValueError("boom")
+    assert tracer.slowest("repo") == [{"duration_ms": 0.0, "error": "ValueError"}]
+
+
+def test_hierarchy_is_per_thread(clock):
+    tracer = Tracer()
+
+    def _worker():
+        with tracer.span("worker"):
+            clock.now += 0.001
+
+    with tracer.span("main"):
+        thread = threading.Thread(target=_worker)
+        thread.start()
+        thread.join()
+    rows = {r["name"]: r for r in tracer.summary()}
+    # Lo span dell'altro thread non è figlio di "main"
+    assert rows["main"]["self_ms"] == rows["main"]["total_ms"]
+
+
+def test_slowest_returns_the_longest_spans(clock):
+    tracer = Tracer()
+    for name, duration in (("a", 0.003), ("b", 0.009), ("c", 0.001)):
+        with tracer.span("repo", repo=name):
+            clock.now += duration
+    assert [s["repo"] for s in tracer.slowest("repo", limit=2)] == ["b", "a"]
+
+
+def test_null_span_without_tracer():
+    with span(None, "repo") as args:
+        args["ignored"] = True
+    with span(None, "repo") as args:
+        assert args == {}
+
+
+def test_compare_records_phases_and_http_spans(mock_server):
+    client = AzureDevOpsClient("org", "bench", "pat", base_url=mock_server(repos=2), shared=None)
+    client.tracer = Tracer()
+    repos = client.list_repositories()
+    list(iter_compare_repos(
+        client, repos, REF_TYPE_BRANCH, "develop", REF_TYPE_BRANCH, "main", snapshot=RefSnapshot(client)
+    ))
+    names = {r["name"] for r in client.tracer.summary()}
+    assert {"repo", "refs.heads", "http refs", "http diffs"} <= names
+    assert {s["repo"] for s in client.tracer.slowest("repo")} == {"repo-0000", "repo-0001"}